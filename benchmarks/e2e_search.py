@@ -0,0 +1,295 @@
+"""
+End-to-end latency benchmark of the search endpoints.
+
+Starts the FastAPI app in-process on a synthetic SQLite catalog (or the database given with
+--database-url), with a local stand-in for the OpenAI API, and drives /semantic-search,
+/semantic-search-separate, /semantic-search-descritption and /ragchat (and the streaming variants
+of the last two) at a fixed concurrency. Reports throughput, latency percentiles, the time to the
+first event of streamed responses and the per-stage timings recorded by the routes.
+
+    python -m benchmarks.e2e_search --products 20000 --requests 500 --concurrency 16 \
+        --llm-latency-ms 300 --output bench_e2e.json
+
+The client runs in the same process as the server, so throughput numbers are a lower bound.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+from benchmarks.stubs import start_llm_stub, start_ollama_stub, HashingEmbedder
+
+ENDPOINTS = ["/semantic-search", "/semantic-search-separate", "/semantic-search-descritption", "/ragchat",
+             "/semantic-search-descritption/stream", "/ragchat/stream"]
+
+PRODUCT_QUERIES = ["remen za kombajn", "filter ulja za traktor", "lezaj SKF", "klinasti remen DUNLOP",
+                   "hidraulicna pumpa za prikolicu", "nož kosilice", "semering za freza", "akumulator BOSCH"]
+GENERAL_QUERIES = ["kako funkcionise dostava", "nacini placanja", "reklamacija proizvoda",
+                   "povrat robe i garancija", "radno vreme prodavnice"]
+
+
+def configure_environment(args, workdir: str, llm_url: str, ollama_url: str = None):
+    """
+    Settings read at import time by database.py, utils/tokens.py, the OpenAI client and utils/llm_backends.py.
+    """
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["OPENAI_BASE_URL"] = llm_url
+    os.environ["OPEN_AI_KEY"] = "benchmark"
+    os.environ["TOKEN"] = "benchmark-token"
+    os.environ["KEY"] = "benchmark-key"
+    for task in args.ollama_tasks or []:
+        os.environ[f"LLM_BACKEND_{task.upper()}"] = "ollama"
+    if ollama_url:
+        os.environ["OLLAMA_HOST"] = ollama_url
+
+
+def prepare_catalog(args):
+    import models
+    from database import engine, SessionLocal
+    from benchmarks.synthetic_catalog import populate_catalog
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(models.Products).count() == 0:
+            populate_catalog(db, args.products, args.information, seed=args.seed)
+        else:
+            print("Database already holds a catalog, using it as is.")
+        if args.summary == "stored":
+            from utils.information_summaries import precompute_summaries
+            asyncio.run(precompute_summaries(db))
+    finally:
+        db.close()
+
+
+def start_server(port: int):
+    import uvicorn
+    import main
+
+    # routes/json_importer.py turns on DEBUG logging for every library
+    logging.getLogger().setLevel(logging.WARNING)
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise SystemExit("Benchmark server failed to start.")
+        time.sleep(0.05)
+    return server, thread
+
+
+def endpoint_queries(endpoint: str):
+    endpoint = endpoint.removesuffix("/stream")
+    if endpoint == "/semantic-search-descritption":
+        return GENERAL_QUERIES
+    if endpoint == "/ragchat":
+        return PRODUCT_QUERIES + GENERAL_QUERIES
+    return PRODUCT_QUERIES
+
+
+async def drive_endpoint(base_url: str, endpoint: str, requests: int, concurrency: int, seed: int, mode: str = None,
+                         summary: str = None):
+    """
+    Send requests to the endpoint from concurrency workers.
+    Returns (latencies in ms, times to the first streamed event in ms, errors, seconds).
+    """
+    import httpx
+
+    rng = random.Random(seed)
+    queries = endpoint_queries(endpoint)
+    payloads = [{"query": rng.choice(queries), "top_k": 5} for _ in range(requests)]
+    if mode:
+        for payload in payloads:
+            payload["mode"] = mode
+    if summary:
+        for payload in payloads:
+            payload["summary"] = summary
+    headers = {"X-Token": os.environ["TOKEN"], "X-Key": os.environ["KEY"]}
+    latencies = []
+    first_events = []
+    errors = 0
+    position = 0
+
+    async def worker(client, number: int):
+        nonlocal errors, position
+        while position < len(payloads):
+            # Each worker is one user holding a conversation with /ragchat
+            payload = {**payloads[position], "session_id": f"bench-{seed}-{number}"}
+            position += 1
+            start = time.perf_counter()
+            try:
+                if endpoint.endswith("/stream"):
+                    async with client.stream("POST", endpoint, json=payload, headers=headers) as response:
+                        failed = response.status_code != 200
+                        first_event = None
+                        async for line in response.aiter_lines():
+                            if line.startswith("event:"):
+                                first_event = first_event or (time.perf_counter() - start) * 1000
+                                failed = failed or line == "event: error"
+                    if first_event is not None:
+                        first_events.append(first_event)
+                else:
+                    response = await client.post(endpoint, json=payload, headers=headers)
+                    failed = response.status_code != 200
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += failed
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, number) for number in range(concurrency)))
+        seconds = time.perf_counter() - start
+    return latencies, first_events, errors, seconds
+
+
+def percentiles(values):
+    values = np.array(values)
+    return {
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def summarize(endpoint: str, latencies, first_events, errors: int, seconds: float):
+    from utils.metrics import get_metrics
+
+    metrics = get_metrics()
+    stages = {name.removeprefix("stage."): {key: value for key, value in histogram.items() if key != "buckets"}
+              for name, histogram in metrics["histograms"].items()
+              if name.startswith("stage.") and histogram["count"]}
+    prompt_tokens = {name.removeprefix("llm_prompt_tokens."): {key: value for key, value in histogram.items() if key != "buckets"}
+                     for name, histogram in metrics["histograms"].items()
+                     if name.startswith("llm_prompt_tokens.") and histogram["count"]}
+    return {
+        "endpoint": endpoint,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        "latency_ms": percentiles(latencies),
+        "first_event_ms": percentiles(first_events) if first_events else None,
+        "stages_ms": stages,
+        "prompt_tokens": prompt_tokens,
+        "caches": metrics["caches"],
+    }
+
+
+def run_benchmark(args, base_url: str):
+    from utils.metrics import reset_histograms
+
+    results = []
+    for endpoint in args.endpoints or ENDPOINTS:
+        # The routes print every step, keep that out of the benchmark output
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(drive_endpoint(base_url, endpoint, min(args.warmup, args.requests), args.concurrency, args.seed,
+                                       args.mode, args.summary))
+            reset_histograms("stage.")
+            reset_histograms("llm_prompt_tokens.")
+            latencies, first_events, errors, seconds = asyncio.run(
+                drive_endpoint(base_url, endpoint, args.requests, args.concurrency, args.seed, args.mode, args.summary))
+        result = summarize(endpoint, latencies, first_events, errors, seconds)
+        print(f"{endpoint:<32} {result['throughput_rps']:>8.1f} req/s p50={result['latency_ms']['p50']:.1f}ms "
+              f"p95={result['latency_ms']['p95']:.1f}ms p99={result['latency_ms']['p99']:.1f}ms errors={errors}")
+        if result["first_event_ms"]:
+            print(f"    {'first event':<20} p50={result['first_event_ms']['p50']:.1f}ms p95={result['first_event_ms']['p95']:.1f}ms")
+        for stage, timings in result["stages_ms"].items():
+            print(f"    {stage:<20} n={timings['count']:<6} p50={timings['p50']:.1f}ms p95={timings['p95']:.1f}ms")
+        for task, tokens in result["prompt_tokens"].items():
+            print(f"    {'prompt tokens ' + task:<20} n={tokens['count']:<6} p50={tokens['p50']:.0f} p95={tokens['p95']:.0f}")
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark of the search endpoints.")
+    parser.add_argument("--database-url", help="benchmark against this database instead of a fresh SQLite catalog")
+    parser.add_argument("--products", type=int, default=5000, help="synthetic products to generate")
+    parser.add_argument("--information", type=int, default=200, help="synthetic information pages to generate")
+    parser.add_argument("--endpoint", action="append", dest="endpoints", choices=ENDPOINTS,
+                        help="endpoint to benchmark, repeatable (default: all)")
+    parser.add_argument("--mode", choices=["vector", "lexical", "hybrid"],
+                        help="search mode sent with product queries (default: the server's SEARCH_MODE)")
+    parser.add_argument("--summary", choices=["stored", "live"], default="live",
+                        help="summaries of general answers: precomputed before the run, or made per request")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20, help="requests per endpoint before measuring")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="latency of the stub OpenAI API")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="share of stub OpenAI requests failing with a 503")
+    parser.add_argument("--ollama-task", action="append", dest="ollama_tasks",
+                        choices=["classify", "keywords", "summarize", "answer"],
+                        help="run this LLM task on the stub Ollama backend, repeatable")
+    parser.add_argument("--ollama-latency-ms", type=float, default=100, help="latency of the stub Ollama API")
+    parser.add_argument("--real-embedder", action="store_true",
+                        help="use the sentence-transformers model instead of the hashing embedder")
+    parser.add_argument("--encode-ms", type=float, default=0.0, help="simulated encode cost per text of the hashing embedder")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_e2e.json")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    llm_server, llm_url = start_llm_stub(args.llm_latency_ms, error_rate=args.llm_error_rate)
+    ollama_server, ollama_url = start_ollama_stub(args.ollama_latency_ms) if args.ollama_tasks else (None, None)
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    configure_environment(args, workdir, llm_url, ollama_url)
+    # Index files and uploads are created relative to the working directory
+    sys.path.insert(0, os.getcwd())
+    os.chdir(workdir)
+    print(f"Benchmark working directory: {workdir}, stub LLM at {llm_url}")
+
+    if not args.real_embedder:
+        from utils.model_registry import register_embedding_model
+
+        register_embedding_model(HashingEmbedder(encode_ms=args.encode_ms))
+
+    prepare_catalog(args)
+    server, thread = start_server(args.port)
+    try:
+        results = run_benchmark(args, f"http://127.0.0.1:{args.port}")
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        llm_server.shutdown()
+        if ollama_server:
+            ollama_server.shutdown()
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "machine": platform.platform(),
+        "database": "sqlite" if not args.database_url else args.database_url.split(":", 1)[0],
+        "products": args.products,
+        "information": args.information,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "llm_latency_ms": args.llm_latency_ms,
+        "llm_error_rate": args.llm_error_rate,
+        "ollama_tasks": args.ollama_tasks or [],
+        "ollama_latency_ms": args.ollama_latency_ms if args.ollama_tasks else None,
+        "mode": args.mode,
+        "summary": args.summary,
+        "embedder": "sentence-transformers" if args.real_embedder else "hashing",
+        "results": results,
+    }
+    with open(output, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"Report written to {output}.")
+
+
+if __name__ == "__main__":
+    main()
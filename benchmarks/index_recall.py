@@ -0,0 +1,165 @@
+"""
+Recall / latency benchmark of FAISS index configurations.
+
+Builds each candidate index over the embeddings of one of the tables (or a synthetic
+catalog), uses an exact flat index as ground truth and writes a JSON report.
+
+    python -m benchmarks.index_recall --source synthetic --size 200000 \
+        --index flat --index ivf_flat:nprobe=16 --index hnsw:efSearch=64 --index sq8 \
+        --output bench_index.json
+"""
+import argparse
+import json
+import platform
+import time
+from datetime import datetime, timezone
+import faiss
+import numpy as np
+
+from index_factory import parse_index_spec, build_index
+
+DEFAULT_INDEXES = ["flat", "ivf_flat", "ivf_pq", "hnsw", "sq8"]
+
+
+def load_table_vectors(table: str):
+    """
+    Ids and vectors of one of the embeddings tables.
+    """
+    from database import SessionLocal
+    import faiss_index
+    import description_faiss_index
+    import separate_faiss_index
+
+    stores = {
+        "products": faiss_index.store,
+        "description": description_faiss_index.store,
+        "separate": separate_faiss_index.store,
+    }
+    db = SessionLocal()
+    try:
+        ids, _, vectors = stores[table].fetch_vectors(db)
+    finally:
+        db.close()
+    if vectors is None:
+        raise SystemExit(f"No embeddings found for {table}.")
+    return ids, vectors
+
+
+def synthetic_vectors(size: int, dimension: int, clusters: int = 256, seed: int = 0):
+    """
+    Clustered, L2-normalized vectors resembling sentence embeddings of a product catalog.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size)] + 0.6 * rng.standard_normal((size, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.arange(size, dtype=np.int64), vectors
+
+
+def make_queries(vectors, count: int, seed: int = 1):
+    """
+    Queries near stored vectors, like user queries near product texts.
+    """
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), count)] + 0.05 * rng.standard_normal((count, vectors.shape[1])).astype(np.float32)
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def search_latencies(index, queries, k: int):
+    """
+    Search the queries one at a time, as the endpoints do. Returns (ids, latencies in ms).
+    """
+    found = np.empty((len(queries), k), dtype=np.int64)
+    latencies = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies[i] = (time.perf_counter() - start) * 1000
+        found[i] = ids[0]
+    return found, latencies
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found, truth))
+    return hits / truth.size
+
+
+def run_benchmark(ids, vectors, specs, queries, k: int):
+    print(f"Computing ground truth for {len(queries)} queries over {len(vectors)} vectors...")
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, positions = exact.search(queries, k)
+    truth = ids[positions]
+
+    results = []
+    for spec in specs:
+        kind, params = parse_index_spec(spec)
+        start = time.perf_counter()
+        index, info = build_index(vectors, ids, kind, params)
+        build_seconds = time.perf_counter() - start
+
+        search_latencies(index, queries[:10], k)  # warm up
+        found, latencies = search_latencies(index, queries, k)
+        result = {
+            "spec": spec,
+            "index_type": info["index_type"],
+            "params": info["params"],
+            "build_seconds": round(build_seconds, 3),
+            "memory_bytes": info["memory_bytes"],
+            f"recall_at_{k}": round(recall_at_k(found, truth), 4),
+            "latency_ms": {
+                "mean": round(float(latencies.mean()), 4),
+                "p50": round(float(np.percentile(latencies, 50)), 4),
+                "p95": round(float(np.percentile(latencies, 95)), 4),
+                "p99": round(float(np.percentile(latencies, 99)), 4),
+            },
+        }
+        print(f"{spec:<32} recall@{k}={result[f'recall_at_{k}']:.4f} "
+              f"p50={result['latency_ms']['p50']:.3f}ms p99={result['latency_ms']['p99']:.3f}ms "
+              f"build={build_seconds:.1f}s memory={info['memory_bytes'] / (1024 * 1024):.1f}MB")
+        results.append(result)
+        del index
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall / latency benchmark of FAISS index configurations.")
+    parser.add_argument("--source", choices=["db", "synthetic"], default="synthetic")
+    parser.add_argument("--table", choices=["products", "description", "separate"], default="separate",
+                        help="embeddings table used with --source db")
+    parser.add_argument("--size", type=int, default=100000, help="vectors in the synthetic catalog")
+    parser.add_argument("--dim", type=int, default=768, help="dimension of the synthetic vectors")
+    parser.add_argument("--index", action="append", dest="indexes",
+                        help="index spec to benchmark, repeatable (default: all types with default params)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=0, help="FAISS threads (default: FAISS default)")
+    parser.add_argument("--output", default="bench_index.json")
+    args = parser.parse_args()
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    if args.source == "db":
+        ids, vectors = load_table_vectors(args.table)
+    else:
+        ids, vectors = synthetic_vectors(args.size, args.dim)
+    queries = make_queries(vectors, args.queries)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "faiss_version": faiss.__version__,
+        "machine": platform.platform(),
+        "source": args.source if args.source == "synthetic" else f"db:{args.table}",
+        "vectors": int(len(vectors)),
+        "dimension": int(vectors.shape[1]),
+        "queries": args.queries,
+        "k": args.k,
+        "results": run_benchmark(ids, vectors, args.indexes or DEFAULT_INDEXES, queries, args.k),
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Report written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Local stand-ins for the external services used by the search endpoints: an OpenAI-compatible
+chat completions server with a configurable latency, streamed or not, the same for Ollama's chat API
+and a deterministic hashing embedder.
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+STUB_KEYWORDS = "remen, kombajn, filter"
+# Share of the latency before the first piece of a streamed answer
+FIRST_TOKEN_SHARE = 0.25
+GENERAL_WORDS = ("dostava", "isporuka", "placanja", "placanje", "reklamacija", "povrat", "radno vreme")
+
+
+def stub_answer(prompt: str):
+    """
+    Canned answer for the prompts built in utils/chat_prompt_openai.py.
+    """
+    lowered = prompt.lower()
+    if "return a json object" in lowered:
+        question = prompt.partition("The question:")[2]
+        query_type = "General" if any(word in question.lower() for word in GENERAL_WORDS) else "Product"
+        words = [word for word in re.findall(r"\w+", question) if len(word) > 2]
+        return json.dumps({"type": query_type, "keywords": words[:5], "filters": {}})
+    if "categorizes a sentence" in lowered:
+        return "General" if any(word in lowered for word in GENERAL_WORDS) else "Product"
+    if "keywords" in lowered:
+        question = prompt.partition("question:")[2].partition(". Just return")[0]
+        words = [word for word in re.findall(r"\w+", question) if len(word) > 2]
+        return ", ".join(words[:5]) or STUB_KEYWORDS
+    return "Ovo je skraceni odgovor asistenta."
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages", [])
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        answer = stub_answer(prompt)
+        streamed = body.get("stream", False)
+        # A streamed answer starts after a share of the latency and the rest is spread over its pieces
+        time.sleep(self.server.latency * (FIRST_TOKEN_SHARE if streamed else 1))
+        if random.random() < self.server.error_rate:
+            self.send_error(503, "Injected failure")
+            return
+        if streamed:
+            self.stream_answer(body, answer)
+            return
+
+        payload = json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 8, "total_tokens": len(prompt) // 4 + 8},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def stream_answer(self, body, answer: str):
+        """
+        The answer as chat.completion.chunk events, one per word, ending the connection after [DONE].
+        """
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        pieces = re.findall(r"\S+\s*", answer) or [answer]
+        delay = self.server.latency * (1 - FIRST_TOKEN_SHARE) / len(pieces)
+        for position, piece in enumerate(pieces):
+            if position:
+                time.sleep(delay)
+            chunk = json.dumps({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            })
+            self.wfile.write(f"data: {chunk}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_llm_stub(latency_ms: float = 300, port: int = 0, error_rate: float = 0.0):
+    """
+    Serve /v1/chat/completions on localhost in a background thread, failing the given share
+    of requests with a 503. Returns (server, base url).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), ChatCompletionsHandler)
+    server.daemon_threads = True
+    server.latency = latency_ms / 1000
+    server.error_rate = error_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+class OllamaChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages", [])
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        # Like deepseek-r1, the stub reasons before answering
+        pieces = ["<think>", "Razmisljam.", "</think>"] + (re.findall(r"\S+\s*", stub_answer(prompt)) or [""])
+        streamed = body.get("stream", True)
+        time.sleep(self.server.latency * (FIRST_TOKEN_SHARE if streamed else 1))
+
+        def message(content: str, done: bool):
+            return json.dumps({
+                "model": body.get("model", "stub"),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": content},
+                "done": done,
+            }) + "\n"
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        if not streamed:
+            payload = message("".join(pieces), True).encode("utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        self.close_connection = True
+        self.send_header("Connection", "close")
+        self.end_headers()
+        delay = self.server.latency * (1 - FIRST_TOKEN_SHARE) / len(pieces)
+        for position, piece in enumerate(pieces):
+            if position:
+                time.sleep(delay)
+            self.wfile.write(message(piece, False).encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(message("", True).encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_ollama_stub(latency_ms: float = 100, port: int = 0):
+    """
+    Serve Ollama's /api/chat on localhost in a background thread. Returns (server, host url).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), OllamaChatHandler)
+    server.daemon_threads = True
+    server.latency = latency_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class HashingEmbedder:
+    """
+    Bag-of-words hashing embedder with the encode() signature of SentenceTransformer.
+    Deterministic and fast, so benchmarks measure the service rather than the model.
+    """
+
+    def __init__(self, dimension: int = 768, encode_ms: float = 0.0):
+        self.dimension = dimension
+        self.encode_ms = encode_ms  # simulated cost per text
+        self.max_seq_length = 384
+
+    def embed(self, text: str):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in re.findall(r"\w+", str(text).lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, batch_size: int = 32, convert_to_numpy: bool = True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if self.encode_ms:
+            time.sleep(self.encode_ms * len(texts) / 1000)
+        vectors = np.stack([self.embed(text) for text in texts]) if texts else np.empty((0, self.dimension), dtype=np.float32)
+        return vectors[0] if single else vectors
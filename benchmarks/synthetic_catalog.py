@@ -0,0 +1,72 @@
+"""
+Synthetic catalog of spare parts and information pages for benchmarks.
+"""
+import random
+from sqlalchemy.orm import Session
+
+from models import Products, Information, EmbeddingsTable, InformationEmbeddings, SeparateEmbeddingTables
+from utils.embedding_processor import main_embedding_process, separate_emb_process
+from utils.passages import update_passages
+
+PARTS = ["remen", "filter ulja", "filter vazduha", "lezaj", "zupcanik", "nož kosilice", "klinasti remen",
+         "hidraulicna pumpa", "semering", "lanac", "kardansko vratilo", "sijalica", "akumulator", "disk"]
+MACHINES = ["kombajn", "traktor", "kosilica", "prikolica", "sejalica", "prskalica", "balirka", "freza"]
+BRANDS = ["DUNLOP", "SKF", "FAG", "CLAAS", "JOHN DEERE", "IMT", "BOSCH", "MANN"]
+CATEGORIES = ["Remenje", "Filteri", "Lezajevi", "Hidraulika", "Elektrika", "Rezni delovi"]
+TOPICS = ["dostava", "placanje", "reklamacija", "povrat robe", "garancija", "radno vreme", "kontakt"]
+
+
+def synthetic_products(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    products = []
+    for number in range(count):
+        part, machine, brand = rng.choice(PARTS), rng.choice(MACHINES), rng.choice(BRANDS)
+        code = str(1000000 + number)
+        size = f"{rng.choice('ABCDE')}{rng.randint(500, 5000)}"
+        products.append(Products(
+            code=code,
+            name=f"{part} {size} \"{brand}\"",
+            prod_url=f"https://www.example.rs/{part.replace(' ', '-')}-{size.lower()}_{code}/",
+            categories=rng.choice(CATEGORIES),
+            price=f"{rng.uniform(2, 20000):.2f} RSD",
+            label=f"{brand[:3]}{rng.randint(10000, 99999)}",
+            brand=brand,
+            unit="kom",
+            options=f"{part}, {machine}, {brand.lower()}",
+            description=f"{part.upper()} ZA {machine.upper()}",
+            oe_numbers=f"{rng.randint(100000, 999999)}.{rng.randint(0, 9)}",
+            usage=f"{machine} {rng.choice(BRANDS)}",
+        ))
+    return products
+
+
+def synthetic_information(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    pages = []
+    for number in range(count):
+        topic = TOPICS[number % len(TOPICS)]
+        sentences = [f"Informacije o temi {topic} za kupce poljoprivrednih delova."]
+        sentences += [f"{topic.capitalize()} se odnosi na {rng.choice(PARTS)} i {rng.choice(MACHINES)}." for _ in range(rng.randint(5, 30))]
+        pages.append(Information(
+            code=number + 1,
+            link=f"https://www.example.rs/info/{topic.replace(' ', '-')}-{number + 1}/",
+            naslov=f"{topic.capitalize()} {number + 1}",
+            opis=" ".join(sentences),
+        ))
+    return pages
+
+
+def populate_catalog(db: Session, products: int, information: int, seed: int = 0):
+    """
+    Insert the synthetic catalog, embed it into the three embeddings tables and split the
+    information pages into passages.
+    """
+    print(f"Inserting {products} products and {information} information pages...")
+    db.add_all(synthetic_products(products, seed))
+    db.add_all(synthetic_information(information, seed))
+    db.commit()
+
+    main_embedding_process(db, Products, EmbeddingsTable)
+    separate_emb_process(db, Products, SeparateEmbeddingTables)
+    main_embedding_process(db, Information, InformationEmbeddings)
+    update_passages(db, [], [])
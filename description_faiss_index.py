@@ -1,27 +1,19 @@
-import faiss
 from sqlalchemy.orm import Session
 from models import InformationEmbeddings
-from database import SessionLocal
+from faiss_store import FaissStore
 
 DESCRIPTION_INDEX_FILE = "description_index.faiss"
-information_codes = []  # Global variable to store product codes
-description_index = None        # Global FAISS index
+store = FaissStore(DESCRIPTION_INDEX_FILE, InformationEmbeddings, name="description")  # Global FAISS index with its id -> information code mapping
 
 def load_description_faiss_index(db: Session):
     """
     Load the FAISS index and information codes.
     """
-    global description_index, information_codes
     print("Loading FAISS index...")
     try:
-        # Load FAISS index
-        description_index = faiss.read_index(DESCRIPTION_INDEX_FILE)
+        store.load(db)
         print("FAISS description index loaded successfully.")
-
-        # Load product codes
-        information_codes.clear()
-        information_codes.extend([row.code for row in db.query(InformationEmbeddings).all()])
-        print(f"Loaded {len(information_codes)} information codes.")
+        print(f"Loaded {len(store.id_to_code)} information codes.")
 
     except Exception as e:
         print(f"Error loading FAISS index: {e}")
@@ -29,8 +21,9 @@ def load_description_faiss_index(db: Session):
 
 def get_description_faiss_resources():
     """
-    Access the loaded FAISS index and description codes.
+    Access the loaded FAISS index and the id -> information code mapping.
     """
-    if description_index is None or not information_codes:
+    store.refresh_if_stale()  # pick up indexes saved by other workers
+    if store.index is None or not store.id_to_code:
         raise RuntimeError("FAISS index is not loaded. Call load_faiss_index() during startup.")
-    return description_index, information_codes
+    return store.index, store.id_to_code
@@ -1,27 +1,19 @@
-import faiss
 from sqlalchemy.orm import Session
 from models import EmbeddingsTable
-from database import SessionLocal
+from faiss_store import FaissStore
 
 INDEX_FILE = "index.faiss"
-product_codes = []  # Global variable to store product codes
-index = None        # Global FAISS index
+store = FaissStore(INDEX_FILE, EmbeddingsTable, name="products")  # Global FAISS index with its id -> product code mapping
 
 def load_faiss_index(db: Session):
     """
     Load the FAISS index and product codes.
     """
-    global index, product_codes
     print("Loading FAISS index...")
     try:
-        # Load FAISS index
-        index = faiss.read_index(INDEX_FILE)
+        store.load(db)
         print("FAISS index loaded successfully.")
-
-        # Load product codes
-        product_codes.clear()
-        product_codes.extend([row.code for row in db.query(EmbeddingsTable).all()])
-        print(f"Loaded {len(product_codes)} product codes.")
+        print(f"Loaded {len(store.id_to_code)} product codes.")
 
     except Exception as e:
         print(f"Error loading FAISS index: {e}")
@@ -29,8 +21,9 @@ def load_faiss_index(db: Session):
 
 def get_faiss_resources():
     """
-    Access the loaded FAISS index and product codes.
+    Access the loaded FAISS index and the id -> product code mapping.
     """
-    if index is None or not product_codes:
+    store.refresh_if_stale()  # pick up indexes saved by other workers
+    if store.index is None or not store.id_to_code:
         raise RuntimeError("FAISS index is not loaded. Call load_faiss_index() during startup.")
-    return index, product_codes
+    return store.index, store.id_to_code
@@ -0,0 +1,423 @@
+import os
+import json
+import hashlib
+import threading
+import time
+import faiss
+import numpy as np
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from utils.metrics import record_startup_metric, resident_memory_mb
+from index_factory import (
+    index_config, build_index, apply_search_params, supports_remove, mmap_flags, has_ids, index_ids,
+    filtered_search_params,
+)
+
+load_dotenv()
+
+FETCH_BATCH_SIZE = 1000  # codes per IN (...) query when fetching embeddings
+# Memory-map the index files read-only, so workers on one host share them through the page cache
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+
+
+def ids_checksum(ids):
+    """
+    Order-independent checksum of a set of ids.
+    """
+    return hashlib.sha256(np.sort(np.asarray(ids, dtype=np.int64)).tobytes()).hexdigest()
+
+
+def mapping_checksum(ids, codes):
+    """
+    Checksum of the stored id -> code pairs, to detect a corrupted or half-written mapping.
+    """
+    return hashlib.sha256(ids.tobytes() + codes.tobytes()).hexdigest()
+
+
+def code_to_id(code):
+    """
+    Stable 64-bit FAISS id of a code: numeric codes written without leading zeros are used as is,
+    others (including "007", which would otherwise share id 7 with "7") are hashed.
+    """
+    code = str(code)
+    if code.isascii() and code.isdigit() and str(int(code)) == code and int(code) < 2**63:
+        return int(code)
+    digest = hashlib.blake2b(code.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & (2**63 - 1)
+
+
+def check_unique_ids(ids, codes, existing=None):
+    """
+    Raise ValueError when an id occurs twice among the new ids or is already taken in the
+    existing id -> code mapping, since FAISS would silently store both vectors under it.
+    """
+    seen = {}
+    for id_, code in zip(ids.tolist(), codes):
+        other = seen.get(id_, existing.get(id_) if existing else None)
+        if other is not None:
+            raise ValueError(f"Codes {other!r} and {code!r} map to the same FAISS id {id_}.")
+        seen[id_] = code
+
+
+class FaissStore:
+    """
+    A FAISS index with explicit ids derived from the embeddings table, together with
+    the id -> code mapping, so vectors can be added and removed in place.
+    """
+    def __init__(self, index_file: str, table_model, name: str, id_column: str = "code", mmap: bool = FAISS_MMAP,
+                 code_column: str = "code"):
+        self.index_file = index_file
+        self.table_model = table_model
+        self.name = name  # selects the index type from FAISS_<NAME>_INDEX
+        self.id_column = id_column  # "code" for one vector per code, "id" for row ids
+        self.code_column = code_column  # column the vectors are grouped by
+        self.mmap = mmap
+        self.index = None
+        self.id_to_code = {}
+        self.version = 0
+        self.index_info = {"index_type": "flat", "params": {}}
+        self.meta_mtime = None  # mtime of the meta file the loaded version came from
+        self.lock = threading.RLock()
+        self._code_ids = (None, {})  # (mapping it was built from, code -> ids)
+        # Sidecar files holding the id -> code mapping next to the index
+        self.ids_file = f"{index_file}.ids.npy"
+        self.codes_file = f"{index_file}.codes.npy"
+        self.meta_file = f"{index_file}.meta.json"
+
+    def row_id(self, value):
+        if self.id_column == "code":
+            return code_to_id(value)
+        return int(value)
+
+    def fetch_ids(self, db: Session):
+        """
+        {id: code} of every embedding in the table, without loading the vectors.
+        """
+        id_col = getattr(self.table_model, self.id_column)
+        code_col = getattr(self.table_model, self.code_column)
+        return {self.row_id(value): str(code) for value, code in db.query(id_col, code_col)}
+
+    def fetch_vectors(self, db: Session, codes=None):
+        """
+        Ids, codes and vectors of the embeddings in the table, optionally only for the given codes.
+        """
+        id_col = getattr(self.table_model, self.id_column)
+        code_col = getattr(self.table_model, self.code_column)
+        columns = (id_col, code_col, self.table_model.embedding)
+        if codes is None:
+            rows = db.query(*columns).yield_per(FETCH_BATCH_SIZE)
+        else:
+            # Codes are kept as strings, the column may be an integer one
+            codes = [code_col.type.python_type(code) for code in codes]
+            rows = []
+            for start in range(0, len(codes), FETCH_BATCH_SIZE):
+                batch = codes[start:start + FETCH_BATCH_SIZE]
+                rows.extend(db.query(*columns).filter(code_col.in_(batch)).all())
+
+        ids, row_codes, vectors = [], [], []
+        for value, code, embedding in rows:
+            ids.append(self.row_id(value))
+            row_codes.append(str(code))
+            vectors.append(np.frombuffer(embedding, dtype=np.float32))
+        if not vectors:
+            return np.empty(0, dtype=np.int64), [], None
+        return np.array(ids, dtype=np.int64), row_codes, np.vstack(vectors)
+
+    def build(self, db: Session):
+        """
+        Build the index from scratch from the embeddings table and save it.
+        """
+        print(f"Building {self.index_file} from {self.table_model.__tablename__}...")
+        ids, codes, vectors = self.fetch_vectors(db)
+        if vectors is None:
+            print(f"No embeddings found in {self.table_model.__tablename__}.")
+            return
+        print(f"Loaded {len(ids)} embeddings.")
+        check_unique_ids(ids, codes)
+
+        kind, params = index_config(self.name)
+        index, index_info = build_index(vectors, ids, kind, params)
+        with self.lock:
+            self.index = index
+            self.index_info = index_info
+            self.id_to_code = dict(zip(ids.tolist(), codes))
+            self.save()
+
+    def load(self, db: Session):
+        """
+        Load the index and its id -> code mapping from disk. The database is only used when the
+        index is missing, was built with positional ids or its mapping does not match it.
+        """
+        if not os.path.exists(self.index_file):
+            print(f"{self.index_file} not found.")
+            self.build(db)
+            return
+
+        start = time.perf_counter()
+        index = self._read_index()
+        if not has_ids(index):
+            print(f"{self.index_file} has positional ids, rebuilding it with ids from the database.")
+            self.build(db)
+            return
+
+        stored_ids = index_ids(index)
+        mapping = self.read_mapping(stored_ids)
+        with self.lock:
+            self.index = index
+            if mapping is not None:
+                self.id_to_code, meta = mapping
+                self._use_meta(meta)
+                self.meta_mtime = self._meta_mtime()
+            else:
+                print(f"Mapping of {self.index_file} does not match the index, rebuilding it from the database.")
+                db_ids = self.fetch_ids(db)
+                self.id_to_code = {id_: db_ids[id_] for id_ in stored_ids.tolist() if id_ in db_ids}
+                if len(self.id_to_code) != len(stored_ids) or len(db_ids) != len(stored_ids):
+                    print(f"Warning: {self.index_file} and {self.table_model.__tablename__} hold different ids, "
+                          f"run reconcile_faiss_index.py to patch the index.")
+                self.write_mapping()
+
+        record_startup_metric(
+            f"faiss_index:{self.index_file}",
+            load_seconds=round(time.perf_counter() - start, 3),
+            size_mb=round(os.path.getsize(self.index_file) / (1024 * 1024), 2),
+            ntotal=int(index.ntotal),
+            index_type=self.index_info["index_type"],
+            mmap=self.mmap,
+            rss_mb=round(resident_memory_mb(), 1),
+        )
+
+    def _read_index(self):
+        if self.mmap:
+            return faiss.read_index(self.index_file, mmap_flags(self._read_meta().get("index_type", "flat")))
+        return faiss.read_index(self.index_file)
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_file) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _use_meta(self, meta):
+        """
+        Take over the version, index type and saved search parameters of a loaded index.
+        """
+        self.version = meta.get("version", 0)
+        self.index_info = {
+            key: meta[key] for key in ("index_type", "params", "dimension", "memory_bytes") if key in meta
+        }
+        self.index_info.setdefault("index_type", "flat")
+        self.index_info.setdefault("params", {})
+        apply_search_params(self.index, self.index_info["params"])
+
+    def _meta_mtime(self):
+        try:
+            return os.stat(self.meta_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def _make_writable(self):
+        """
+        A memory-mapped index cannot grow or shrink in place, so changes go to a private copy
+        that is saved and mapped again afterwards.
+        """
+        if self.mmap and self.index is not None:
+            self.index = faiss.read_index(self.index_file)
+            apply_search_params(self.index, self.index_info["params"])
+
+    def refresh_if_stale(self):
+        """
+        Reload the index when another worker has saved a newer version of it.
+        """
+        mtime = self._meta_mtime()
+        if mtime is None or mtime == self.meta_mtime:
+            return
+        with self.lock:
+            if mtime == self.meta_mtime:
+                return
+            index = self._read_index()
+            mapping = self.read_mapping(index_ids(index))
+            if mapping is None:
+                return  # the other worker is still writing it, try again on the next request
+            self.index = index
+            self.id_to_code, meta = mapping
+            self._use_meta(meta)
+            self.meta_mtime = mtime
+            print(f"Reloaded {self.index_file} version {self.version}.")
+
+    def read_mapping(self, index_ids):
+        """
+        The stored (id -> code mapping, meta) if it matches the given index ids, otherwise None.
+        """
+        try:
+            with open(self.meta_file) as meta_file:
+                meta = json.load(meta_file)
+            ids = np.load(self.ids_file)
+            codes = np.load(self.codes_file)
+        except (OSError, ValueError) as e:
+            print(f"Could not read mapping of {self.index_file}: {e}")
+            return None
+
+        if not (len(ids) == len(codes) == meta.get("ntotal") == len(index_ids)):
+            return None
+        checksum = ids_checksum(ids)
+        if checksum != meta.get("checksum") or checksum != ids_checksum(index_ids):
+            return None
+        if mapping_checksum(ids, codes) != meta.get("mapping_checksum"):
+            return None
+        return dict(zip(ids.tolist(), codes.tolist())), meta
+
+    def write_mapping(self):
+        """
+        Write the id -> code mapping and its metadata next to the index.
+        """
+        ids = np.fromiter(self.id_to_code.keys(), dtype=np.int64, count=len(self.id_to_code))
+        codes = np.array(list(self.id_to_code.values()), dtype=str)
+        self.version += 1
+        # np.save appends .npy to names without it, so the temporary names keep the suffix
+        for target, array in ((self.ids_file, ids), (self.codes_file, codes)):
+            tmp_file = f"{target[:-len('.npy')]}.tmp.npy"
+            np.save(tmp_file, array)
+            os.replace(tmp_file, target)
+        meta = {
+            "version": self.version,
+            "ntotal": int(len(ids)),
+            "checksum": ids_checksum(ids),
+            "mapping_checksum": mapping_checksum(ids, codes),
+            "table": self.table_model.__tablename__,
+            **self.index_info,
+        }
+        tmp_file = f"{self.meta_file}.tmp"
+        with open(tmp_file, "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_file, self.meta_file)
+        self.meta_mtime = self._meta_mtime()
+
+    def save(self):
+        """
+        Write the index and its mapping next to the old ones and swap them in,
+        so readers never see a partial file.
+        """
+        tmp_file = f"{self.index_file}.tmp"
+        faiss.write_index(self.index, tmp_file)
+        os.replace(tmp_file, self.index_file)
+        self.write_mapping()
+        if self.mmap:
+            self.index = self._read_index()
+            apply_search_params(self.index, self.index_info["params"])
+        print(f"FAISS index saved to {self.index_file}.")
+
+    def index_ids(self):
+        """
+        Ids currently stored in the index.
+        """
+        return index_ids(self.index)
+
+    def ids_of_codes(self, codes):
+        """
+        Ids of the vectors stored for the given codes.
+        """
+        if self.id_column == "code":
+            ids = (code_to_id(code) for code in codes)
+            return [id_ for id_ in ids if id_ in self.id_to_code]
+
+        key = (id(self.id_to_code), self.version, len(self.id_to_code))
+        built_from, code_ids = self._code_ids
+        if built_from != key:
+            code_ids = {}
+            for id_, code in self.id_to_code.items():
+                code_ids.setdefault(code, []).append(id_)
+            self._code_ids = (key, code_ids)
+        return [id_ for code in codes for id_ in code_ids.get(str(code), ())]
+
+    def search(self, query_embedding, k: int, codes=None):
+        """
+        Search the index, restricted to the vectors of the given codes when codes are passed.
+        The restriction is applied inside FAISS, so the result is still a full top-k.
+        """
+        with self.lock:
+            if codes is None:
+                return self.index.search(query_embedding, k)
+            ids = self.ids_of_codes(codes)
+            if not ids:
+                return (np.full((len(query_embedding), k), np.inf, dtype=np.float32),
+                        np.full((len(query_embedding), k), -1, dtype=np.int64))
+            search_params, selector = filtered_search_params(self.index, self.index_info["params"], ids)
+            return self.index.search(query_embedding, k, params=search_params)
+
+    def _remove(self, ids):
+        if ids:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+            for id_ in ids:
+                self.id_to_code.pop(id_, None)
+
+    def _add(self, ids, codes, vectors):
+        if vectors is not None and len(ids):
+            check_unique_ids(ids, codes, self.id_to_code)
+            self.index.add_with_ids(vectors, ids)
+            self.id_to_code.update(zip(ids.tolist(), codes))
+
+    def apply_changes(self, db: Session, changed_codes, deleted_codes):
+        """
+        Replace the vectors of changed codes and drop those of deleted codes, then save the index.
+        """
+        affected = {str(code) for code in changed_codes} | {str(code) for code in deleted_codes}
+        if not affected:
+            return {"added": 0, "removed": 0}
+
+        with self.lock:
+            if self.index is None:
+                self.build(db)
+                return {"added": len(self.id_to_code), "removed": 0}
+
+            stale_ids = [id_ for id_, code in self.id_to_code.items() if code in affected]
+            if stale_ids and not supports_remove(self.index_info["index_type"]):
+                print(f"{self.index_file} is a {self.index_info['index_type']} index, rebuilding it.")
+                self.build(db)
+                return {"added": len(self.id_to_code), "removed": len(stale_ids)}
+            ids, codes, vectors = self.fetch_vectors(db, changed_codes)
+            # Checked before anything is removed, so a collision leaves the index as it was
+            stale = set(stale_ids)
+            check_unique_ids(ids, codes, {id_: code for id_, code in self.id_to_code.items() if id_ not in stale})
+            self._make_writable()
+            self._remove(stale_ids)
+            self._add(ids, codes, vectors)
+            self.save()
+        print(f"{self.index_file}: added {len(ids)} and removed {len(stale_ids)} vectors.")
+        return {"added": len(ids), "removed": len(stale_ids)}
+
+    def reconcile(self, db: Session):
+        """
+        Diff the ids in the database against the ids in the index and patch only the difference.
+        """
+        with self.lock:
+            if self.index is None:
+                self.load(db)
+            if self.index is None:
+                return {"added": 0, "removed": 0}
+
+            db_ids = self.fetch_ids(db)
+            index_ids = set(self.index_ids().tolist())
+            missing = {id_ for id_ in db_ids if id_ not in index_ids}
+            extra = [id_ for id_ in index_ids if id_ not in db_ids]
+
+            if extra and not supports_remove(self.index_info["index_type"]):
+                print(f"{self.index_file} is a {self.index_info['index_type']} index, rebuilding it.")
+                self.build(db)
+                return {"added": len(missing), "removed": len(extra)}
+            if missing or extra:
+                self._make_writable()
+            self._remove(extra)
+            ids, codes, vectors = self.fetch_vectors(db, {db_ids[id_] for id_ in missing})
+            if len(ids):
+                # Codes with several vectors also return the ones already in the index
+                keep = np.array([id_ in missing for id_ in ids.tolist()], dtype=bool)
+                ids, codes, vectors = ids[keep], [code for code, k in zip(codes, keep) if k], vectors[keep]
+            self._add(ids, codes, vectors)
+            self.id_to_code = db_ids
+            if missing or extra:
+                self.save()
+        print(f"{self.index_file}: reconciled, added {len(ids)} and removed {len(extra)} vectors.")
+        return {"added": len(ids), "removed": len(extra)}
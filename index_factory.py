@@ -0,0 +1,180 @@
+import os
+import math
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8")
+
+# Parameters of each index type, overridable from the index spec
+DEFAULT_PARAMS = {
+    "flat": {},
+    "ivf_flat": {"nlist": 0, "nprobe": 16},  # nlist 0 picks ~4 * sqrt(n)
+    "ivf_pq": {"nlist": 0, "nprobe": 16, "m": 64, "nbits": 8},
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64},
+    "sq8": {},
+}
+
+# Vectors sampled for training IVF / PQ / SQ indexes
+TRAIN_SAMPLE_SIZE = int(os.getenv("FAISS_TRAIN_SAMPLE_SIZE", "100000"))
+# k-means wants at least this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def parse_index_spec(spec: str):
+    """
+    Parse an index spec like "ivf_pq:nlist=1024,m=64,nprobe=32" into (index type, params).
+    """
+    kind, _, options = spec.strip().partition(":")
+    kind = kind.strip().lower() or "flat"
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{kind}', expected one of {', '.join(INDEX_TYPES)}.")
+
+    params = dict(DEFAULT_PARAMS[kind])
+    for option in filter(None, (part.strip() for part in options.split(","))):
+        key, _, value = option.partition("=")
+        params[key.strip()] = int(value)
+    return kind, params
+
+
+def index_config(name: str):
+    """
+    Index type and params configured for the named index, e.g. FAISS_PRODUCTS_INDEX=hnsw:M=32.
+    """
+    return parse_index_spec(os.getenv(f"FAISS_{name.upper()}_INDEX", "flat"))
+
+
+def training_sample(vectors, size: int = TRAIN_SAMPLE_SIZE):
+    if len(vectors) <= size:
+        return vectors
+    rows = np.random.default_rng(0).choice(len(vectors), size=size, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def create_index(dimension: int, n: int, kind: str, params: dict):
+    """
+    Untrained index of the requested type for n vectors. Falls back to a flat index when there
+    are too few vectors to train the requested one.
+    """
+    if kind in ("ivf_flat", "ivf_pq"):
+        nlist = params.get("nlist") or max(1, int(4 * math.sqrt(n)))
+        nlist = min(nlist, n // MIN_POINTS_PER_CENTROID)
+        if nlist < 1:
+            print(f"Only {n} vectors, too few to train {kind}, using a flat index.")
+            return faiss.IndexFlatL2(dimension), "flat", {}
+        params = {**params, "nlist": nlist}
+        quantizer = faiss.IndexFlatL2(dimension)
+        if kind == "ivf_flat":
+            return faiss.IndexIVFFlat(quantizer, dimension, nlist), kind, params
+        if dimension % params["m"] != 0:
+            raise ValueError(f"ivf_pq m={params['m']} must divide the dimension {dimension}.")
+        if n < (1 << params["nbits"]) * MIN_POINTS_PER_CENTROID:
+            print(f"Only {n} vectors, too few to train ivf_pq with nbits={params['nbits']}, using ivf_flat.")
+            return faiss.IndexIVFFlat(quantizer, dimension, nlist), "ivf_flat", {"nlist": nlist, "nprobe": params["nprobe"]}
+        return faiss.IndexIVFPQ(quantizer, dimension, nlist, params["m"], params["nbits"]), kind, params
+
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["M"])
+        index.hnsw.efConstruction = params["efConstruction"]
+        return index, kind, params
+
+    if kind == "sq8":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit), kind, params
+
+    return faiss.IndexFlatL2(dimension), "flat", {}
+
+
+def build_index(vectors, ids, kind: str = "flat", params: dict = None):
+    """
+    Build an index with explicit ids over the vectors, training it on a sample when needed.
+    Returns the index and a description of it (type, params, memory footprint).
+    """
+    params = dict(DEFAULT_PARAMS[kind], **(params or {}))
+    inner, kind, params = create_index(vectors.shape[1], len(vectors), kind, params)
+    if not inner.is_trained:
+        sample = training_sample(vectors)
+        print(f"Training {kind} index on {len(sample)} vectors...")
+        inner.train(sample)
+
+    # IVF indexes store ids in their inverted lists, the others need an id map around them
+    index = inner if kind.startswith("ivf") else faiss.IndexIDMap2(inner)
+    index.add_with_ids(vectors, ids)
+    apply_search_params(index, params)
+    info = {
+        "index_type": kind,
+        "params": params,
+        "dimension": int(vectors.shape[1]),
+        "memory_bytes": int(faiss.serialize_index(index).nbytes),
+    }
+    print(f"Built {kind} index {params} with {index.ntotal} vectors, {info['memory_bytes'] / (1024 * 1024):.1f} MB.")
+    return index, info
+
+
+def apply_search_params(index, params: dict):
+    """
+    Set the saved search-time parameters (nprobe, efSearch) on the index.
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if "nprobe" in params and hasattr(inner, "nprobe"):
+        inner.nprobe = params["nprobe"]
+    if "efSearch" in params and hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = params["efSearch"]
+
+
+def filtered_search_params(index, params: dict, ids):
+    """
+    Search parameters restricting the search to the given ids, with the index's saved
+    nprobe / efSearch. Returns (parameters, selector); the selector has to outlive the search.
+    """
+    selector = faiss.IDSelectorBatch(np.asarray(ids, dtype=np.int64))
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexIVF):
+        search_params = faiss.SearchParametersIVF(sel=selector, nprobe=params.get("nprobe", inner.nprobe))
+    elif isinstance(inner, faiss.IndexHNSW):
+        search_params = faiss.SearchParametersHNSW(sel=selector, efSearch=params.get("efSearch", inner.hnsw.efSearch))
+    else:
+        search_params = faiss.SearchParameters(sel=selector)
+    return search_params, selector
+
+
+def has_ids(index):
+    """
+    Whether the index stores explicit ids (as opposed to positions in insertion order).
+    """
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIVF))
+
+
+def index_ids(index):
+    """
+    Ids stored in an index built by build_index.
+    """
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map)
+
+    invlists = faiss.extract_index_ivf(index).invlists
+    ids = []
+    for list_no in range(invlists.nlist):
+        list_size = invlists.list_size(list_no)
+        if list_size:
+            list_ids = invlists.get_ids(list_no)
+            ids.append(faiss.rev_swig_ptr(list_ids, list_size).copy())
+            invlists.release_ids(list_no, list_ids)
+    return np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+
+def supports_remove(kind: str):
+    """
+    HNSW graphs cannot drop vectors, so those indexes are rebuilt instead of patched.
+    """
+    return kind != "hnsw"
+
+
+def mmap_flags(kind: str):
+    """
+    Read flags for memory-mapping an index of the given type.
+    """
+    if kind.startswith("ivf"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
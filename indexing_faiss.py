@@ -1,119 +1,53 @@
-import faiss
-import numpy as np
 from database import SessionLocal
-from models import EmbeddingsTable, InformationEmbeddings, SeparateEmbeddingTables
-INDEX_FILE = "index.faiss"
-DESCRIPTION_INDEX_FILE = "description_index.faiss"
-SEPARATE_INDEX_FILE = "separate_index.faiss"
-
-def create_faiss_index():
+import faiss_index
+import description_faiss_index
+import separate_faiss_index
+import passage_faiss_index
+from models import Information
+from utils.passages import update_passages
+
+
+def build_store(store):
+    """
+    Build a FAISS index with explicit ids from its embeddings table.
+    """
     db = SessionLocal()
     try:
-        print("Fetching embeddings from the database...")
-        rows = db.query(EmbeddingsTable).all()
-
-        embeddings = []
-        product_codes = []
-        for row in rows:
-            embedding = np.frombuffer(row.embedding, dtype=np.float32)
-            embeddings.append(embedding)
-            product_codes.append(row.code)
-
-        if not embeddings:
-            print("No embeddings found in the database.")
-            return
-
-        # Convert embeddings to a numpy array
-        embeddings_array = np.array(embeddings, dtype=np.float32)
-        print(f"Loaded {len(embeddings_array)} embeddings.")
-
-        # Build FAISS index
-        dimension = embeddings_array.shape[1]  # Embedding dimension
-        index = faiss.IndexFlatL2(dimension)  # L2 distance index
-        index.add(embeddings_array)
-
-        # Save the index
-        faiss.write_index(index, INDEX_FILE)
-        print(f"FAISS index saved to {INDEX_FILE}.")
-
+        store.build(db)
     except Exception as e:
         print(f"Error: {e}")
     finally:
         db.close()
 
 
-def create_faiss_index_description():
-    db = SessionLocal()
-    try:
-        print("Fetching embeddings from the database...")
-        rows = db.query(InformationEmbeddings).all()
-
-        embeddings = []
-        information_codes = []
-        for row in rows:
-            embedding = np.frombuffer(row.embedding, dtype=np.float32)
-            embeddings.append(embedding)
-            information_codes.append(row.code)
+def create_faiss_index():
+    build_store(faiss_index.store)
 
-        if not embeddings:
-            print("No embeddings found in the database.")
-            return
 
-        # Convert embeddings to a numpy array
-        embeddings_array = np.array(embeddings, dtype=np.float32)
-        print(f"Loaded {len(embeddings_array)} embeddings.")
+def create_faiss_index_description():
+    build_store(description_faiss_index.store)
 
-        # Build FAISS index
-        dimension = embeddings_array.shape[1]  # Embedding dimension
-        description_index = faiss.IndexFlatL2(dimension)  # L2 distance index
-        description_index.add(embeddings_array)
 
-        # Save the index
-        faiss.write_index(description_index, DESCRIPTION_INDEX_FILE)
-        print(f"FAISS index saved to {DESCRIPTION_INDEX_FILE}.")
+def create_faiss_index_separate():
+    build_store(separate_faiss_index.store)
 
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        db.close()       
 
-def create_faiss_index_separate():
+def create_faiss_index_passages():
+    """
+    Split every information page into passages again, embed them and build the passage index.
+    """
     db = SessionLocal()
     try:
-        print("Fetching embeddings from the database...")
-        rows = db.query(SeparateEmbeddingTables).all()
-
-        embeddings = []
-        information_codes = []
-        for row in rows:
-            embedding = np.frombuffer(row.embedding, dtype=np.float32)
-            embeddings.append(embedding)
-            information_codes.append(row.code)
-
-        if not embeddings:
-            print("No embeddings found in the database.")
-            return
-
-        # Convert embeddings to a numpy array
-        embeddings_array = np.array(embeddings, dtype=np.float32)
-        print(f"Loaded {len(embeddings_array)} embeddings.")
-
-        # Build FAISS index
-        dimension = embeddings_array.shape[1]  # Embedding dimension
-        separate_index = faiss.IndexFlatL2(dimension)  # L2 distance index
-        separate_index.add(embeddings_array)
-
-        # Save the index
-        faiss.write_index(separate_index, SEPARATE_INDEX_FILE)
-        print(f"FAISS index saved to {SEPARATE_INDEX_FILE}.")
-
+        update_passages(db, [code for (code,) in db.query(Information.code)], [])
     except Exception as e:
         print(f"Error: {e}")
     finally:
-        db.close()       
+        db.close()
+    build_store(passage_faiss_index.store)
 
 
 if __name__ == "__main__":
     create_faiss_index()
     create_faiss_index_description()
     create_faiss_index_separate()
+    create_faiss_index_passages()
@@ -2,13 +2,19 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
 import os
+import time
 from database import engine, SessionLocal
 import models
-from routes import semantic_search, rag_query_endpoint, json_importer
+from routes import semantic_search, rag_query_endpoint, json_importer, metrics
 from faiss_index import load_faiss_index
 from description_faiss_index import load_description_faiss_index
 from separate_faiss_index import load_separate_faiss_index
+from passage_faiss_index import load_passage_faiss_index
+from utils.product_lookup import load_product_lookup
+from utils.model_registry import get_embedding_model
+from utils.metrics import record_startup_metric, resident_memory_mb
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
@@ -24,22 +30,34 @@ index = None
 ALLOWED_IPS = ["127.0.0.1", "144.76.67.177", "109.92.201.78"]  # Replace with the IPs you want to allow
 
 
-@asynccontextmanager
-async def lifespan(app):
-    print("Application startup: Loading FAISS index...")
-    db = SessionLocal()  # Create a new session
+def load_with_session(loader):
+    """
+    Run an index loader with its own session, so the loaders can run in parallel threads.
+    """
+    db = SessionLocal()
     try:
-        load_faiss_index(db)  # Load FAISS index and product codes
-        print("FAISS index loaded successfully.")
-        load_description_faiss_index(db)  # Load FAISS Description index and information codes
-        print("Description FAISS index loaded successfully.")
-        load_separate_faiss_index(db)  # Load FAISS Separated index and information codes
-        print("Separated FAISS index loaded successfully.")
-        
-        yield
+        loader(db)
     finally:
         db.close()
-        print("Database connection closed.")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    print("Application startup: Loading embedding model, FAISS indexes and product lookup...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        # Load the shared embedding model once, before the first request, next to the three indexes
+        tasks = [executor.submit(get_embedding_model)]
+        tasks += [
+            executor.submit(load_with_session, loader)
+            for loader in (load_faiss_index, load_description_faiss_index, load_separate_faiss_index,
+                           load_passage_faiss_index, load_product_lookup)
+        ]
+        for task in tasks:
+            task.result()  # re-raises loading errors
+    record_startup_metric("startup", total_seconds=round(time.perf_counter() - start, 3), rss_mb=round(resident_memory_mb(), 1))
+    print("Embedding model, FAISS indexes and product lookup loaded successfully.")
+    yield
 
 app = FastAPI(lifespan=lifespan)
 
@@ -71,6 +89,7 @@ app.add_middleware(
 app.include_router(semantic_search.router)
 app.include_router(rag_query_endpoint.router)
 app.include_router(json_importer.router)
+app.include_router(metrics.router)
 
 
 
@@ -1,5 +1,5 @@
 from database import Base
-from sqlalchemy import Column, Integer, String, LargeBinary
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 
 class Data(Base):
@@ -38,6 +38,18 @@ class Information(Base):
     opis = Column(String, nullable= True)
 
 
+class InformationPassages(Base):
+    __tablename__ = "information_passages"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    information_code = Column(Integer, ForeignKey("information.code", ondelete="CASCADE"), index=True, nullable=False)
+    char_count = Column(Integer, nullable=False)
+    word_count = Column(Integer, nullable=False)
+    sentence_count = Column(Integer, nullable=False)
+    token_count = Column(Integer, nullable=False)
+    text = Column(String, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)
+
+
 class EmbeddingsTable(Base):
     __tablename__ = "embeddings_table"
     code = Column(String, primary_key=True, index=True)  
@@ -56,3 +68,29 @@ class SeparateEmbeddingTables(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     code = Column(String, index=True)
     embedding = Column(LargeBinary)
+
+
+class EmbeddingState(Base):
+    __tablename__ = "embedding_state"
+    target_table = Column(String, primary_key=True)
+    code = Column(String, primary_key=True)
+    column_name = Column(String, primary_key=True)
+    content_hash = Column(String, nullable=False)
+    embedding_id = Column(Integer, nullable=True)  # row id in tables with one vector per column
+
+
+class ConversationMessages(Base):
+    __tablename__ = "conversation_messages"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, index=True, nullable=False)
+    role = Column(String, nullable=False)
+    content = Column(String, nullable=False)
+    created_at = Column(TIMESTAMP, nullable=False)
+
+
+class InformationSummaries(Base):
+    __tablename__ = "information_summaries"
+    code = Column(Integer, primary_key=True)  # information code
+    summary = Column(String, nullable=False)
+    content_hash = Column(String, nullable=False)  # of the page text the summary was made from
+    created_at = Column(TIMESTAMP, nullable=False)
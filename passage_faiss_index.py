@@ -0,0 +1,30 @@
+from sqlalchemy.orm import Session
+from models import InformationPassages
+from faiss_store import FaissStore
+
+PASSAGE_INDEX_FILE = "passage_index.faiss"
+# One vector per passage of an information page: ids are passage row ids, codes the information codes
+store = FaissStore(PASSAGE_INDEX_FILE, InformationPassages, name="passage", id_column="id",
+                   code_column="information_code")
+
+def load_passage_faiss_index(db: Session):
+    """
+    Load the FAISS passage index and the information codes of its passages.
+    """
+    print("Loading FAISS passage index...")
+    try:
+        store.load(db)
+        print("FAISS passage index loaded successfully.")
+        print(f"Loaded {len(store.id_to_code)} passages.")
+
+    except Exception as e:
+        print(f"Error loading FAISS passage index: {e}")
+        raise RuntimeError("Failed to load FAISS passage index.")
+
+def get_passage_faiss_resources():
+    """
+    Access the loaded passage index and the id -> information code mapping, (None, {}) while
+    no passages have been indexed.
+    """
+    store.refresh_if_stale()  # pick up indexes saved by other workers
+    return store.index, store.id_to_code
@@ -0,0 +1,25 @@
+import asyncio
+from database import SessionLocal
+from utils.information_summaries import precompute_summaries
+
+
+def summarize_information(codes=None, force: bool = False):
+    """
+    Store a summary of every information page (or the given codes) whose text changed since
+    it was last summarized.
+    """
+    db = SessionLocal()
+    try:
+        result = asyncio.run(precompute_summaries(db, codes, force=force))
+        print(result)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Precompute the summaries served for general questions.")
+    parser.add_argument("codes", nargs="*", type=int, help="information codes to summarize (default: all)")
+    parser.add_argument("--force", action="store_true", help="summarize pages again even if they did not change")
+    args = parser.parse_args()
+    summarize_information(args.codes or None, force=args.force)
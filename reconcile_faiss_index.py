@@ -0,0 +1,33 @@
+from database import SessionLocal
+import faiss_index
+import description_faiss_index
+import separate_faiss_index
+import passage_faiss_index
+
+STORES = {
+    "products": faiss_index.store,
+    "description": description_faiss_index.store,
+    "separate": separate_faiss_index.store,
+    "passages": passage_faiss_index.store,
+}
+
+
+def reconcile_indexes(names=None):
+    """
+    Diff the ids in the database against each FAISS index and patch only the difference.
+    """
+    db = SessionLocal()
+    try:
+        for name in names or STORES:
+            print(f"Reconciling {name} index...")
+            result = STORES[name].reconcile(db)
+            print(f"{name}: {result}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Patch the FAISS indexes to match the embeddings in the database.")
+    parser.add_argument("indexes", nargs="*", choices=list(STORES), help="indexes to reconcile (default: all)")
+    reconcile_indexes(parser.parse_args().indexes)
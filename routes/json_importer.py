@@ -1,7 +1,6 @@
 import json
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from fastapi import Depends, APIRouter, UploadFile, File, HTTPException
+from fastapi import Depends, APIRouter, UploadFile, File, HTTPException, BackgroundTasks
 from utils.tokens import verify_key, verify_token
 import os
 import shutil
@@ -11,6 +10,13 @@ from models import Data, Products, EmbeddingsTable, Information, InformationEmbe
 from utils.embeding_to_database import save_products_to_database, save_desription_to_database
 from sqlalchemy.orm import Session
 from database import get_db
+import faiss_index
+import description_faiss_index
+import separate_faiss_index
+import passage_faiss_index
+from utils.passages import update_passages
+from utils.information_summaries import precompute_summaries_task
+from utils.product_lookup import product_lookup
 from dotenv import load_dotenv
 import logging, traceback
 
@@ -23,8 +29,13 @@ logger = logging.getLogger(__name__)
 UPLOAD_DIR = "uploads"
 router = APIRouter()
 
-# Initialize embedding model
-embedder = SentenceTransformer("all-mpnet-base-v2")
+
+def embedding_counts(stats):
+    """
+    Counts of the embedding run that are returned to the uploader.
+    """
+    return {key: stats[key] for key in ("embedded", "skipped", "deleted")}
+
 
 
 @router.post("/json-upload-products/", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
@@ -45,12 +56,15 @@ async def upload_json(file: UploadFile = File(...), db: Session = Depends(get_db
             shutil.copyfileobj(file.file, buffer)
         # Import JSON to database
         save_products_to_database(file_path, db)
+        product_lookup.refresh(db)
 
 
-        # make embeddings
-        main_embedding_process(db, Products, EmbeddingsTable)
+        # make embeddings, only for new or changed products
+        stats = main_embedding_process(db, Products, EmbeddingsTable)
+        faiss_index.store.apply_changes(db, stats["changed_codes"], stats["deleted_codes"])
         #separate emb process
-        #separate_emb_process(db, Products, SeparateEmbeddingTables)
+        separate_stats = separate_emb_process(db, Products, SeparateEmbeddingTables)
+        separate_faiss_index.store.apply_changes(db, separate_stats["changed_codes"], separate_stats["deleted_codes"])
 
 
         
@@ -59,11 +73,11 @@ async def upload_json(file: UploadFile = File(...), db: Session = Depends(get_db
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error with decoding and embedding: {str(e)}")
     
-    return {"filename": file.filename, "message": "JSON uploaded, processed, and saved successfully"}
+    return {"filename": file.filename, "message": "JSON uploaded, processed, and saved successfully", **embedding_counts(stats)}
 
 
 @router.post("/json-upload-description/", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
-async def upload_json(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_json(background_tasks: BackgroundTasks, file: UploadFile = File(...), db: Session = Depends(get_db)):
     # Validate file type
     if not file.filename.lower().endswith('.json'):
         raise HTTPException(status_code=400, detail="File must be a JSON")
@@ -85,7 +99,13 @@ async def upload_json(file: UploadFile = File(...), db: Session = Depends(get_db
 
 
          # make embeddings
-        main_embedding_process(db, Information, InformationEmbeddings)
+        stats = main_embedding_process(db, Information, InformationEmbeddings)
+        description_faiss_index.store.apply_changes(db, stats["changed_codes"], stats["deleted_codes"])
+        # passages of the changed pages, which are what the summaries are made from
+        passage_stats = update_passages(db, stats["changed_codes"], stats["deleted_codes"])
+        passage_faiss_index.store.apply_changes(db, passage_stats["changed_codes"], passage_stats["deleted_codes"])
+        # summaries of the changed pages are made after the response is sent
+        background_tasks.add_task(precompute_summaries_task, stats["changed_codes"] | stats["deleted_codes"])
 
         
     except ValueError as e:
@@ -93,4 +113,4 @@ async def upload_json(file: UploadFile = File(...), db: Session = Depends(get_db
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error with decoding and embedding: {str(e)}")
     
-    return {"filename": file.filename, "message": "JSON uploaded, processed, and saved successfully"}
\ No newline at end of file
+    return {"filename": file.filename, "message": "JSON uploaded, processed, and saved successfully", **embedding_counts(stats)}
\ No newline at end of file
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Depends
+from utils.tokens import verify_key, verify_token
+from utils.metrics import get_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
+async def metrics():
+    """
+    Endpoint to retrieve the collected runtime and startup metrics.
+    """
+    return get_metrics()
@@ -1,27 +1,39 @@
-from sentence_transformers import SentenceTransformer
-from fastapi import Depends, APIRouter, HTTPException
+from fastapi import Depends, APIRouter, HTTPException, Query
 from utils.tokens import verify_key, verify_token
 from sqlalchemy.orm import Session
 from database import get_db
 from dotenv import load_dotenv
-from utils.chat_prompt_openai import get_keywords_with_openai, get_type_of_query, summerize_answer, chat_with_context
-from routes.semantic_search import semantic_search, semantic_search_description, semantic_search_separate
+from utils.chat_prompt_openai import get_keywords_with_openai, get_type_of_query, summerize_answer, chat_with_context, understand_query
+from utils.chat_prompt_openai import stream_chat_with_context, stream_summerize_answer
+from routes.semantic_search import semantic_search, semantic_search_description, semantic_search_separate, get_search_mode, find_information
+from routes.semantic_search import get_summary_mode, find_stored_summary, get_filter_codes
+from routes.semantic_search import NO_INFORMATION_ANSWER, FALLBACK_ANSWERS
 import faiss
 from models import EmbeddingsTable, Products, Information
-from typing import List
+from utils.metrics import stage_timer
+from utils.product_lookup import product_lookup
+from utils.answer_cache import answer_cache
+from utils.embedding_batcher import embed_query
+from utils.streaming import sse_event, sse_response, stream_text, text_pieces
+from utils.conversation_store import conversation_store, message_content, new_session_id
+import faiss_index
+import separate_faiss_index
+import description_faiss_index
+import passage_faiss_index
+import os
 load_dotenv()
 
 router = APIRouter()
 
-# Load the embedding model and FAISS index globally
-embedding_model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2", device="cpu")
+# "combined" classifies and extracts keywords and filters in one JSON completion,
+# "legacy" uses the two separate prompts
+QUERY_UNDERSTANDING = os.getenv("QUERY_UNDERSTANDING", "combined")
 
 # FAISS index setup
 INDEX_FILE = "index.faiss"
 product_codes = []  # Global variable to hold product codes in the same order as FAISS index
 index = None
 
-global_query_thread: List[str] =[]
 
 
 ########### LOAD INDEX FOR SEMANTIC SEARCH ############
@@ -51,6 +63,43 @@ def format_product_results(products):
         for product in products
     ]
 
+def catalog_version():
+    """
+    Versions of the catalog and of every index an answer can come from. A product upload
+    changes the lookup before the product indexes, so all of them are part of it.
+    """
+    stores = (faiss_index.store, separate_faiss_index.store, description_faiss_index.store, passage_faiss_index.store)
+    for store in stores:
+        store.refresh_if_stale()
+    return (product_lookup.version_mtime,) + tuple(store.version for store in stores)
+
+
+def is_fallback_answer(answer):
+    """
+    An empty answer or one asking for a better question, which similar queries should not be given again.
+    """
+    return not answer or all(not item or item in FALLBACK_ANSWERS for item in answer)
+
+
+def remember_answer(query_embedding, query: str, options, answer, **values):
+    """
+    Keep the answer in the semantic answer cache, unless it is a fallback.
+    """
+    if not is_fallback_answer(answer):
+        answer_cache.store(query_embedding, query, options, answer=answer, **values)
+    return answer
+
+
+async def remembered_reply(pieces, remember):
+    """
+    Pass the streamed pieces through and hand the whole text to remember once it is complete.
+    """
+    text = []
+    async for piece in pieces:
+        text.append(piece)
+        yield piece
+    remember("".join(text))
+
  ########### ENDPOINT OF THE API WITHOUT PRELOADED DATA############
 
 # @router.post("/ragchat", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
@@ -130,78 +179,219 @@ def format_product_results(products):
 
 ########### ENDPOINT OF THE API VERSION WITH PRELOADED DATA ############
 
-@router.post("/ragchat", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
-async def rag_chat(user_query: dict, db: Session = Depends(get_db)):
+async def assistant_reply(session_id: str, stream: bool = False):
+    """
+    The assistant's reply to the session's latest messages, kept in the session. With
+    stream=True an async iterator of its pieces, remembered once complete.
+    """
+    # The reply sees the recent messages of this session only
+    conversation = conversation_store.window(session_id)
+    if stream:
+        return remembered_reply(stream_chat_with_context(conversation),
+                                lambda text: remember_message(session_id, text))
+    with stage_timer("llm_chat"):
+        reply = await chat_with_context(conversation)
+    if reply:
+        remember_message(session_id, reply)
+    return reply
+
+
+def get_session_id(user_query: dict):
+    """
+    Conversation the query belongs to, from {"session_id": ...}; a new one when it is missing.
+    """
+    session_id = user_query.get("session_id")
+    if session_id is not None and (not isinstance(session_id, str) or not session_id.strip()):
+        raise HTTPException(status_code=400, detail="session_id must be a non-empty string.")
+    return session_id or new_session_id()
+
+
+def remember_message(session_id: str, answer):
+    conversation_store.append(session_id, "assistant", message_content(answer))
+
+
+async def answer_rag_query(user_query: dict, db: Session, session_id: str, stream: bool = False):
+    """
+    Answer a /ragchat query within its session. Returns (answer, reply): reply is the assistant's
+    text about the products found, None for other answers. With stream=True it is still to be
+    generated, as an async iterator of pieces, and a general question is then answered by its
+    streamed summary alone, with answer None.
+    """
+    # Malformed settings and filters are the client's fault, so they are rejected with a 400 up front
+    search_mode = get_search_mode(user_query)
+    summary_mode = get_summary_mode(user_query)
+    get_filter_codes(user_query, db)
+    filters = user_query.get("filters")
     user_query = user_query.get("query")
     if not user_query:
         raise HTTPException(status_code=400, detail="Query cannot be empty.")
     
-    global_query_thread.append({"role": "user", "content": user_query})
-
-    query_type = get_type_of_query(user_query)
+    conversation_store.append(session_id, "user", user_query)
+
+    # A query that is just a part number is answered from the OE number index, before any LLM or vector search
+    with stage_timer("oe_lookup"):
+        product_lookup.refresh_if_stale(db)
+        products = product_lookup.find_oe_numbers(user_query)
+    if products:
+        print(f"Match found in OE numbers: {[product.code for product in products]}")
+        returning_answer = format_product_results(products)
+        remember_message(session_id, returning_answer)
+        return returning_answer, None
+
+    # Questions close enough to one answered before reuse that answer, without any LLM call
+    with stage_timer("answer_cache"):
+        answer_cache.check_catalog(catalog_version())
+        query_embedding = await embed_query(user_query)
+        cache_options = {"mode": search_mode, "filters": filters, "summary": summary_mode}
+        cached = answer_cache.lookup(query_embedding, cache_options)
+    if cached is not None:
+        print(f"Answer cache hit ({cached['similarity']:.3f}) from query: {cached['query']}")
+        remember_message(session_id, cached["answer"])
+        # Products found by the search come with the assistant's reply, cached or not
+        reply = await assistant_reply(session_id, stream) if cached.get("with_reply") else None
+        return cached["answer"], reply
+
+    # Type, keywords and filters in one completion; the two legacy prompts are the fallback
+    understanding = None
+    if QUERY_UNDERSTANDING == "combined":
+        with stage_timer("llm_understand"):
+            understanding = await understand_query(user_query)
+
+    if understanding is not None:
+        query_type = understanding["type"]
+        keywords = understanding["keywords"] or user_query.split()
+        # Filters sent with the request win over those read from the question
+        if not filters and understanding["filters"]:
+            if product_lookup.attributes.select(understanding["filters"]):
+                filters = understanding["filters"]
+                print(f"Filters read from the question: {filters}")
+            else:
+                print(f"Ignoring filters read from the question, no product matches them: {understanding['filters']}")
+    else:
+        with stage_timer("llm_classify"):
+            query_type = await get_type_of_query(user_query)
     print(f"Query type detected: {query_type}")
 
    
     
-    # Extract keywords
-    keywords = get_keywords_with_openai(user_query)
+    # Extract keywords; lexical and hybrid search match the query words themselves
+    if search_mode != "vector":
+        keywords = user_query.split()
+    elif understanding is None:
+        with stage_timer("llm_keywords"):
+            keywords = await get_keywords_with_openai(user_query)
     if not isinstance(keywords, list):
         keywords = [kw.strip() for kw in keywords.split(",")]
 
     # Log keywords for debugging
     print(f"Extracted keywords: {keywords}")
 
-    # Pre-fetch data
-    product_codes = {row.code for row in db.query(Products).all()}
-    labels = {row.label for row in db.query(Products).all()}
-      
-    
     try:
-        for keyword in keywords:
-            print(f"Checking keyword: {keyword}")
-
-            if keyword in product_codes:
-                print("Match found in product codes")
-                products = db.query(Products).filter(Products.code == keyword).all()
-                return {"answer": format_product_results(products)}
-            #print("Checking in labels")
-            if keyword in labels:
-                print("Match found in labels")
-                products = db.query(Products).filter(Products.label == keyword).all()
-                return {"answer": format_product_results(products)}
+        # Exact code and label hits come from the in-memory catalog, without database queries
+        with stage_timer("catalog_lookup"):
+            product_lookup.refresh_if_stale(db)
+            for keyword in keywords:
+                print(f"Checking keyword: {keyword}")
+
+                products = product_lookup.find_code(keyword)
+                if products:
+                    print("Match found in product codes")
+                    return remember_answer(query_embedding, user_query, cache_options, format_product_results(products),
+                                           query_type=query_type, keywords=keywords), None
+                #print("Checking in labels")
+                products = product_lookup.find_label(keyword)
+                if products:
+                    print("Match found in labels")
+                    return remember_answer(query_embedding, user_query, cache_options, format_product_results(products),
+                                           query_type=query_type, keywords=keywords), None
          
         # Semantic search fallback
         if query_type == "Product":
-            keywords_for_semantic = {"query": " ".join(keywords), "top_k": 3}
+            keywords_for_semantic = {"query": " ".join(keywords), "top_k": 3, "mode": search_mode, "filters": filters}
             print("Fallback to semantic search for product")
             returning_answer = await semantic_search_separate(user_query=keywords_for_semantic, db=db)
             # returning_answer = []
             # for keyword in keywords:
             #     answer_for_keyword = await semantic_search_separate(user_query=keyword, db=db)
             #     returning_answer.extend(answer_for_keyword)
-            global_query_thread.append({"role": "system", "answer": returning_answer})
-            response_with_context = chat_with_context(global_query_thread)
-            print(response_with_context)
-            return {"answer": returning_answer}
+            remember_message(session_id, returning_answer)
+            reply = await assistant_reply(session_id, stream)
+            return remember_answer(query_embedding, user_query, cache_options, returning_answer,
+                                   query_type=query_type, keywords=keywords, with_reply=True), reply
 
         elif query_type == "General":
-            keywords_for_semantic = {"query": " ".join(keywords), "top_k": 1}
+            keywords_for_semantic = {"query": " ".join(keywords), "top_k": 1, "summary": summary_mode}
             print("Fallback to semantic search for general query")
+            if stream:
+                response = await find_information(keywords_for_semantic["query"], db)
+                if not response:
+                    print("No information found.")
+                    remember_message(session_id, NO_INFORMATION_ANSWER)
+                    return None, text_pieces(NO_INFORMATION_ANSWER)
+                information = response[0]
+
+                def remember_summary(summary):
+                    remember_message(session_id, summary)
+                    remember_answer(query_embedding, user_query, cache_options, [summary],
+                                    query_type=query_type, keywords=keywords)
+
+                stored_summary = find_stored_summary(information, summary_mode, db)
+                if stored_summary is not None:
+                    pieces = text_pieces(stored_summary)
+                else:
+                    pieces = stream_summerize_answer(keywords_for_semantic["query"], information["context"])
+                return None, remembered_reply(pieces, remember_summary)
             returning_answer = await semantic_search_description(user_query=keywords_for_semantic, db=db)
-            global_query_thread.append({"role": "system", "answer": returning_answer})
-            return {"answer": returning_answer}
+            remember_message(session_id, returning_answer)
+            return remember_answer(query_embedding, user_query, cache_options, returning_answer,
+                                   query_type=query_type, keywords=keywords), None
 
         print("No matching query type found.")
         raise HTTPException(status_code=400, detail="Unknown query type.")
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+@router.post("/ragchat", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
+async def rag_chat(user_query: dict, db: Session = Depends(get_db)):
+    session_id = get_session_id(user_query)
+    answer, reply = await answer_rag_query(user_query, db, session_id)
+    return {"answer": answer, "reply": reply, "session_id": session_id}
+
+
+@router.post("/ragchat/stream", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
+async def rag_chat_stream(user_query: dict, db: Session = Depends(get_db)):
+    """
+    /ragchat as Server-Sent Events: "answer" with the products found as soon as they are known,
+    then a "token" per piece of the assistant's reply or summary and "done" with all of it.
+    The session id comes in the X-Session-Id header.
+    """
+    session_id = get_session_id(user_query)
+    answer, reply = await answer_rag_query(user_query, db, session_id, stream=True)
+
+    async def events():
+        if answer is not None:
+            yield sse_event("answer", {"answer": answer})
+        if reply is None:
+            yield sse_event("done", {"text": ""})
+            return
+        async for event in stream_text(reply):
+            yield event
+
+    response = sse_response(events())
+    response.headers["X-Session-Id"] = session_id
+    return response
     
 
 @router.get("/all_queries", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
-async def get_all_queries():
+async def get_all_queries(session_id: str = None, offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
     """
-    Endpoint to retrieve all stored queries for future reference.
+    Endpoint to retrieve the stored conversation messages for future reference, of one session
+    or of all of them, a page at a time.
     """
-    return global_query_thread
\ No newline at end of file
+    total, messages = conversation_store.history(session_id, offset, limit)
+    return {"total": total, "offset": offset, "limit": limit, "messages": messages}
@@ -1,36 +1,133 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sentence_transformers import SentenceTransformer
+import os
 import numpy as np
+from dotenv import load_dotenv
 from database import get_db
-from models import Products, Information, SeparateEmbeddingTables
+from models import Products, Information, SeparateEmbeddingTables, InformationPassages
+import faiss_index
+import separate_faiss_index
 from faiss_index import get_faiss_resources
 from description_faiss_index import get_description_faiss_resources
-from separate_faiss_index import get_separate_faiss_index_resources
+from passage_faiss_index import get_passage_faiss_resources
+from separate_faiss_index import get_separate_faiss_index_resources, get_separate_columns
 from utils.tokens import verify_token, verify_key
+from utils.embedding_batcher import embed_query
+from utils.metrics import stage_timer
+from utils.product_lookup import product_lookup
+from utils.lexical_index import reciprocal_rank_fusion
+from utils.multi_vector import AGGREGATIONS, AGGREGATION, OVERFETCH, aggregate_by_product
 
-from utils.chat_prompt_openai import summerize_answer
+from utils.chat_prompt_openai import summerize_answer, stream_summerize_answer
+from utils.streaming import sse_event, sse_response, stream_text, text_pieces
+from utils.information_summaries import SUMMARY_MODE, SUMMARY_MODES, get_stored_summary
 
 
+load_dotenv()
+
 # Initialize FastAPI Router
 router = APIRouter()
 
-# Load SentenceTransformer model
-embedding_model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2", device="cpu")
+# Product search ranks by FAISS distance (vector), BM25 (lexical) or both fused (hybrid)
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+# Candidates taken from each ranking before fusing them
+FUSION_CANDIDATES = int(os.getenv("FUSION_CANDIDATES", "50"))
+SEARCH_RESULTS = 5
+# Passages searched for a general question, and how many of the best page's passages are summarized
+PASSAGE_CANDIDATES = int(os.getenv("PASSAGE_CANDIDATES", "10"))
+PASSAGE_CONTEXT = int(os.getenv("PASSAGE_CONTEXT", "3"))
+# Answers when no product or no information page matches the query
+NO_PRODUCTS_ANSWER = "Molim Vas detaljniji opis proizvoda."
+NO_INFORMATION_ANSWER = "Nemamo informacije o tome, molim Vas detaljnije pitanje."
+FALLBACK_ANSWERS = (NO_PRODUCTS_ANSWER, NO_INFORMATION_ANSWER)
+
+
+def get_query_text(user_query):
+    """
+    The endpoints are called with {"query": ..., "top_k": ...} or directly with the query text.
+    """
+    if isinstance(user_query, dict):
+        return user_query.get("query")
+    return user_query
+
+
+def get_search_mode(user_query):
+    """
+    Ranking requested with {"mode": ...}, the SEARCH_MODE setting otherwise.
+    """
+    mode = user_query.get("mode") if isinstance(user_query, dict) else None
+    mode = (mode or SEARCH_MODE).lower()
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown search mode, expected one of {', '.join(SEARCH_MODES)}.")
+    return mode
+
+
+def get_summary_mode(user_query):
+    """
+    Stored or live summary of general answers, from {"summary": ...} or SUMMARY_MODE.
+    """
+    summary_mode = user_query.get("summary") if isinstance(user_query, dict) else None
+    summary_mode = (summary_mode or SUMMARY_MODE).lower()
+    if summary_mode not in SUMMARY_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown summary mode, expected one of {', '.join(SUMMARY_MODES)}.")
+    return summary_mode
+
+
+def find_stored_summary(information, summary_mode: str, db: Session):
+    """
+    The summary made for the page at upload time, when it is wanted and still matches the page.
+    """
+    if summary_mode != "stored":
+        return None
+    with stage_timer("summary_lookup"):
+        summary = get_stored_summary(db, information)
+    if summary is not None:
+        print(f"Serving the stored summary of information {information['code']}")
+    return summary
+
+
+def get_aggregation(user_query):
+    """
+    How the per-column hits of a product are combined, from {"aggregation": ...} or SEPARATE_AGGREGATION.
+    """
+    aggregation = user_query.get("aggregation") if isinstance(user_query, dict) else None
+    aggregation = (aggregation or AGGREGATION).lower()
+    if aggregation not in AGGREGATIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown aggregation, expected one of {', '.join(AGGREGATIONS)}.")
+    return aggregation
+
+
+def get_filter_codes(user_query, db: Session):
+    """
+    Product codes allowed by {"filters": {"brand", "category", "min_price", "max_price"}},
+    None when the request has no filters.
+    """
+    filters = user_query.get("filters") if isinstance(user_query, dict) else None
+    if not filters:
+        return None
+    product_lookup.refresh_if_stale(db)
+    try:
+        return product_lookup.attributes.select(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
 @router.post("/semantic-search", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
 async def semantic_search(user_query: dict, db: Session = Depends(get_db)):
     """
     Perform semantic search to find similar products.
     """
-    query = user_query
+    query = get_query_text(user_query)
     if not query:
         raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    allowed_codes = get_filter_codes(user_query, db)
 
     try:
         # Step 1: Generate query embedding
         print("Generating query embedding...")
-        query_embedding = embedding_model.encode([query], device="cpu").astype(np.float32)
+        with stage_timer("embed"):
+            query_embedding = await embed_query(query)
         print(f"Query embedding shape: {query_embedding.shape}")  
 
         # Step 2: Retrieve FAISS resources
@@ -38,9 +135,10 @@ async def semantic_search(user_query: dict, db: Session = Depends(get_db)):
         index, product_codes = get_faiss_resources()
         print(f"FAISS index has {len(product_codes)} product codes.")
 
-        # Step 3: Search FAISS index
+        # Step 3: Search FAISS index, filters are applied inside the search
         print("Searching FAISS index...")
-        distances, indices = index.search(query_embedding, 5)
+        with stage_timer("faiss_search"):
+            distances, indices = faiss_index.store.search(query_embedding, SEARCH_RESULTS, codes=allowed_codes)
         print(f"Distances: {distances}")
         print(f"Indices: {indices}")
 
@@ -49,14 +147,15 @@ async def semantic_search(user_query: dict, db: Session = Depends(get_db)):
         matched_codes = [
         product_codes[indices[0][i]]
         for i in range(len(distances[0]))
-        if distances[0][i] < 0.9 and indices[0][i] < len(product_codes)
+        if distances[0][i] < 0.9 and indices[0][i] in product_codes
                 ]
         if matched_codes == []:
-            return {"Molim Vas detaljniji opis proizvoda."}
+            return [NO_PRODUCTS_ANSWER]
 
         # Step 5: Fetch product details
         print("Fetching products from the database...")
-        results = db.query(Products).filter(Products.code.in_(matched_codes)).all()
+        with stage_timer("db_fetch"):
+            results = db.query(Products).filter(Products.code.in_(matched_codes)).all()
         response = [{
             "code": product.code,
             "name": product.name,
@@ -75,90 +174,183 @@ async def semantic_search(user_query: dict, db: Session = Depends(get_db)):
     
 
 
-@router.post("/semantic-search-descritption", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
-async def semantic_search_description(user_query: dict, db: Session = Depends(get_db)):
+def find_passages(query_embedding, db: Session):
     """
-    Perform semantic search to find similar products.
+    The information page with the passage closest to the query, as a dict with code, link, naslov,
+    opis and its best passages in page order as context. None when no passages are indexed.
     """
-    query = user_query
-    if not query:
-        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    passage_index, passage_codes = get_passage_faiss_resources()
+    if passage_index is None or not passage_codes:
+        return None
+    with stage_timer("passage_search"):
+        distances, indices = passage_index.search(query_embedding, PASSAGE_CANDIDATES)
+    hits = [int(idx) for idx in indices[0] if idx in passage_codes]
+    if not hits:
+        return None
+    code = passage_codes[hits[0]]
+    passage_ids = [idx for idx in hits if passage_codes[idx] == code][:PASSAGE_CONTEXT]
+    print(f"Matched passages {passage_ids} of information {code}")
+
+    with stage_timer("db_fetch"):
+        information = db.query(Information).filter(Information.code == int(code)).first()
+        passages = (db.query(InformationPassages.text).filter(InformationPassages.id.in_(passage_ids))
+                    .order_by(InformationPassages.id).all())
+    if information is None:
+        return None
+    return {
+        "code": information.code,
+        "link": information.link,
+        "naslov": information.naslov,
+        "opis": information.opis,
+        "context": "\n".join(text for (text,) in passages),
+    }
+
+
+async def find_information(query: str, db: Session):
+    """
+    The information pages closest to the query, as dicts with code, link, naslov, opis and the
+    context to summarize: the best matching passages, or the whole opis without a passage index.
+    """
+    # Step 1: Generate query embedding
+    print("Generating query embedding...")
+    with stage_timer("embed"):
+        query_embedding = await embed_query(query)
+    print(f"Query embedding shape: {query_embedding.shape}")  
+
+    information = find_passages(query_embedding, db)
+    if information is not None:
+        return [information]
+
+    # Step 2: Retrieve FAISS resources
+    print("Loading FAISS index...")
+    description_index, information_codes = get_description_faiss_resources()
+    print(f"FAISS index has {len(information_codes)} information codes.")
+
+    # Step 3: Search FAISS index
+    # print("Searching FAISS index...")
+    # distances, indices = description_index.search(query_embedding, 5)
+    # print(f"Distances: {distances}")
+    # print(f"Indices: {indices}")
+    
 
-    try:
-        # Step 1: Generate query embedding
-        print("Generating query embedding...")
-        query_embedding = embedding_model.encode([query], device="cpu").astype(np.float32)
-        print(f"Query embedding shape: {query_embedding.shape}")  
+   
+    # # Step 4: Match information codes
+    # matched_codes = [
+    #     information_codes[indices[0][i]]
+    #     for i in range(len(indices[0]))
+    #     if indices[0][i] < len(information_codes)
+    # ]
 
-        # Step 2: Retrieve FAISS resources
-        print("Loading FAISS index...")
-        description_index, information_codes = get_description_faiss_resources()
-        print(f"FAISS index has {len(information_codes)} information codes.")
-
-        # Step 3: Search FAISS index
-        # print("Searching FAISS index...")
-        # distances, indices = description_index.search(query_embedding, 5)
-        # print(f"Distances: {distances}")
-        # print(f"Indices: {indices}")
-        
-
-       
-        # # Step 4: Match information codes
-        # matched_codes = [
-        #     information_codes[indices[0][i]]
-        #     for i in range(len(indices[0]))
-        #     if indices[0][i] < len(information_codes)
-        # ]
-
-        print(f"FAISS index has {len(information_codes)} information codes.")
-        print(f"FAISS index contains {description_index.ntotal} vectors.")
-        print("Searching FAISS index...")
+    print(f"FAISS index has {len(information_codes)} information codes.")
+    print(f"FAISS index contains {description_index.ntotal} vectors.")
+    print("Searching FAISS index...")
 
-        try:
+    try:
+        with stage_timer("faiss_search"):
             distances, indices = description_index.search(query_embedding, 1)
-            print(f"indices: {indices}, distances: {distances}")
+        print(f"indices: {indices}, distances: {distances}")
 
-            if len(indices[0]) == 0:
-                print("No matches found.")
-                matched_codes = []
-            else:
-                matched_codes = [
-                    information_codes[idx]
-                    for idx in indices[0]
-                    if idx < len(information_codes)
-                ]
+        if len(indices[0]) == 0:
+            print("No matches found.")
+            matched_codes = []
+        else:
+            matched_codes = [
+                information_codes[idx]
+                for idx in indices[0]
+                if idx in information_codes
+            ]
 
-            print(f"Matched codes: {matched_codes}")
+        print(f"Matched codes: {matched_codes}")
 
-        except Exception as e:
-            matched_codes = []
-            print(f"An error occurred: {e}")
+    except Exception as e:
+        matched_codes = []
+        print(f"An error occurred: {e}")
 
-        # Return or process matched_codes
-        # return {"results": matched_codes}
+    # Return or process matched_codes
+    # return {"results": matched_codes}
 
 
-        # Step 5: Fetch product details
-        print("Fetching information from the database...")
+    # Step 5: Fetch product details
+    print("Fetching information from the database...")
+    with stage_timer("db_fetch"):
         results = db.query(Information).filter(Information.code.in_(matched_codes)).all()
-        response = [{
-            "code": information.code,
-            "link": information.link,
-            "naslov":information.naslov,
-            "opis": information.opis,
-            
-        }
-            for information in results
-        ]
+    response = [{
+        "code": information.code,
+        "link": information.link,
+        "naslov":information.naslov,
+        "opis": information.opis,
+        "context": information.opis,
+        
+    }
+        for information in results
+    ]
+    return response
+
+
+@router.post("/semantic-search-descritption", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
+async def semantic_search_description(user_query: dict, db: Session = Depends(get_db)):
+    """
+    Perform semantic search to find similar products.
+    """
+    query = get_query_text(user_query)
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    summary_mode = get_summary_mode(user_query)
+
+    try:
+        response = await find_information(query, db)
+        if not response:
+            print("No information found.")
+            return [NO_INFORMATION_ANSWER]
         print("Returning search results...")
+        # Pages summarized at upload time need no LLM call
+        stored_summary = find_stored_summary(response[0], summary_mode, db)
+        if stored_summary is not None:
+            return {stored_summary}
         #Summarize the response
-        chunk_to_summerize = response[0]["opis"]
-        summerized_response = summerize_answer(query, chunk_to_summerize)
+        chunk_to_summerize = response[0]["context"]
+        with stage_timer("llm_summarize"):
+            summerized_response = await summerize_answer(query, chunk_to_summerize)
         return {summerized_response}
 
     except Exception as e:
         print(f"Error occurred: {e}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+@router.post("/semantic-search-descritption/stream", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
+async def semantic_search_description_stream(user_query: dict, db: Session = Depends(get_db)):
+    """
+    Same search as /semantic-search-descritption, with the summary sent as Server-Sent Events:
+    "information" with the page found, a "token" per piece of the summary and "done" with all of it.
+    """
+    query = get_query_text(user_query)
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    summary_mode = get_summary_mode(user_query)
+
+    try:
+        response = await find_information(query, db)
+        if response:
+            stored_summary = find_stored_summary(response[0], summary_mode, db)
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    if not response:
+        raise HTTPException(status_code=404, detail="No information matches the query.")
+
+    information = response[0]
+    if stored_summary is not None:
+        pieces = text_pieces(stored_summary)
+    else:
+        pieces = stream_summerize_answer(query, information["context"])
+
+    async def events():
+        yield sse_event("information", {key: information[key] for key in ("code", "link", "naslov")})
+        async for event in stream_text(pieces):
+            yield event
+
+    return sse_response(events())
     
 
 @router.post("/semantic-search-separate", dependencies=[Depends(verify_token), Depends(verify_key)], status_code=200)
@@ -166,41 +358,75 @@ async def semantic_search_separate(user_query: dict, db: Session = Depends(get_d
     """
     Perform semantic search to find similar products.
     """
-    query = user_query
+    query = get_query_text(user_query)
     #print(f"Query: {query}")
     if not query:
         raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    mode = get_search_mode(user_query)
+    aggregation = get_aggregation(user_query)
+    allowed_codes = get_filter_codes(user_query, db)
 
     try:
-        # Step 1: Generate query embedding
-        print("Generating query embedding...")
-        query_embedding = embedding_model.encode([query], device="cpu").astype(np.float32)
-        print(f"Query embedding shape: {query_embedding.shape}")  
-
-        # Step 2: Retrieve FAISS resources
-        print("Loading FAISS index...")
-        index, product_codes = get_separate_faiss_index_resources()
-        print(f"FAISS index has {len(product_codes)} product codes.")
-
-        # Step 3: Search FAISS index
-        print("Searching FAISS index...")
-        distances, indices = index.search(query_embedding, 5)
-        print(f"Distances: {distances}")
-        print(f"Indices: {indices}")
+        matched_codes = []
+        if mode != "lexical":
+            # Step 1: Generate query embedding
+            print("Generating query embedding...")
+            with stage_timer("embed"):
+                query_embedding = await embed_query(query)
+            print(f"Query embedding shape: {query_embedding.shape}")  
+
+            # Step 2: Retrieve FAISS resources
+            print("Loading FAISS index...")
+            index, product_codes = get_separate_faiss_index_resources()
+            print(f"FAISS index has {len(product_codes)} product codes.")
+
+            # Step 3: Search FAISS index, filters are applied inside the search
+            # Every product has a vector per column, so over-fetch to end up with k distinct products
+            k = SEARCH_RESULTS if mode == "vector" else FUSION_CANDIDATES
+            print("Searching FAISS index...")
+            with stage_timer("faiss_search"):
+                distances, indices = separate_faiss_index.store.search(
+                    query_embedding, k if aggregation == "none" else k * OVERFETCH, codes=allowed_codes)
+            print(f"Distances: {distances}")
+            print(f"Indices: {indices}")
+
+            #total_codes = [semantic_results_for_keywords, semnatic_results_for_query]
+            # Step 4: Match product codes
+            if aggregation == "none":
+                matched_codes = [
+                product_codes[indices[0][i]]
+                for i in range(len(distances[0]))
+                if distances[0][i] < 0.9 and indices[0][i] in product_codes
+                        ]
+            else:
+                with stage_timer("aggregate"):
+                    ranked = aggregate_by_product(distances[0], indices[0], product_codes, get_separate_columns(db), aggregation)
+                matched_codes = [code for code, _, best_distance in ranked if best_distance < 0.9][:k]
+
+        if mode != "vector":
+            # Exact brand / name tokens the embedding misses are caught by BM25, ranks are fused
+            with stage_timer("lexical_search"):
+                product_lookup.refresh_if_stale(db)
+                lexical_codes = [code for code, _ in product_lookup.lexical.search(query, FUSION_CANDIDATES, codes=allowed_codes)]
+            matched_codes = reciprocal_rank_fusion(list(dict.fromkeys(matched_codes)), lexical_codes)[:SEARCH_RESULTS]
+
+        # Products whose OE numbers the query mentions ("DUNLOP 3HB2700") are ranked in with the others
+        with stage_timer("oe_candidates"):
+            product_lookup.refresh_if_stale(db)
+            oe_codes = product_lookup.find_oe_candidates(query, allowed_codes)
+        if oe_codes:
+            print(f"OE number candidates: {oe_codes}")
+            matched_codes = reciprocal_rank_fusion(oe_codes, list(dict.fromkeys(matched_codes)))[:SEARCH_RESULTS]
 
-        #total_codes = [semantic_results_for_keywords, semnatic_results_for_query]
-        # Step 4: Match product codes
-        matched_codes = [
-        product_codes[indices[0][i]]
-        for i in range(len(distances[0]))
-        if distances[0][i] < 0.9 and indices[0][i] < len(product_codes)
-                ]
         if matched_codes == []:
-            return {"Molim Vas detaljniji opis proizvoda."}
+            return [NO_PRODUCTS_ANSWER]
         print(f"Matched codes: {matched_codes}")
         # Step 5: Fetch product details
         print("Fetching products from the database...")
-        results = db.query(Products).filter(Products.code.in_(matched_codes)).all()
+        with stage_timer("db_fetch"):
+            results = db.query(Products).filter(Products.code.in_(matched_codes)).all()
+        if mode != "vector" or aggregation != "none" or oe_codes:
+            results.sort(key=lambda product: matched_codes.index(product.code))
         response = [{
             "code": product.code,
             "name": product.name,
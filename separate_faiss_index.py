@@ -1,27 +1,21 @@
-import faiss
 from sqlalchemy.orm import Session
-from models import SeparateEmbeddingTables
-from database import SessionLocal
+from models import SeparateEmbeddingTables, EmbeddingState
+from faiss_store import FaissStore
 
-DESCRIPTION_INDEX_FILE = "separate_index.faiss"
-information_codes = []  # Global variable to store product codes
-separate_index = None        # Global FAISS index
+SEPARATE_INDEX_FILE = "separate_index.faiss"
+# One vector per product column, so ids are the separate_emb_table row ids
+store = FaissStore(SEPARATE_INDEX_FILE, SeparateEmbeddingTables, name="separate", id_column="id")
+_columns = (None, {})  # (index version, row id -> embedded column)
 
 def load_separate_faiss_index(db: Session):
     """
     Load the FAISS index and information codes.
     """
-    global separate_index, information_codes
     print("Loading FAISS index...")
     try:
-        # Load FAISS index
-        separate_index = faiss.read_index(DESCRIPTION_INDEX_FILE)
-        print("FAISS description index loaded successfully.")
-
-        # Load product codes
-        information_codes.clear()
-        information_codes.extend([row.code for row in db.query(SeparateEmbeddingTables).all()])
-        print(f"Loaded {len(information_codes)} information codes.")
+        store.load(db)
+        print("FAISS separate index loaded successfully.")
+        print(f"Loaded {len(store.id_to_code)} information codes.")
 
     except Exception as e:
         print(f"Error loading FAISS index: {e}")
@@ -29,8 +23,26 @@ def load_separate_faiss_index(db: Session):
 
 def get_separate_faiss_index_resources():
     """
-    Access the loaded FAISS index and description codes.
+    Access the loaded FAISS index and the id -> product code mapping.
     """
-    if separate_index is None or not information_codes:
+    store.refresh_if_stale()  # pick up indexes saved by other workers
+    if store.index is None or not store.id_to_code:
         raise RuntimeError("FAISS index is not loaded. Call load_faiss_index() during startup.")
-    return separate_index, information_codes
+    return store.index, store.id_to_code
+
+
+def get_separate_columns(db: Session):
+    """
+    Column each vector of the separate index was embedded from, as {row id: column name}.
+    Reread from the content hashes whenever the index changes.
+    """
+    global _columns
+    version, id_to_column = _columns
+    if version != store.version:
+        entries = db.query(EmbeddingState.embedding_id, EmbeddingState.column_name).filter(
+            EmbeddingState.target_table == SeparateEmbeddingTables.__tablename__,
+            EmbeddingState.embedding_id.isnot(None),
+        )
+        id_to_column = {embedding_id: column for embedding_id, column in entries}
+        _columns = (store.version, id_to_column)
+    return id_to_column
@@ -0,0 +1,54 @@
+"""
+Shared setup of the tests: a throwaway SQLite database, the chat completions stand-in of
+benchmarks/stubs.py in place of the OpenAI API and the hashing embedder in place of the model.
+"""
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from benchmarks.stubs import start_llm_stub, HashingEmbedder
+
+# Read at import time by database.py and the OpenAI client, so set before any repo module is imported
+WORKDIR = tempfile.mkdtemp(prefix="tests-")
+LLM_STUB, LLM_URL = start_llm_stub(latency_ms=0)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'tests.db')}"
+os.environ["OPENAI_BASE_URL"] = LLM_URL
+os.environ["OPEN_AI_KEY"] = os.environ["OPENAI_API_KEY"] = "tests"
+os.environ["TOKEN"] = "tests-token"
+os.environ["KEY"] = "tests-key"
+
+DIMENSION = 32
+
+
+@pytest.fixture
+def db():
+    import models
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def embedder():
+    return HashingEmbedder(dimension=DIMENSION)
+
+
+@pytest.fixture
+def embedding_model(embedder):
+    """
+    The hashing embedder registered as the shared embedding model, for code that embeds queries.
+    """
+    from utils.model_registry import register_embedding_model
+
+    register_embedding_model(embedder)
+    return embedder
@@ -0,0 +1,80 @@
+import numpy as np
+
+from utils.answer_cache import SemanticAnswerCache
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_similar_query_hits_and_options_must_match():
+    cache = SemanticAnswerCache(max_size=10, threshold=0.95, ttl_seconds=0)
+    cache.check_catalog(1)
+    cache.store(vector(1, 0, 0), "remen", {"mode": "vector"}, answer=["R-1"])
+
+    hit = cache.lookup(vector(1, 0.05, 0), {"mode": "vector"})
+    assert hit["answer"] == ["R-1"] and hit["query"] == "remen"
+    assert cache.lookup(vector(1, 0.05, 0), {"mode": "hybrid"}) is None
+    assert cache.lookup(vector(0, 1, 0), {"mode": "vector"}) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_catalog_change_clears_the_cache():
+    cache = SemanticAnswerCache(max_size=10, threshold=0.95, ttl_seconds=0)
+    cache.check_catalog(1)
+    cache.store(vector(1, 0), "remen", answer=["R-1"])
+    cache.check_catalog(2)
+    assert cache.lookup(vector(1, 0)) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_oldest_entries_are_evicted_and_expired():
+    cache = SemanticAnswerCache(max_size=2, threshold=0.95, ttl_seconds=0)
+    cache.store(vector(1, 0, 0), "a", answer=["A"])
+    cache.store(vector(0, 1, 0), "b", answer=["B"])
+    cache.store(vector(0, 0, 1), "c", answer=["C"])
+    assert cache.lookup(vector(1, 0, 0)) is None
+    assert cache.lookup(vector(0, 0, 1))["answer"] == ["C"]
+
+    cache.ttl = 1e-9
+    assert cache.lookup(vector(0, 1, 0)) is None
+    assert cache.stats()["size"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SemanticAnswerCache(max_size=0)
+    cache.store(vector(1, 0), "a", answer=["A"])
+    assert cache.lookup(vector(1, 0)) is None
+
+
+def test_fallback_answers_are_not_cached(monkeypatch):
+    from routes import rag_query_endpoint
+    from routes.semantic_search import NO_PRODUCTS_ANSWER, NO_INFORMATION_ANSWER
+
+    cache = SemanticAnswerCache(max_size=10, threshold=0.95, ttl_seconds=0)
+    monkeypatch.setattr(rag_query_endpoint, "answer_cache", cache)
+    for answer in ([NO_PRODUCTS_ANSWER], [NO_INFORMATION_ANSWER], [], None, [""]):
+        assert rag_query_endpoint.remember_answer(vector(1, 0), "remen", None, answer) == answer
+    assert cache.stats()["size"] == 0
+
+    rag_query_endpoint.remember_answer(vector(1, 0), "remen", None, [{"code": "R-1"}])
+    assert cache.lookup(vector(1, 0))["answer"] == [{"code": "R-1"}]
+
+
+def test_catalog_version_follows_the_product_indexes(db, embedder, tmp_path, monkeypatch):
+    import faiss_index
+    from faiss_store import FaissStore
+    from models import EmbeddingsTable
+    from routes import rag_query_endpoint
+
+    store = FaissStore(str(tmp_path / "products.faiss"), EmbeddingsTable, name="tests")
+    monkeypatch.setattr(faiss_index, "store", store)
+    db.add(EmbeddingsTable(code="1", embedding=embedder.encode("remen").tobytes()))
+    db.commit()
+    store.build(db)
+    before = rag_query_endpoint.catalog_version()
+
+    db.add(EmbeddingsTable(code="2", embedding=embedder.encode("filter").tobytes()))
+    db.commit()
+    store.apply_changes(db, ["2"], [])
+    assert rag_query_endpoint.catalog_version() != before
@@ -0,0 +1,40 @@
+from utils.context_builder import compact_products, count_tokens, select_passages, truncate_tokens
+
+
+def test_truncate_tokens_cuts_at_a_word():
+    text = " ".join(f"rec{i}" for i in range(200))
+    cut = truncate_tokens(text, 20)
+    assert cut.endswith("...")
+    assert count_tokens(cut[:-3]) <= 20
+    assert text.startswith(cut[:-3])
+    assert truncate_tokens("kratko", 20) == "kratko"
+
+
+def test_compact_products():
+    products = [{"code": "R-1", "name": "Remen", "price": "1.200 RSD", "description": "Klinasti  remen\nza kombajn"},
+                {"code": "F-2", "name": "Filter", "price": None, "description": ""}]
+    assert compact_products(products) == ("- Remen (code R-1), price 1.200 RSD: Klinasti remen za kombajn\n"
+                                          "- Filter (code F-2)")
+
+
+def test_select_passages_keeps_short_text():
+    text = "Dostava traje dva dana.\nPlacanje pouzecem."
+    assert select_passages("dostava", text, max_tokens=100) == text
+
+
+def test_select_passages_picks_the_relevant_paragraphs_in_order():
+    filler = [f"Paragraf {i} o radnom vremenu prodavnice i praznicima." for i in range(20)]
+    paragraphs = filler[:5] + ["Dostava robe traje dva radna dana."] + filler[5:15] + \
+        ["Troskove dostave placa kupac."] + filler[15:]
+    text = "\n".join(paragraphs)
+    limit = count_tokens(paragraphs[5]) + count_tokens(paragraphs[16]) + 2
+
+    selected = select_passages("kolika je cena dostave", text, max_tokens=limit)
+    assert selected == "Dostava robe traje dva radna dana.\nTroskove dostave placa kupac."
+
+
+def test_select_passages_truncates_a_single_long_passage():
+    text = " ".join(f"dostava{i}" for i in range(400))
+    selected = select_passages("dostava", text, max_tokens=30)
+    assert selected.endswith("...")
+    assert count_tokens(selected) <= 31
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import sessionmaker
+
+from models import ConversationMessages
+from utils.conversation_store import ConversationStore, DatabaseConversationStore, message_content, recent_window
+
+
+def test_message_content():
+    assert message_content("tekst") == "tekst"
+    assert message_content([{"code": "R-1", "name": "Remen"}]) == "- Remen (code R-1)"
+    assert message_content({"Sazetak"}) == '["Sazetak"]'
+
+
+def test_recent_window_respects_both_limits():
+    messages = [{"role": "user", "content": f"poruka {i} " * 10} for i in range(10)]
+    assert recent_window(messages, 3, 10000) == [{"role": "user", "content": m["content"]} for m in messages[-3:]]
+    assert len(recent_window(messages, 10, 40)) == 1
+    # The last message goes in even when it alone is over the token limit
+    assert recent_window(messages, 10, 1) == [{"role": "user", "content": messages[-1]["content"]}]
+
+
+def test_window_keeps_the_last_messages_of_a_session():
+    store = ConversationStore(max_messages=2, max_tokens=1000, max_sessions=10, ttl_seconds=0)
+    for text in ("a", "b", "c"):
+        store.append("s1", "user", text)
+    store.append("s2", "user", "x")
+    assert store.window("s1") == [{"role": "user", "content": "b"}, {"role": "user", "content": "c"}]
+    assert store.window("missing") == []
+
+
+def test_least_recently_used_and_idle_sessions_are_evicted():
+    store = ConversationStore(max_messages=5, max_tokens=1000, max_sessions=2, ttl_seconds=0)
+    store.append("s1", "user", "a")
+    store.append("s2", "user", "b")
+    store.append("s1", "user", "c")
+    store.append("s3", "user", "d")
+    assert store.window("s2") == []
+    assert len(store.window("s1")) == 2
+    assert store.stats()["evictions"] == 1
+
+    store.ttl = 1e-9
+    store.append("s4", "user", "e")
+    assert store.stats()["sessions"] == 1
+
+
+def test_history_pages():
+    store = ConversationStore(max_messages=10, max_tokens=1000, max_sessions=10, ttl_seconds=0)
+    for text in ("a", "b", "c"):
+        store.append("s1", "user", text)
+    store.append("s2", "assistant", "d")
+    total, page = store.history(offset=1, limit=2)
+    assert total == 4 and [message["content"] for message in page] == ["b", "c"]
+    total, page = store.history("s2")
+    assert total == 1 and page[0]["role"] == "assistant"
+
+
+def database_store(db, **kwargs):
+    return DatabaseConversationStore(sessionmaker(bind=db.get_bind()), max_messages=2, max_tokens=1000, **kwargs)
+
+
+def test_database_store_window_and_history(db):
+    store = database_store(db, ttl_seconds=0)
+    for text in ("a", "b", "c"):
+        store.append("s1", "user", text)
+    store.append("s2", "assistant", "d")
+
+    assert store.window("s1") == [{"role": "user", "content": "b"}, {"role": "user", "content": "c"}]
+    total, page = store.history("s1", offset=0, limit=10)
+    assert total == 3 and [message["content"] for message in page] == ["a", "b", "c"]
+    assert store.stats() == {"backend": "database", "sessions": 2, "messages": 4, "ttl_seconds": 0,
+                             "deleted_messages": 0}
+
+
+def test_database_store_deletes_idle_sessions(db):
+    old = datetime.now(timezone.utc) - timedelta(hours=2)
+    db.add_all([ConversationMessages(session_id="old", role="user", content="a", created_at=old),
+                ConversationMessages(session_id="active", role="user", content="b", created_at=old)])
+    db.commit()
+
+    store = database_store(db, ttl_seconds=3600, prune_interval=3600)
+    store.append("active", "user", "c")
+    assert store.history("old") == (0, [])
+    assert store.history("active")[0] == 2
+    assert store.stats()["deleted_messages"] == 1
+
+    # Not again before prune_interval has passed
+    db.add(ConversationMessages(session_id="old", role="user", content="a", created_at=old))
+    db.commit()
+    store.append("active", "user", "d")
+    assert store.history("old")[0] == 1
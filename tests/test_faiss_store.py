@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from faiss_store import FaissStore, code_to_id, check_unique_ids
+from models import EmbeddingsTable, SeparateEmbeddingTables
+
+
+def add_embeddings(db, embedder, table_model, texts):
+    for code, text in texts.items():
+        db.add(table_model(code=code, embedding=embedder.encode(text).astype(np.float32).tobytes()))
+    db.commit()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FaissStore(str(tmp_path / "products.faiss"), EmbeddingsTable, name="tests")
+
+
+def test_code_to_id_keeps_leading_zeros_apart():
+    assert code_to_id("7") == 7
+    assert code_to_id(7) == 7
+    assert code_to_id("007") != 7
+    assert code_to_id("007") == code_to_id("007")
+    assert code_to_id("AB-12") >= 0
+
+
+def test_check_unique_ids_rejects_duplicates():
+    with pytest.raises(ValueError):
+        check_unique_ids(np.array([1, 1]), ["a", "b"])
+    with pytest.raises(ValueError):
+        check_unique_ids(np.array([2]), ["b"], {2: "a"})
+    check_unique_ids(np.array([1, 2]), ["a", "b"], {3: "c"})
+
+
+def test_build_and_load_keep_mapping_in_sync(db, embedder, store, tmp_path):
+    add_embeddings(db, embedder, EmbeddingsTable, {"7": "remen", "007": "filter", "8": "lezaj"})
+    store.build(db)
+    assert store.index.ntotal == len(store.id_to_code) == 3
+    assert sorted(store.id_to_code.values()) == ["007", "7", "8"]
+
+    loaded = FaissStore(store.index_file, EmbeddingsTable, name="tests")
+    loaded.load(db)
+    assert loaded.id_to_code == store.id_to_code
+    assert loaded.read_mapping(loaded.index_ids()) is not None
+
+
+def test_apply_changes_adds_replaces_and_removes(db, embedder, store):
+    add_embeddings(db, embedder, EmbeddingsTable, {"1": "remen", "2": "filter"})
+    store.build(db)
+
+    add_embeddings(db, embedder, EmbeddingsTable, {"03": "lezaj"})
+    db.query(EmbeddingsTable).filter(EmbeddingsTable.code == "1").delete()
+    db.commit()
+    result = store.apply_changes(db, ["03", "2"], ["1"])
+
+    assert result == {"added": 2, "removed": 2}
+    assert store.index.ntotal == len(store.id_to_code) == 2
+    assert sorted(store.id_to_code.values()) == ["03", "2"]
+    _, ids = store.search(embedder.encode(["lezaj"]).astype(np.float32), 1)
+    assert store.id_to_code[int(ids[0][0])] == "03"
+
+
+def test_search_restricted_to_codes(db, embedder, store):
+    add_embeddings(db, embedder, EmbeddingsTable, {"1": "remen", "2": "remen kombajn", "3": "filter"})
+    store.build(db)
+    _, ids = store.search(embedder.encode(["remen"]).astype(np.float32), 3, codes=["3"])
+    assert [store.id_to_code[int(id_)] for id_ in ids[0] if id_ != -1] == ["3"]
+
+
+def test_refresh_if_stale_picks_up_other_workers_version(db, embedder, store):
+    add_embeddings(db, embedder, EmbeddingsTable, {"1": "remen"})
+    store.build(db)
+    other = FaissStore(store.index_file, EmbeddingsTable, name="tests")
+    other.load(db)
+
+    add_embeddings(db, embedder, EmbeddingsTable, {"001": "filter"})
+    store.apply_changes(db, ["001"], [])
+    other.refresh_if_stale()
+
+    assert other.version == store.version
+    assert sorted(other.id_to_code.values()) == ["001", "1"]
+    assert other.index.ntotal == 2
+
+
+def test_reconcile_patches_only_the_difference(db, embedder, tmp_path):
+    store = FaissStore(str(tmp_path / "separate.faiss"), SeparateEmbeddingTables, name="tests", id_column="id")
+    add_embeddings(db, embedder, SeparateEmbeddingTables, {"A": "remen", "B": "filter"})
+    store.build(db)
+
+    db.query(SeparateEmbeddingTables).filter(SeparateEmbeddingTables.code == "A").delete()
+    add_embeddings(db, embedder, SeparateEmbeddingTables, {"C": "lezaj"})
+    assert store.reconcile(db) == {"added": 1, "removed": 1}
+    assert store.index.ntotal == len(store.id_to_code) == 2
+    assert sorted(store.id_to_code.values()) == ["B", "C"]
+    assert store.reconcile(db) == {"added": 0, "removed": 0}
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from models import Information, InformationSummaries
+from utils import information_summaries
+from utils.information_summaries import get_stored_summary, page_hash, precompute_summaries
+
+
+@pytest.fixture
+def summarized(monkeypatch):
+    """
+    Titles of the pages sent to be summarized, with a stand-in summarizer.
+    """
+    calls = []
+
+    async def summerize_page(naslov, opis):
+        calls.append(naslov)
+        return f"Sazetak: {naslov}"
+
+    monkeypatch.setattr(information_summaries, "summerize_page", summerize_page)
+    return calls
+
+
+def page(code, naslov, opis):
+    return {"code": code, "naslov": naslov, "opis": opis}
+
+
+def add_pages(db):
+    db.add_all([
+        Information(code=1, naslov="Dostava", opis="Dostava traje dva dana."),
+        Information(code=2, naslov="Placanje", opis="Placanje pouzecem ili karticom."),
+        Information(code=3, naslov="Prazno", opis=None),
+    ])
+    db.commit()
+
+
+def test_page_hash_changes_with_title_and_text():
+    assert page_hash("a", "b") == page_hash("a", "b")
+    assert page_hash("a", "b") != page_hash("a", "c")
+    assert page_hash("ab", "") != page_hash("a", "b")
+
+
+def test_only_missing_and_changed_pages_are_summarized(db, summarized):
+    add_pages(db)
+    assert asyncio.run(precompute_summaries(db)) == {"summarized": 2, "failed": 0, "skipped": 1}
+    assert sorted(summarized) == ["Dostava", "Placanje"]
+    assert get_stored_summary(db, page(1, "Dostava", "Dostava traje dva dana.")) == "Sazetak: Dostava"
+
+    summarized.clear()
+    assert asyncio.run(precompute_summaries(db)) == {"summarized": 0, "failed": 0, "skipped": 3}
+    assert summarized == []
+
+    db.get(Information, 1).opis = "Dostava traje tri dana."
+    db.commit()
+    # The stored summary no longer matches the page
+    assert get_stored_summary(db, page(1, "Dostava", "Dostava traje tri dana.")) is None
+    assert asyncio.run(precompute_summaries(db, ["1", "2"]))["summarized"] == 1
+    assert summarized == ["Dostava"]
+    assert get_stored_summary(db, page(1, "Dostava", "Dostava traje tri dana.")) == "Sazetak: Dostava"
+
+    summarized.clear()
+    asyncio.run(precompute_summaries(db, force=True))
+    assert sorted(summarized) == ["Dostava", "Placanje"]
+
+
+def test_summaries_of_deleted_pages_are_dropped(db, summarized):
+    add_pages(db)
+    asyncio.run(precompute_summaries(db))
+    db.query(Information).filter(Information.code == 2).delete()
+    db.commit()
+
+    asyncio.run(precompute_summaries(db, ["2"]))
+    assert db.get(InformationSummaries, 2) is None
+    assert db.get(InformationSummaries, 1) is not None
+
+
+def test_first_run_for_some_codes_summarizes_everything(db, summarized):
+    add_pages(db)
+    asyncio.run(precompute_summaries(db, ["1"]))
+    assert sorted(summarized) == ["Dostava", "Placanje"]
+
+
+def test_failed_summaries_are_retried_later(db, monkeypatch):
+    add_pages(db)
+
+    async def failing(naslov, opis):
+        raise RuntimeError("LLM down")
+
+    monkeypatch.setattr(information_summaries, "summerize_page", failing)
+    assert asyncio.run(precompute_summaries(db))["failed"] == 2
+    assert db.query(InformationSummaries).count() == 0
+
+
+def test_page_summary_prompt_is_cut_to_the_budget(monkeypatch):
+    from utils import chat_prompt_openai
+    from utils.context_builder import SUMMARY_MAX_TOKENS, count_tokens
+
+    prompts = []
+
+    async def chat_prompt(prompt, task):
+        prompts.append(prompt)
+        return "Sazetak"
+
+    monkeypatch.setattr(chat_prompt_openai, "chat_prompt_openai", chat_prompt)
+    opis = " ".join(f"rec{i}" for i in range(SUMMARY_MAX_TOKENS * 2))
+    assert asyncio.run(chat_prompt_openai.summerize_page("Dostava", opis)) == "Sazetak"
+    assert count_tokens(prompts[0].partition("Ceo tekst :")[2]) <= SUMMARY_MAX_TOKENS + 1
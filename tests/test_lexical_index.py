@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from utils.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def product(code, name, brand=None, description=None, options=None):
+    return SimpleNamespace(code=code, name=name, brand=brand, description=description, options=options)
+
+
+def build_index():
+    index = LexicalIndex()
+    index.build([
+        product("1", "Klinasti remen 3HB2700", brand="DUNLOP", description="Remen za kombajn"),
+        product("2", "Klinasti remen", brand="OPTIBELT", description="Remen za kosilicu"),
+        product("3", "Ležaj 6204", brand="SKF", description="Kuglični ležaj"),
+        product("4", "Filter ulja", brand="MANN", description="Filter za traktor"),
+    ])
+    return index
+
+
+def test_tokenize_drops_case_and_diacritics():
+    assert tokenize("Ležaj ĐON, 6204-2RS") == ["lezaj", "djon", "6204", "2rs"]
+
+
+def test_search_ranks_rarer_and_repeated_terms_higher():
+    index = build_index()
+    results = index.search("dunlop remen", 10)
+    assert [code for code, _ in results] == ["1", "2"]
+    assert results[0][1] > results[1][1] > 0
+    assert [code for code, _ in index.search("lezaj", 10)] == ["3"]
+
+
+def test_search_limits_and_restricts_to_codes():
+    index = build_index()
+    assert len(index.search("remen", 1)) == 1
+    assert [code for code, _ in index.search("remen", 10, codes={"2", "4"})] == ["2"]
+    assert index.search("remen", 10, codes=set()) == []
+    assert index.search("nepoznato", 10) == []
+
+
+def test_empty_index():
+    index = LexicalIndex()
+    index.build([])
+    assert index.search("remen", 5) == []
+
+
+def test_reciprocal_rank_fusion():
+    # "b" is second in both rankings, "a" first in one only
+    assert reciprocal_rank_fusion(["a", "b"], ["c", "b"]) == ["b", "a", "c"]
+    assert reciprocal_rank_fusion(["a", "b"]) == ["a", "b"]
+    assert reciprocal_rank_fusion([], []) == []
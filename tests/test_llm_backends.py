@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from benchmarks.stubs import start_ollama_stub
+from utils import llm_backends
+from utils.metrics import get_metrics
+from utils.ollama_deepseek import OllamaBackend, OllamaBusyError, strip_thinking
+
+
+@pytest.fixture(scope="module")
+def ollama_url():
+    server, url = start_ollama_stub(latency_ms=50)
+    yield url
+    server.shutdown()
+
+
+def test_strip_thinking():
+    assert strip_thinking("<think>hmm\nda</think>\n Odgovor.") == "Odgovor."
+    assert strip_thinking(None) == ""
+
+
+def test_full_queue_is_refused_and_counted(ollama_url):
+    backend = OllamaBackend(host=ollama_url, max_concurrency=1, queue_size=1)
+    messages = [{"role": "user", "content": "Pitanje"}]
+
+    async def run():
+        return await asyncio.gather(*(backend.complete(messages) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert sum(isinstance(result, OllamaBusyError) for result in results) == 1
+    assert [result for result in results if isinstance(result, str)] == ["Ovo je skraceni odgovor asistenta."] * 2
+    assert backend.stats() == {"model": backend.model, "running": 0, "queued": 0, "max_concurrency": 1,
+                               "queue_size": 1, "rejected": 1}
+
+
+def test_streamed_answer_has_no_reasoning(ollama_url):
+    backend = OllamaBackend(host=ollama_url)
+
+    async def run():
+        return "".join([piece async for piece in backend.stream([{"role": "user", "content": "Pitanje"}])])
+
+    assert asyncio.run(run()) == "Ovo je skraceni odgovor asistenta."
+
+
+def test_ollama_backend_shows_on_metrics(ollama_url, monkeypatch):
+    monkeypatch.setitem(llm_backends.TASK_BACKENDS, "summarize", "ollama")
+    monkeypatch.setattr(llm_backends, "backends", {"openai": llm_backends.backends["openai"]})
+    monkeypatch.setattr("utils.ollama_deepseek.URL", ollama_url)
+
+    backend = llm_backends.get_backend("summarize")
+    assert backend.name == "ollama"
+    assert get_metrics()["caches"]["ollama"] == backend.stats()
+
+
+def test_failed_local_backend_falls_back_to_openai(monkeypatch):
+    monkeypatch.setitem(llm_backends.TASK_BACKENDS, "keywords", "ollama")
+    monkeypatch.setattr(llm_backends, "backends", {"openai": llm_backends.backends["openai"],
+                                                   "ollama": OllamaBackend(host="http://127.0.0.1:9")})
+
+    answer = asyncio.run(llm_backends.complete_task("keywords", [{"role": "user", "content": "Pitanje"}]))
+    assert answer == "Ovo je skraceni odgovor asistenta."
@@ -0,0 +1,47 @@
+import asyncio
+
+import numpy as np
+
+from utils.lru_cache import LRUCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_size=2, ttl_seconds=0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_dropped():
+    cache = LRUCache(max_size=10, ttl_seconds=1e-9)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_disabled_cache_and_stats():
+    cache = LRUCache(max_size=0, ttl_seconds=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 0, "max_size": 0, "ttl_seconds": 0, "hits": 0, "misses": 1,
+                             "evictions": 0, "hit_rate": 0.0}
+
+
+def test_query_embeddings_are_cached_by_normalized_text(embedding_model):
+    from utils.embedding_batcher import embed_query, normalize_query, query_embedding_cache
+
+    assert normalize_query("  Remen  ZA kombajn? ") == "remen za kombajn"
+    query_embedding_cache.clear()
+
+    async def run():
+        return await embed_query("Remen za kombajn?"), await embed_query("remen  za kombajn")
+
+    first, second = asyncio.run(run())
+    assert first.shape == (1, embedding_model.dimension)
+    assert np.array_equal(first, second)
+    assert not first.flags.writeable
+    assert query_embedding_cache.stats()["size"] == 1
@@ -0,0 +1,14 @@
+from utils import model_registry
+from utils.model_registry import EMBEDDING_MODEL_NAME, get_embedding_model, register_embedding_model
+
+
+def test_indexing_and_queries_share_the_model_on_the_resolved_device(monkeypatch, embedder):
+    monkeypatch.setattr(model_registry, "_models", {})
+    monkeypatch.setattr(model_registry, "_device", "mps")
+
+    register_embedding_model(embedder, "all-mpnet-base-v2")
+
+    # The embedding processor asks by name, the query batcher with the defaults
+    assert get_embedding_model(EMBEDDING_MODEL_NAME) is embedder
+    assert get_embedding_model() is embedder
+    assert model_registry.loaded_models() == [(EMBEDDING_MODEL_NAME, "mps")]
@@ -0,0 +1,46 @@
+import pytest
+
+from utils.multi_vector import aggregate_by_product, parse_column_weights, similarity
+
+# Two products, "A" matching on name and description, "B" closest on options only
+ID_TO_CODE = {1: "A", 2: "A", 3: "B", 4: "B"}
+ID_TO_COLUMN = {1: "name", 2: "description", 3: "options", 4: "name"}
+DISTANCES = [0.2, 0.4, 0.1, 1.2]
+IDS = [1, 2, 3, 4]
+WEIGHTS = {"name": 1.0, "description": 0.6, "options": 0.8}
+
+
+def test_parse_column_weights():
+    assert parse_column_weights("name=1.0, description=0.5,,") == {"name": 1.0, "description": 0.5}
+    assert parse_column_weights("") == {}
+
+
+def test_similarity_of_normalized_vectors():
+    assert similarity(0.0) == 1.0
+    assert similarity(2.0) == 0.0
+
+
+def test_max_takes_the_best_vector():
+    ranked = aggregate_by_product(DISTANCES, IDS, ID_TO_CODE, ID_TO_COLUMN, "max", WEIGHTS)
+    assert [code for code, _, _ in ranked] == ["B", "A"]
+    assert ranked[0][1] == pytest.approx(0.95)
+    assert ranked[0][2] == pytest.approx(0.1)
+
+
+def test_sum_rewards_several_matching_columns():
+    ranked = aggregate_by_product(DISTANCES, IDS, ID_TO_CODE, ID_TO_COLUMN, "sum", WEIGHTS)
+    assert [code for code, _, _ in ranked] == ["A", "B"]
+    assert ranked[0][1] == pytest.approx(0.9 + 0.8)
+
+
+def test_weighted_uses_column_weights():
+    ranked = aggregate_by_product(DISTANCES, IDS, ID_TO_CODE, ID_TO_COLUMN, "weighted", WEIGHTS)
+    scores = {code: score for code, score, _ in ranked}
+    assert scores["A"] == pytest.approx((1.0 * 0.9 + 0.6 * 0.8) / 2.4)
+    assert scores["B"] == pytest.approx((0.8 * 0.95 + 1.0 * 0.4) / 2.4)
+    assert [code for code, _, _ in ranked] == ["A", "B"]
+
+
+def test_padding_and_unknown_ids_are_skipped():
+    ranked = aggregate_by_product([0.1, 0.3, 3.4e38], [7, 1, -1], ID_TO_CODE, ID_TO_COLUMN, "max", WEIGHTS)
+    assert [code for code, _, _ in ranked] == ["A"]
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+from utils.oe_index import OENumberIndex, normalize_oe_number, part_number_key
+
+
+def build_index():
+    index = OENumberIndex()
+    index.build([
+        SimpleNamespace(code="P1", oe_numbers="CL 667.251-1; 3HB2700"),
+        SimpleNamespace(code="P2", oe_numbers="3HB2750"),
+        SimpleNamespace(code="P3", oe_numbers="3HB2790 | 84-1"),
+    ])
+    return index
+
+
+def test_normalize_oe_number():
+    assert normalize_oe_number("cl 667.251/1") == normalize_oe_number("CL6672511") == "CL6672511"
+
+
+def test_part_number_key_only_for_bare_part_numbers():
+    assert part_number_key("CL 667.251-1") == "CL6672511"
+    assert part_number_key("3HB2700") == "3HB2700"
+    assert part_number_key("DUNLOP 3HB2700") is None
+    assert part_number_key("remen za kombajn") is None
+    assert part_number_key("12") is None
+
+
+def test_lookup_answers_exact_part_numbers_only():
+    index = build_index()
+    assert index.lookup("cl667251/1") == ["P1"]
+    assert index.lookup("3HB 2700") == ["P1"]
+    assert index.lookup("DUNLOP 3HB2700") == []
+    # A prefix is not an answer
+    assert index.lookup("3HB27") == []
+
+
+def test_candidates_from_tokens_and_prefixes():
+    index = build_index()
+    assert index.candidates("DUNLOP 3HB2700") == ["P1"]
+    assert sorted(index.candidates("remen 3HB27")) == ["P1", "P2", "P3"]
+    assert index.candidates("3HB27", limit=1) == ["P1"]
+    assert index.candidates("remen za kombajn") == []
@@ -0,0 +1,40 @@
+from utils.context_builder import count_tokens
+from utils.passages import split_into_passages, split_sentences
+
+
+def test_split_sentences():
+    assert split_sentences("Prva recenica. Druga!\nTreca bez tacke") == ["Prva recenica.", "Druga!", "Treca bez tacke"]
+    assert split_sentences("") == []
+
+
+def test_passages_keep_whole_sentences_and_overlap():
+    sentences = [f"Recenica broj {i} o dostavi robe kupcima." for i in range(30)]
+    passages = split_into_passages(" ".join(sentences), max_tokens=50, overlap_tokens=12)
+
+    assert len(passages) > 1
+    for passage in passages:
+        assert passage["token_count"] <= 50
+        assert passage["char_count"] == len(passage["text"])
+        assert passage["text"].endswith(".")
+    # The last sentence of a passage opens the next one
+    for previous, following in zip(passages, passages[1:]):
+        last_sentence = split_sentences(previous["text"])[-1]
+        assert following["text"].startswith(last_sentence)
+    assert "Recenica broj 29" in passages[-1]["text"]
+
+
+def test_long_sentence_is_split_at_word_boundaries():
+    words = [f"rec{i}" for i in range(600)]
+    passages = split_into_passages(" ".join(words) + ". Kratka recenica.", max_tokens=50, overlap_tokens=10)
+
+    assert len(passages) > 5
+    assert all(count_tokens(passage["text"]) <= 50 for passage in passages)
+    text = " ".join(passage["text"] for passage in passages)
+    assert set(words) <= set(text.replace(".", "").split())
+
+
+def test_short_text_is_one_passage():
+    passages = split_into_passages("Dostava je besplatna. Placanje pouzecem.", max_tokens=200, overlap_tokens=40)
+    assert [passage["text"] for passage in passages] == ["Dostava je besplatna. Placanje pouzecem."]
+    assert passages[0]["sentence_count"] == 2
+    assert split_into_passages(None) == []
@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from utils.product_filters import AttributeIndex, parse_price, split_categories
+
+
+@pytest.mark.parametrize("price, expected", [
+    ("3422.22 RSD", 3422.22),
+    ("3.422,22 RSD", 3422.22),
+    ("3,422.22", 3422.22),
+    ("5.000 RSD", 5000.0),
+    ("1,500", 1500.0),
+    ("12,5", 12.5),
+    ("1.234.567", 1234567.0),
+    ("", None),
+    (None, None),
+    ("na upit", None),
+])
+def test_parse_price(price, expected):
+    assert parse_price(price) == expected
+
+
+def test_split_categories():
+    assert split_categories("Remenje > Klinasti") == ["remenje", "klinasti"]
+    assert split_categories(None) == []
+
+
+def build_index():
+    index = AttributeIndex()
+    index.build([
+        SimpleNamespace(code="1", brand="DUNLOP", categories="Remenje > Klinasti", price="1.200,00 RSD"),
+        SimpleNamespace(code="2", brand="Dunlop ", categories="Remenje", price="5.000 RSD"),
+        SimpleNamespace(code="3", brand="SKF", categories="Lezajevi", price="800 RSD"),
+        SimpleNamespace(code="4", brand=None, categories=None, price=None),
+    ])
+    return index
+
+
+def test_select_by_brand_category_and_price():
+    index = build_index()
+    assert index.select(None) is None
+    assert index.select({"brand": "dunlop"}) == {"1", "2"}
+    assert index.select({"brand": ["skf", "dunlop"], "category": "klinasti"}) == {"1"}
+    assert index.select({"min_price": 1000}) == {"1", "2"}
+    assert index.select({"max_price": "1200"}) == {"1", "3"}
+    assert index.select({"brand": "dunlop", "max_price": 1000}) == set()
+
+
+@pytest.mark.parametrize("filters", ["dunlop", {"color": "red"}, {"min_price": "jeftino"}])
+def test_select_rejects_malformed_filters(filters):
+    with pytest.raises(ValueError):
+        build_index().select(filters)
+
+
+@pytest.mark.parametrize("user_query", [
+    {"query": "remen", "filters": {"color": "red"}},
+    {"query": "remen", "filters": {"max_price": "jeftino"}},
+    {"query": "remen", "mode": "fuzzy"},
+    {"query": "dostava", "summary": "sometimes"},
+    {"query": ""},
+])
+def test_ragchat_rejects_bad_requests_with_400(db, user_query):
+    from routes.rag_query_endpoint import answer_rag_query
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(answer_rag_query(user_query, db, "tests"))
+    assert error.value.status_code == 400
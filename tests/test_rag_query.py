@@ -0,0 +1,108 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import description_faiss_index
+from faiss_store import FaissStore
+from models import Information, InformationEmbeddings, Products
+
+
+async def collect(pieces):
+    return "".join([piece async for piece in pieces])
+
+
+@pytest.fixture
+def orphan_information_index(db, embedder, tmp_path, monkeypatch):
+    """
+    A description index whose only page has been deleted from the information table,
+    so a general question finds no information.
+    """
+    db.add(InformationEmbeddings(code="99", embedding=embedder.encode("dostava robe").astype(np.float32).tobytes()))
+    db.commit()
+    store = FaissStore(str(tmp_path / "description.faiss"), InformationEmbeddings, name="tests")
+    store.build(db)
+    monkeypatch.setattr(description_faiss_index, "store", store)
+    return store
+
+
+def test_streamed_general_question_without_information(db, embedding_model, orphan_information_index):
+    from routes.rag_query_endpoint import answer_rag_query
+    from routes.semantic_search import NO_INFORMATION_ANSWER
+
+    answer, reply = asyncio.run(answer_rag_query({"query": "kako funkcionise dostava"}, db, "no-information",
+                                                 stream=True))
+    assert answer is None
+    assert asyncio.run(collect(reply)) == NO_INFORMATION_ANSWER
+
+
+def test_general_question_without_information(db, embedding_model, orphan_information_index):
+    from routes.semantic_search import semantic_search_description, NO_INFORMATION_ANSWER
+
+    answer = asyncio.run(semantic_search_description({"query": "dostava"}, db))
+    assert answer == [NO_INFORMATION_ANSWER]
+
+
+def test_general_question_is_summarized(db, embedding_model, orphan_information_index):
+    from routes.semantic_search import semantic_search_description
+
+    db.add(Information(code=99, naslov="Dostava", opis="Dostava traje dva dana. Isporuka je besplatna."))
+    db.commit()
+    answer = asyncio.run(semantic_search_description({"query": "dostava"}, db))
+    assert answer == {"Ovo je skraceni odgovor asistenta."}
+
+
+def test_product_answer_comes_with_the_reply(db, embedding_model):
+    from routes.rag_query_endpoint import rag_chat
+    from utils.product_lookup import product_lookup
+
+    db.add(Products(code="R-1", name="Klinasti remen za kombajn", brand="DUNLOP", price="1.200 RSD"))
+    db.commit()
+    product_lookup.build(db)
+
+    response = asyncio.run(rag_chat({"query": "remen za kombajn", "mode": "lexical"}, db))
+    assert [product["code"] for product in response["answer"]] == ["R-1"]
+    assert response["reply"] == "Ovo je skraceni odgovor asistenta."
+
+
+def test_cached_product_answer_still_gets_a_reply(db, embedding_model, monkeypatch):
+    from routes import rag_query_endpoint
+    from utils.answer_cache import SemanticAnswerCache
+    from utils.product_lookup import product_lookup
+
+    cache = SemanticAnswerCache(max_size=10)
+    monkeypatch.setattr(rag_query_endpoint, "answer_cache", cache)
+    db.add(Products(code="R-1", name="Klinasti remen za kombajn", brand="DUNLOP", price="1.200 RSD"))
+    db.commit()
+    product_lookup.build(db)
+    query = {"query": "remen za kombajn", "mode": "lexical"}
+
+    first = asyncio.run(rag_query_endpoint.rag_chat(dict(query), db))
+    answer, reply = asyncio.run(rag_query_endpoint.answer_rag_query(dict(query), db, "cached", stream=True))
+    assert cache.stats()["hits"] == 1
+    assert answer == first["answer"]
+    assert asyncio.run(collect(reply)) == "Ovo je skraceni odgovor asistenta."
+
+
+def test_cached_general_answer_depends_on_the_summary_mode(db, embedding_model, orphan_information_index,
+                                                          monkeypatch):
+    from datetime import datetime, timezone
+    from models import InformationSummaries
+    from routes import rag_query_endpoint
+    from utils.answer_cache import SemanticAnswerCache
+    from utils.information_summaries import page_hash
+
+    monkeypatch.setattr(rag_query_endpoint, "answer_cache", SemanticAnswerCache(max_size=10))
+    naslov, opis = "Dostava", "Dostava traje dva dana."
+    db.add(Information(code=99, naslov=naslov, opis=opis))
+    db.add(InformationSummaries(code=99, summary="Sacuvan sazetak.", content_hash=page_hash(naslov, opis),
+                                created_at=datetime.now(timezone.utc)))
+    db.commit()
+
+    def ask(summary):
+        query = {"query": "kako funkcionise dostava", "summary": summary}
+        return asyncio.run(rag_query_endpoint.answer_rag_query(query, db, "summary-mode"))[0]
+
+    assert ask("stored") == {"Sacuvan sazetak."}
+    assert ask("live") == {"Ovo je skraceni odgovor asistenta."}
+    assert ask("stored") == {"Sacuvan sazetak."}
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+from utils.metrics import register_cache
+
+load_dotenv()
+
+# Answers of past /ragchat queries, reused for new queries at least this similar (cosine)
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))  # 0 disables the cache
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+# Nearest cached queries checked for one with the same search options
+CANDIDATES = 5
+
+
+class SemanticAnswerCache:
+    """
+    Past queries' embeddings in a small inner-product FAISS index, with the classification,
+    keywords and answer produced for each. Cleared whenever the catalog it was built on changes.
+    """
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl_seconds
+        self.index = None
+        self.entries = OrderedDict()  # id -> entry, oldest first
+        self.catalog_version = None
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(vector)
+        return vector
+
+    def check_catalog(self, catalog_version):
+        """
+        Drop every entry when the catalog version differs from the one the entries were made with.
+        """
+        with self.lock:
+            if catalog_version == self.catalog_version:
+                return
+            if self.entries:
+                self.invalidations += 1
+                print(f"Catalog changed, clearing {len(self.entries)} cached answers.")
+            self.index = None
+            self.entries.clear()
+            self.catalog_version = catalog_version
+
+    def lookup(self, embedding, options=None):
+        """
+        The cached entry of the most similar past query made with the same options, if it is
+        similar enough, otherwise None.
+        """
+        if self.max_size <= 0:
+            return None
+        vector = self._normalize(embedding)
+        with self.lock:
+            if self.index is not None and self.index.ntotal:
+                similarities, ids = self.index.search(vector, min(CANDIDATES, self.index.ntotal))
+                now = time.monotonic()
+                for similarity, id_ in zip(similarities[0], ids[0]):
+                    if similarity < self.threshold:
+                        break
+                    entry = self.entries.get(int(id_))
+                    if entry is None or entry["options"] != options:
+                        continue
+                    if self.ttl and now - entry["stored_at"] > self.ttl:
+                        self._remove([int(id_)])
+                        continue
+                    self.hits += 1
+                    return {**entry, "similarity": float(similarity)}
+            self.misses += 1
+            return None
+
+    def store(self, embedding, query: str, options=None, **values):
+        """
+        Remember the result of a query (classification, keywords, answer, ...).
+        """
+        if self.max_size <= 0:
+            return
+        vector = self._normalize(embedding)
+        with self.lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            id_ = self.next_id
+            self.next_id += 1
+            self.index.add_with_ids(vector, np.array([id_], dtype=np.int64))
+            self.entries[id_] = {"query": query, "options": options, "stored_at": time.monotonic(), **values}
+            if len(self.entries) > self.max_size:
+                self._remove(list(self.entries)[:len(self.entries) - self.max_size])
+
+    def _remove(self, ids):
+        self.index.remove_ids(np.array(ids, dtype=np.int64))
+        for id_ in ids:
+            self.entries.pop(id_, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+answer_cache = SemanticAnswerCache()
+register_cache("ragchat_answers", answer_cache)
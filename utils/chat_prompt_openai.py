@@ -1,127 +1,147 @@
-from openai import OpenAI
 from dotenv import load_dotenv
 import os
+import json
+from utils.product_filters import parse_price
+from utils.llm_backends import OPENAI_MODEL, complete_task, stream_task
+from utils.context_builder import select_passages, truncate_tokens, SUMMARY_MAX_TOKENS
 
 load_dotenv()
 
-MODEL = "gpt-4o-mini"
+MODEL = OPENAI_MODEL
 KEY = os.getenv("OPEN_AI_KEY")
 ORG = os.getenv("ORG")
 PROJECT = os.getenv("PROJECT")
 os.environ["OPENAI_API_KEY"] = os.getenv("OPEN_AI_KEY")
 
-client = OpenAI()
 
 
-
-def extract_chat_message(response):
-    try:
-        return response.choices[0].message.content
-    except (AttributeError, IndexError):
-        return None
-
-def chat_prompt_openai(query):
-    completion = client.chat.completions.create(
-    model=MODEL,
-    messages=[
+# Each prompt runs on the backend configured for its task in utils/llm_backends.py
+async def chat_prompt_openai(query, task: str = "answer"):
+    message = await complete_task(task, [
         {"role": "user", "content": query}
-             ]
-            )
-    message = extract_chat_message(completion)
+             ])
     return message
 
 
-def chat_with_context(conversation):
-    completion = client.chat.completions.create(
-    model=MODEL,
-    messages=conversation
-            )
-    message = extract_chat_message(completion)
+async def chat_with_context(conversation):
+    message = await complete_task("answer", conversation)
     return message
 
 
+def stream_chat_prompt_openai(query, task: str = "answer"):
+    """
+    The answer to the prompt as an async iterator of text pieces, as they arrive.
+    """
+    return stream_task(task, [{"role": "user", "content": query}])
+
+
+def stream_chat_with_context(conversation):
+    return stream_task("answer", conversation)
+
+
 ########### AI PROMPTS WITH TEMPLATES ############
 
-def get_keywords_with_openai(query: str):
+async def get_keywords_with_openai(query: str):
     # print(query)
     query_keywords = (f"Get me the keywords for an SQL query from this question: {query}. Just return a simple list of keywords divided by commas.")
-    response = chat_prompt_openai(query_keywords)
+    response = await chat_prompt_openai(query_keywords, task="keywords")
     #print(response)
     return response
 
-def answer_tamplate(query: str, context: str):
+async def answer_tamplate(query: str, context: str):
     response = (f"Format these query results to resembles a list a search rusults for this query answered by a sales assistent: {query}. This was the users query: {context}")
-    answer = chat_prompt_openai(response)
+    answer = await chat_prompt_openai(response)
     return answer
 
-def get_type_of_query(query: str):
+async def get_type_of_query(query: str):
     query_type = (f" You are a helpfull assistant that categorizes a sentence. You are given a sentence and you need to categorize which category it belongs to. Is it Product related, Or general information related.Output only the category, Product or General this is the sentence: {query}")
-    answer = chat_prompt_openai(query_type)
+    answer = await chat_prompt_openai(query_type, task="classify")
     #print(answer)
     return answer
 
-def complete_answer_with_context(context: str):
+QUERY_TYPES = ("Product", "General")
+UNDERSTANDING_FILTERS = ("brand", "category", "min_price", "max_price")
+
+
+def understanding_prompt(query: str):
+    return (
+        "You are a helpfull assistant of a shop selling agricultural machine parts. "
+        "Analyse the customer's question and return a JSON object with these fields: "
+        "\"type\": \"Product\" if it asks about products, \"General\" if it asks for general information "
+        "(delivery, payment, returns, ...); "
+        "\"keywords\": list of keywords for searching the catalog; "
+        "\"filters\": object with only the constraints the question states, out of "
+        "\"brand\", \"category\", \"min_price\" and \"max_price\" (prices in RSD as numbers). "
+        f"Return only the JSON object. The question: {query}"
+    )
+
+
+def parse_understanding(content):
+    """
+    Validate the JSON answer of the query understanding prompt, None if it is unusable.
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    query_type = str(data.get("type", "")).strip().capitalize()
+    keywords = data.get("keywords")
+    if isinstance(keywords, str):
+        keywords = keywords.split(",")
+    if query_type not in QUERY_TYPES or not isinstance(keywords, list):
+        return None
+    filters = {}
+    for key, value in (data.get("filters") if isinstance(data.get("filters"), dict) else {}).items():
+        if key in ("min_price", "max_price"):
+            value = parse_price(value)
+        if key in UNDERSTANDING_FILTERS and value not in (None, "", []):
+            filters[key] = value
+    return {
+        "type": query_type,
+        "keywords": [str(keyword).strip() for keyword in keywords if str(keyword).strip()],
+        "filters": filters,
+    }
+
+
+async def understand_query(query: str):
+    """
+    Query type, keywords and filters from a single JSON-mode completion.
+    Returns None when the call fails or the answer is unusable, so callers can fall back to
+    get_type_of_query and get_keywords_with_openai.
+    """
+    try:
+        content = await complete_task("classify", [{"role": "user", "content": understanding_prompt(query)}], json_mode=True)
+    except Exception as e:
+        print(f"Query understanding failed: {e}")
+        return None
+    understanding = parse_understanding(content)
+    if understanding is None:
+        print("Query understanding returned an unusable answer.")
+    return understanding
+
+async def complete_answer_with_context(context: str):
     complete_answer = (f"Format this list of products {context} in serbian language so i can display them as a search result ")
-    answer = chat_prompt_openai(complete_answer)
+    answer = await chat_prompt_openai(complete_answer)
     return answer
 
-def summerize_answer(query, chunk_to_summerize):
-    response_to_summerize = (f"Skrati mi tekst u nekoliko recenica i izvuci sustinu na osnovu ovog pitanja {query} .Ceo tekst :{chunk_to_summerize}")
-    summerized_response = chat_prompt_openai(response_to_summerize)
+def summerize_prompt(query, chunk_to_summerize):
+    # Long texts are cut down to the passages closest to the question, within SUMMARY_CONTEXT_TOKENS
+    chunk_to_summerize = select_passages(query, chunk_to_summerize)
+    return (f"Skrati mi tekst u nekoliko recenica i izvuci sustinu na osnovu ovog pitanja {query} .Ceo tekst :{chunk_to_summerize}")
+
+async def summerize_answer(query, chunk_to_summerize):
+    summerized_response = await chat_prompt_openai(summerize_prompt(query, chunk_to_summerize), task="summarize")
     return summerized_response
 
+async def summerize_page(naslov, opis, max_tokens: int = SUMMARY_MAX_TOKENS):
+    """
+    Short summary of a whole information page, made ahead of time and served for any question about it.
+    """
+    page_to_summerize = (f"Skrati mi tekst u nekoliko recenica i izvuci sustinu koja je kupcima najvaznija. "
+                         f"Naslov: {naslov} .Ceo tekst :{truncate_tokens(opis, max_tokens)}")
+    return await chat_prompt_openai(page_to_summerize, task="summarize")
 
-# messages = [
-#   {"role": "system", "content": "You are a helpful assistant."},
-#   {"role": "user","content": "remenik za kombajn"}
-# ]
-
-messages2 = [
-  {
-    "role": "user",
-    "content": "remenik za kombajn"
-  },
-  {
-    "role": "system",
-    "answer": [
-      {
-        "code": "1006319",
-        "name": "3HB2700 La \"DUNLOP\"",
-        "product URL": "https://www.agrimar.rs/3hb2700-la-dunlop_1006319/",
-        "description": "SPOJENI  KLINASTI  REMEN",
-        "price": "3422.22 RSD"
-      },
-      {
-        "code": "1006334",
-        "name": "3HC2730 La \"DUNLOP\"",
-        "product URL": "https://www.agrimar.rs/3hc2730-la-dunlop_1006334/",
-        "description": "SPOJENI  KLINASTI  REMEN",
-        "price": "5697.31 RSD"
-      },
-      {
-        "code": "1006336",
-        "name": "3HC4200 La \"DUNLOP\"",
-        "product URL": "https://www.agrimar.rs/3hc4200-la-dunlop_1006336/",
-        "description": "SPOJENI  KLINASTI  REMEN",
-        "price": "8765.09 RSD"
-      },
-      {
-        "code": "1006987",
-        "name": "2HB2440 La \"DUNLOP\" (CL 667251.1)",
-        "product URL": "https://www.agrimar.rs/2hb2440-la-dunlop-cl-6672511_1006987/",
-        "description": "SPOJENI  KLINASTI REMEN",
-        "price": "1996.21 RSD"
-      },
-      {
-        "code": "1011345",
-        "name": "zakovica JUS MB3 011 6x16",
-        "product URL": "https://www.agrimar.rs/zakovica-jus-mb3-011-6x16_1011345/",
-        "description": "ZA KOMBAJN",
-        "price": "2.84 RSD"
-      }
-    ]
-  }
-]
-
-answer = chat_with_context(messages2)
-print(answer)
\ No newline at end of file
+def stream_summerize_answer(query, chunk_to_summerize):
+    return stream_chat_prompt_openai(summerize_prompt(query, chunk_to_summerize), task="summarize")
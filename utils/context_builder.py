@@ -0,0 +1,155 @@
+import os
+import re
+import threading
+from dotenv import load_dotenv
+
+from utils.lexical_index import tokenize
+from utils.metrics import get_histogram
+
+load_dotenv()
+
+# Model whose tokenizer counts the tokens; without tiktoken (or its encoding files) tokens are estimated
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "gpt-4o-mini")
+# Tokens of the information text sent to be summarized
+SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "1500"))
+# Tokens of a whole information page summarized ahead of time, by the upload and by precompute_summaries.py
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "4000"))
+# Tokens of a product description kept in the conversation
+PRODUCT_DESCRIPTION_TOKENS = int(os.getenv("PRODUCT_DESCRIPTION_TOKENS", "60"))
+
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+# Tokens added per chat message and to prime the reply, as counted by OpenAI
+MESSAGE_OVERHEAD_TOKENS = 3
+REPLY_OVERHEAD_TOKENS = 3
+
+# Words are compared by their first letters, so inflected forms ("dostava", "dostavi") match
+STEM_LENGTH = 5
+PASSAGE_SEPARATORS = re.compile(r"\n\s*\n|\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    tiktoken encoding of TOKENIZER_MODEL, None when it is not available.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+                except Exception as e:
+                    print(f"Tokenizer of {TOKENIZER_MODEL} not available ({type(e).__name__}), estimating token counts.")
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str):
+    text = text or ""
+    encoding = get_encoding()
+    if encoding is None:
+        # Roughly four characters per token
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages):
+    """
+    Prompt tokens of a list of chat messages.
+    """
+    return sum(count_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+               for message in messages) + REPLY_OVERHEAD_TOKENS
+
+
+def truncate_tokens(text: str, max_tokens: int):
+    """
+    The text cut down to at most max_tokens, at a word boundary, with "..." when shortened.
+    """
+    text = text or ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is None:
+        cut = text[:max_tokens * 4]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return cut.rsplit(" ", 1)[0].rstrip(" ,.;:") + "..."
+
+
+def compact_products(products, description_tokens: int = PRODUCT_DESCRIPTION_TOKENS):
+    """
+    Product results as one short line each, with the fields a reply needs.
+    """
+    lines = []
+    for product in products:
+        line = f"- {product.get('name') or ''} (code {product.get('code')})"
+        if product.get("price"):
+            line += f", price {product['price']}"
+        description = " ".join(str(product.get("description") or "").split())
+        if description and description_tokens > 0:
+            line += f": {truncate_tokens(description, description_tokens)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def stems(text: str):
+    return {token[:STEM_LENGTH] for token in tokenize(text) if len(token) > 2}
+
+
+def is_product_list(answer):
+    return isinstance(answer, list) and answer and all(isinstance(item, dict) and "code" in item for item in answer)
+
+
+def split_passages(text: str):
+    """
+    Paragraphs of the text, long paragraphs split further into sentences.
+    """
+    passages = []
+    for paragraph in PASSAGE_SEPARATORS.split(text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) > SUMMARY_CONTEXT_TOKENS // 4:
+            passages.extend(sentence for sentence in SENTENCE_END.split(paragraph) if sentence)
+        else:
+            passages.append(paragraph)
+    return passages
+
+
+def select_passages(query: str, text: str, max_tokens: int = SUMMARY_CONTEXT_TOKENS):
+    """
+    The text if it fits max_tokens, otherwise the passages sharing the most words with the
+    query that fit together, in their original order.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    query_terms = stems(query)
+    passages = split_passages(text)
+    scored = sorted(range(len(passages)),
+                    key=lambda position: (-len(query_terms & stems(passages[position])), position))
+    selected = []
+    used = 0
+    for position in scored:
+        tokens = count_tokens(passages[position])
+        if used + tokens > max_tokens:
+            continue
+        selected.append(position)
+        used += tokens
+    if not selected:
+        return truncate_tokens(passages[scored[0]], max_tokens) if passages else ""
+    return "\n".join(passages[position] for position in sorted(selected))
+
+
+def record_prompt_tokens(task: str, messages):
+    """
+    Count the prompt tokens of an LLM call into the llm_prompt_tokens.<task> histogram.
+    """
+    tokens = count_message_tokens(messages)
+    get_histogram(f"llm_prompt_tokens.{task}", TOKEN_BUCKETS).observe(tokens)
+    return tokens
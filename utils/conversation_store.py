@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from sqlalchemy import func
+
+from utils.metrics import register_cache
+from utils.context_builder import count_tokens, compact_products, is_product_list, MESSAGE_OVERHEAD_TOKENS
+
+load_dotenv()
+
+# "memory" keeps conversations in this worker; "database" shares them between workers
+# through the conversation_messages table
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory")
+# Messages of a session sent with a completion: at most this many, within this many tokens
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "12"))
+CONVERSATION_MAX_TOKENS = int(os.getenv("CONVERSATION_MAX_TOKENS", "3000"))
+# Sessions idle for longer are dropped, by both backends. The memory backend also keeps at most
+# CONVERSATION_MAX_SESSIONS, dropping the least recently used; the database one has no such limit
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000"))
+CONVERSATION_TTL_SECONDS = float(os.getenv("CONVERSATION_TTL_SECONDS", "3600"))
+# How often the database backend deletes the messages of idle sessions
+CONVERSATION_PRUNE_INTERVAL_SECONDS = float(os.getenv("CONVERSATION_PRUNE_INTERVAL_SECONDS", "60"))
+
+
+def message_content(answer):
+    """
+    Text of an answer (products, a summary, ...) as it goes into the conversation, products
+    compacted to one line each.
+    """
+    if isinstance(answer, str):
+        return answer
+    if is_product_list(answer):
+        return compact_products(answer)
+    return json.dumps(answer, ensure_ascii=False, default=list)
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def recent_window(messages, max_messages: int, max_tokens: int):
+    """
+    The latest messages that fit both limits, oldest first. The last message is always included.
+    """
+    window = []
+    tokens = 0
+    for message in reversed(messages):
+        tokens += count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+        if window and (len(window) >= max_messages or tokens > max_tokens):
+            break
+        window.append({"role": message["role"], "content": message["content"]})
+    window.reverse()
+    return window
+
+
+class ConversationStore:
+    """
+    Messages of each chat session in memory, the last max_messages per session, with
+    least-recently-used eviction of sessions beyond max_sessions or idle for ttl_seconds.
+    """
+    def __init__(self, max_messages: int = CONVERSATION_MAX_MESSAGES, max_tokens: int = CONVERSATION_MAX_TOKENS,
+                 max_sessions: int = CONVERSATION_MAX_SESSIONS, ttl_seconds: float = CONVERSATION_TTL_SECONDS):
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.max_sessions = max_sessions
+        self.ttl = ttl_seconds
+        self.sessions = OrderedDict()  # session id -> (last used, messages), least recently used first
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def _evict(self, now: float):
+        while self.sessions:
+            session_id, (last_used, _) = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and not (self.ttl and now - last_used > self.ttl):
+                break
+            del self.sessions[session_id]
+            self.evictions += 1
+
+    def append(self, session_id: str, role: str, content: str):
+        now = time.monotonic()
+        message = {"role": role, "content": content, "session_id": session_id,
+                   "created_at": datetime.now(timezone.utc).isoformat()}
+        with self.lock:
+            _, messages = self.sessions.pop(session_id, (None, None))
+            if messages is None:
+                messages = deque(maxlen=self.max_messages)
+            messages.append(message)
+            self.sessions[session_id] = (now, messages)
+            self._evict(now)
+
+    def window(self, session_id: str):
+        """
+        The session's recent messages as chat messages ({"role", "content"}), oldest first.
+        """
+        with self.lock:
+            _, messages = self.sessions.get(session_id, (None, ()))
+            messages = list(messages)
+        return recent_window(messages, self.max_messages, self.max_tokens)
+
+    def history(self, session_id: str = None, offset: int = 0, limit: int = 50):
+        """
+        Stored messages of one session or of all of them, oldest first. Returns (total, page).
+        """
+        with self.lock:
+            if session_id is not None:
+                messages = list(self.sessions.get(session_id, (None, ()))[1])
+            else:
+                messages = sorted((message for _, session in self.sessions.values() for message in session),
+                                  key=lambda message: message["created_at"])
+        return len(messages), messages[offset:offset + limit]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self.sessions),
+                "max_sessions": self.max_sessions,
+                "messages": sum(len(messages) for _, messages in self.sessions.values()),
+                "evictions": self.evictions,
+            }
+
+
+class DatabaseConversationStore(ConversationStore):
+    """
+    Messages of each chat session in the conversation_messages table, so every worker sees the
+    same conversations. The history stays in the table until the session has been idle for
+    ttl_seconds; completions only get the window. max_sessions does not apply here.
+    """
+    def __init__(self, session_factory=None, prune_interval: float = CONVERSATION_PRUNE_INTERVAL_SECONDS, **kwargs):
+        super().__init__(**kwargs)
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.prune_interval = prune_interval
+        self.last_pruned = None
+
+    def _prune(self, db):
+        """
+        Delete the messages of sessions idle for longer than the TTL, at most once per prune_interval.
+        """
+        from models import ConversationMessages
+
+        now = time.monotonic()
+        if not self.ttl or (self.last_pruned is not None and now - self.last_pruned < self.prune_interval):
+            return
+        self.last_pruned = now
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        idle = (db.query(ConversationMessages.session_id)
+                .group_by(ConversationMessages.session_id)
+                .having(func.max(ConversationMessages.created_at) < cutoff))
+        deleted = (db.query(ConversationMessages)
+                   .filter(ConversationMessages.session_id.in_(idle.scalar_subquery()))
+                   .delete(synchronize_session=False))
+        if deleted:
+            self.evictions += deleted
+            print(f"Deleted {deleted} messages of idle conversations.")
+
+    def append(self, session_id: str, role: str, content: str):
+        from models import ConversationMessages
+
+        db = self.session_factory()
+        try:
+            db.add(ConversationMessages(session_id=session_id, role=role, content=content,
+                                        created_at=datetime.now(timezone.utc)))
+            db.flush()
+            self._prune(db)
+            db.commit()
+        finally:
+            db.close()
+
+    def window(self, session_id: str):
+        from models import ConversationMessages
+
+        db = self.session_factory()
+        try:
+            rows = (db.query(ConversationMessages)
+                    .filter(ConversationMessages.session_id == session_id)
+                    .order_by(ConversationMessages.id.desc())
+                    .limit(self.max_messages)
+                    .all())
+        finally:
+            db.close()
+        messages = [{"role": row.role, "content": row.content} for row in reversed(rows)]
+        return recent_window(messages, self.max_messages, self.max_tokens)
+
+    def history(self, session_id: str = None, offset: int = 0, limit: int = 50):
+        from models import ConversationMessages
+
+        db = self.session_factory()
+        try:
+            query = db.query(ConversationMessages)
+            if session_id is not None:
+                query = query.filter(ConversationMessages.session_id == session_id)
+            total = query.with_entities(func.count(ConversationMessages.id)).scalar()
+            rows = query.order_by(ConversationMessages.id).offset(offset).limit(limit).all()
+        finally:
+            db.close()
+        return total, [{
+            "role": row.role,
+            "content": row.content,
+            "session_id": row.session_id,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+        } for row in rows]
+
+    def stats(self):
+        from models import ConversationMessages
+
+        db = self.session_factory()
+        try:
+            sessions, messages = db.query(func.count(func.distinct(ConversationMessages.session_id)),
+                                          func.count(ConversationMessages.id)).one()
+        finally:
+            db.close()
+        return {
+            "backend": "database",
+            "sessions": sessions,
+            "messages": messages,
+            "ttl_seconds": self.ttl,
+            "deleted_messages": self.evictions,
+        }
+
+
+if CONVERSATION_BACKEND not in ("memory", "database"):
+    raise ValueError(f"Unknown conversation backend {CONVERSATION_BACKEND}, expected memory or database.")
+conversation_store = DatabaseConversationStore() if CONVERSATION_BACKEND == "database" else ConversationStore()
+register_cache("conversations", conversation_store)
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+
+from utils.model_registry import get_embedding_model
+from utils.metrics import get_histogram, register_cache
+from utils.lru_cache import LRUCache
+
+load_dotenv()
+
+# Queries arriving within this window (or until the batch is full) are encoded together
+BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500)
+
+# Embeddings of recent queries, keyed on the normalized query text (size 0 disables the cache)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+
+
+class EmbeddingBatcher:
+    """
+    Collects single-query encode requests from concurrent handlers and runs them
+    through the embedding model as one batch on a worker thread.
+    """
+    def __init__(self, max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = get_histogram("embedding_batch_size", BATCH_SIZE_BUCKETS)
+        self.wait_times = get_histogram("embedding_batch_wait_ms", WAIT_MS_BUCKETS)
+        # A single thread keeps forward passes from competing with each other for the CPU
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-batcher")
+        self._loop = None
+        self._worker = None
+        self._pending = []  # (text, future, enqueued_at)
+        self._has_items = None
+        self._batch_full = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._pending = []
+            self._has_items = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def encode(self, text: str):
+        """
+        Embedding of a single text, encoded together with whatever else is queued.
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._has_items.wait()
+
+            # Give other requests until the oldest one has waited max_wait to join the batch
+            remaining = self.max_wait - (time.perf_counter() - self._pending[0][2])
+            if remaining > 0 and len(self._pending) < self.max_batch_size:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if not self._pending:
+                self._has_items.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._batch_full.clear()
+
+            await self._encode_batch(batch)
+
+    async def _encode_batch(self, batch):
+        started = time.perf_counter()
+        self.batch_sizes.observe(len(batch))
+        for _, _, enqueued_at in batch:
+            self.wait_times.observe((started - enqueued_at) * 1000)
+
+        # Identical queries arriving together are encoded once
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            embeddings = await self._loop.run_in_executor(self._executor, self._encode, texts)
+        except Exception as e:
+            print(f"Error encoding batch of {len(texts)} queries: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, embeddings))
+        for text, future, _ in batch:
+            if not future.done():  # the caller may have been cancelled meanwhile
+                future.set_result(by_text[text])
+
+    @staticmethod
+    def _encode(texts):
+        return get_embedding_model().encode(texts, batch_size=len(texts)).astype(np.float32)
+
+
+embedding_batcher = EmbeddingBatcher()
+query_embedding_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS)
+register_cache("query_embeddings", query_embedding_cache)
+
+
+def normalize_query(text: str):
+    """
+    "Remenik  za kombajn?" and "remenik za kombajn" are the same query.
+    """
+    text = " ".join(unicodedata.normalize("NFKC", str(text)).casefold().split())
+    return text.strip(" ?!.,;:")
+
+
+async def embed_query(text: str):
+    """
+    Query embedding shaped (1, dim), ready for a FAISS search. Repeated queries are served
+    from the cache shared by all the search endpoints.
+    """
+    key = normalize_query(text) or str(text)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = await embedding_batcher.encode(key)
+        embedding.setflags(write=False)  # shared between requests from now on
+        query_embedding_cache.put(key, embedding)
+    return embedding.reshape(1, -1)
@@ -1,24 +1,37 @@
+import os
+import time
+import hashlib
 import numpy as np
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer
 from sqlalchemy.exc import SQLAlchemyError
+from models import EmbeddingState
+from utils.model_registry import get_embedding_model, EMBEDDING_MODEL_NAME
 
-import torch
+# Rows fetched and committed together, and texts per forward pass
+CHUNK_SIZE = int(os.getenv("EMBEDDING_CHUNK_SIZE", "1000"))
+ENCODE_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
 
-# Device setup
-device = torch.device("mps" if torch.backends.mps.is_available() else "cpu")
-print(f"Using device: {device}")
+# Columns embedded by default for each source table
+EMBEDDING_COLUMNS = {
+    "products": ["name", "description", "options", "usage"],
+    "information": ["naslov", "opis"],
+}
+
+
+def content_hash(text: str):
+    """
+    Hash of a column text; includes the model name so switching models re-embeds everything.
+    """
+    return hashlib.sha256(f"{EMBEDDING_MODEL_NAME}\0{text}".encode("utf-8")).hexdigest()
 
-# Initialize tokenizer and model constants
-TOKENIZER = AutoTokenizer.from_pretrained("sentence-transformers/all-mpnet-base-v2")
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
-MAX_LENGTH = 512  # Max token length for truncation
 
 class EmbeddingProcessor:
-    def __init__(self, db: Session, embedding_model):
+    def __init__(self, db: Session, embedding_model, chunk_size: int = CHUNK_SIZE, batch_size: int = ENCODE_BATCH_SIZE):
         self.db = db
         self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
 
     def fetch_data(self, table_model, filter_conditions=None):
         """
@@ -35,84 +48,233 @@ class EmbeddingProcessor:
             print(f"Error fetching data: {e}")
             return []
 
+    def iter_chunks(self, table_model, filter_conditions=None):
+        """
+        Stream rows from the table in primary key order, chunk_size rows at a time.
+        Keyset pagination keeps working across the commits made between chunks.
+        """
+        key_column = inspect(table_model).primary_key[0]
+        last_key = None
+        while True:
+            query = self.db.query(table_model)
+            if filter_conditions:
+                query = query.filter(*filter_conditions)
+            if last_key is not None:
+                query = query.filter(key_column > last_key)
+            try:
+                rows = query.order_by(key_column).limit(self.chunk_size).all()
+            except SQLAlchemyError as e:
+                print(f"Error fetching data: {e}")
+                return
+            if not rows:
+                return
+            last_key = getattr(rows[-1], key_column.key)
+            yield rows
+
+    def generate_embeddings(self, texts):
+        """
+        Generate embeddings for a list of texts in one call.
+        Texts longer than the model's max_seq_length are truncated by the model itself.
+        """
+        embeddings = self.embedding_model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+        return embeddings.astype(np.float32)
+
     def generate_embedding(self, text: str):
         """
-        Generate embedding for a given text after tokenization and truncation.
+        Generate embedding for a single text.
         """
-        tokenized = TOKENIZER(text, truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
-        truncated_text = TOKENIZER.decode(tokenized["input_ids"][0], skip_special_tokens=True)
-        embedding_vector = self.embedding_model.encode(truncated_text)
-        return embedding_vector.astype(np.float32)
+        return self.generate_embeddings([text])[0]
 
-    def save_embeddings(self, rows, columns, target_table):
+    def one_vector_per_column(self, target_table):
         """
-        Generate and save embeddings for specified columns in the target table.
+        Tables keyed by an autoincrement id (separate_emb_table) hold one vector per column,
+        tables keyed by code hold a single vector per row built from all of its columns.
         """
-        for row in rows:
-            for col in columns:
-                text_data = str(getattr(row, col, "") or "").strip()
-                if not text_data:
-                    print(f"Row {row.code}, column {col} has no valid text data, skipping...")
-                    continue
+        return "id" in target_table.__table__.columns
 
-                try:
-                    embedding_vector = self.generate_embedding(text_data)
-                    new_embedding_entry = target_table(
-                        code=row.code,  # Associate embedding with the product
-                        embedding=embedding_vector.tobytes()
-                    )
-                    self.db.add(new_embedding_entry)
-                    print(f"Embedding generated and added for row {row.code}, column {col}.")
-                except Exception as e:
-                    print(f"Error generating/saving embedding for row {row.code}, column {col}: {e}")
-                    continue
+    def row_texts(self, row, columns):
+        """
+        Non-empty texts of the given columns, in column order.
+        """
+        texts = {}
+        for col in columns:
+            text_data = str(getattr(row, col, "") or "").strip()
+            if text_data:
+                texts[col] = text_data
+        return texts
+
+    def load_state(self, target_name, codes):
+        """
+        Stored content hashes of the given codes, as {code: {column: EmbeddingState}}.
+        """
+        state = {}
+        entries = self.db.query(EmbeddingState).filter(
+            EmbeddingState.target_table == target_name,
+            EmbeddingState.code.in_(codes),
+        ).all()
+        for entry in entries:
+            state.setdefault(entry.code, {})[entry.column_name] = entry
+        return state
+
+    def save_embeddings(self, rows, columns, target_table, stats):
+        """
+        Generate embeddings for the new or changed columns of a chunk of rows and commit them
+        to the target table. Counts and affected codes are accumulated in stats.
+        """
+        target_name = target_table.__tablename__
+        per_column = self.one_vector_per_column(target_table)
+        state = self.load_state(target_name, [str(row.code) for row in rows])
 
+        pending = []  # (code, text to embed, {column: content hash})
+        skipped = 0
+        changed_codes = set()
+        deleted_codes = set()
         try:
+            for row in rows:
+                code = str(row.code)
+                texts = self.row_texts(row, columns)
+                hashes = {col: content_hash(text) for col, text in texts.items()}
+                known = state.get(code, {})
+
+                changed_cols = [col for col in texts if col not in known or known[col].content_hash != hashes[col]]
+                removed_cols = [col for col in known if col not in texts]
+                if not changed_cols and not removed_cols:
+                    skipped += 1
+                    continue
+
+                if not known:
+                    # Embeddings written before content hashes were tracked
+                    self.db.query(target_table).filter(target_table.code == code).delete(synchronize_session=False)
+
+                if per_column:
+                    stale_ids = [known[col].embedding_id for col in changed_cols + removed_cols
+                                 if col in known and known[col].embedding_id is not None]
+                    if stale_ids:
+                        self.db.query(target_table).filter(target_table.id.in_(stale_ids)).delete(synchronize_session=False)
+                    for col in changed_cols:
+                        pending.append((code, texts[col], {col: hashes[col]}))
+                else:
+                    if known:
+                        self.db.query(target_table).filter(target_table.code == code).delete(synchronize_session=False)
+                    if texts:
+                        pending.append((code, "\n".join(texts.values()), hashes))
+
+                for col in removed_cols:
+                    self.db.delete(known[col])
+                if texts:
+                    changed_codes.add(code)
+                else:
+                    deleted_codes.add(code)
+
+            if pending:
+                embeddings = self.generate_embeddings([text for _, text, _ in pending])
+                new_entries = []
+                for (code, _, col_hashes), embedding_vector in zip(pending, embeddings):
+                    entry = target_table(code=code, embedding=embedding_vector.tobytes())
+                    self.db.add(entry)
+                    new_entries.append((entry, code, col_hashes))
+                self.db.flush()  # assigns ids in tables with one vector per column
+
+                for entry, code, col_hashes in new_entries:
+                    for col, hash_value in col_hashes.items():
+                        embedding_id = getattr(entry, "id", None)
+                        known_entry = state.get(code, {}).get(col)
+                        if known_entry is not None:
+                            known_entry.content_hash = hash_value
+                            known_entry.embedding_id = embedding_id
+                        else:
+                            self.db.add(EmbeddingState(target_table=target_name, code=code, column_name=col,
+                                                       content_hash=hash_value, embedding_id=embedding_id))
             self.db.commit()
-            print("All embeddings committed successfully.")
         except Exception as e:
-            print(f"Error committing embeddings: {e}")
+            print(f"Error generating/saving embeddings for rows {rows[0].code}..{rows[-1].code}: {e}")
+            self.db.rollback()
+            return
+
+        stats["embedded"] += len(pending)
+        stats["skipped"] += skipped
+        stats["changed_codes"] |= changed_codes
+        stats["deleted_codes"] |= deleted_codes
+
+    def delete_removed(self, target_table, seen_codes):
+        """
+        Delete embeddings (and their content hashes) of codes no longer present in the source table.
+        """
+        target_name = target_table.__tablename__
+        known_codes = {code for (code,) in self.db.query(EmbeddingState.code).filter(
+            EmbeddingState.target_table == target_name).distinct()}
+        known_codes |= {str(code) for (code,) in self.db.query(target_table.code).distinct()}
+        removed = sorted(known_codes - seen_codes)
+
+        try:
+            for start in range(0, len(removed), self.chunk_size):
+                batch = removed[start:start + self.chunk_size]
+                self.db.query(target_table).filter(target_table.code.in_(batch)).delete(synchronize_session=False)
+                self.db.query(EmbeddingState).filter(
+                    EmbeddingState.target_table == target_name,
+                    EmbeddingState.code.in_(batch),
+                ).delete(synchronize_session=False)
+            self.db.commit()
+        except SQLAlchemyError as e:
+            print(f"Error deleting embeddings of removed rows: {e}")
             self.db.rollback()
+            return set()
+        return set(removed)
 
     def process_columns_and_save(self, source_table, target_table, columns, filter_conditions=None):
         """
-        Process embeddings for specific columns of rows from the source table
-        and save them to the target table.
+        Embed the new or changed columns of rows from the source table into the target table,
+        one chunk of rows at a time, and drop embeddings of rows that were removed.
         """
-        rows = self.fetch_data(source_table, filter_conditions)
-        if not rows:
+        print(f"Processing embeddings for columns: {columns}")
+        start = time.perf_counter()
+        stats = {"rows": 0, "embedded": 0, "skipped": 0, "changed_codes": set(), "deleted_codes": set()}
+        seen_codes = set()
+        for rows in self.iter_chunks(source_table, filter_conditions):
+            stats["rows"] += len(rows)
+            seen_codes.update(str(row.code) for row in rows)
+            self.save_embeddings(rows, columns, target_table, stats)
+            print(f"Embedded {stats['embedded']} texts, skipped {stats['skipped']} unchanged rows of {stats['rows']} so far.")
+
+        if not stats["rows"]:
             print("No data to process.")
-            return
+        # A filtered run only sees part of the table, so it cannot tell which rows were removed
+        if not filter_conditions:
+            stats["deleted_codes"] |= self.delete_removed(target_table, seen_codes)
+        stats["deleted"] = len(stats["deleted_codes"])
 
-        print(f"Processing embeddings for columns: {columns}")
-        self.save_embeddings(rows, columns, target_table)
+        elapsed = time.perf_counter() - start
+        stats["seconds"] = round(elapsed, 3)
+        stats["texts_per_sec"] = round(stats["embedded"] / elapsed, 1) if elapsed > 0 else 0.0
+        print(f"Embedded {stats['embedded']} texts, skipped {stats['skipped']} unchanged rows and deleted "
+              f"{stats['deleted']} removed rows in {elapsed:.1f}s ({stats['texts_per_sec']} texts/sec).")
+        return stats
 
-def main_embedding_process(db: Session, source_table, target_table):
+def main_embedding_process(db: Session, source_table, target_table, columns=None):
     """
     Entry point to process embeddings.
     """
-    print("Initializing embedding model...")
-    embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+    embedding_model = get_embedding_model(EMBEDDING_MODEL_NAME)
     processor = EmbeddingProcessor(db, embedding_model)
 
     print("Starting embedding processing...")
-    processor.process_columns_and_save(
+    stats = processor.process_columns_and_save(
         source_table=source_table,
         target_table=target_table,
-        columns=["name", "description", "options", "usage"]
+        columns=columns or EMBEDDING_COLUMNS[source_table.__tablename__]
     )
     print("Embedding generation and saving complete.")
+    return stats
 
 def separate_emb_process(db: Session, source_table, target_table):
     """
     Entry point for processing specific columns.
     """
-    print("Initializing embedding model...")
-    embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+    embedding_model = get_embedding_model(EMBEDDING_MODEL_NAME)
     processor = EmbeddingProcessor(db, embedding_model)
 
     columns_to_embed = ["name", "description", "options"]
-    processor.process_columns_and_save(
+    return processor.process_columns_and_save(
         source_table=source_table,
         target_table=target_table,
         columns=columns_to_embed
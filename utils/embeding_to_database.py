@@ -7,14 +7,11 @@ import os
 import csv
 import logging, traceback
 from typing import Any, List, Optional
-from sentence_transformers import SentenceTransformer
 
 import json
 
 logger = logging.getLogger(__name__)
 
-embedder = SentenceTransformer("all-mpnet-base-v2")
-
 def save_to_database(pages_data_with_embeddings: list, db: Session):
     try:
         for page in pages_data_with_embeddings:
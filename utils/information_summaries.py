@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from models import Information, InformationSummaries
+from utils.chat_prompt_openai import summerize_page
+
+load_dotenv()
+
+# "stored" answers general questions with the summary made at upload time when it is up to date,
+# "live" always summarizes for the question
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "stored")
+SUMMARY_MODES = ("stored", "live")
+# Pages summarized at once by the background stage
+SUMMARY_PRECOMPUTE_CONCURRENCY = int(os.getenv("SUMMARY_PRECOMPUTE_CONCURRENCY", "4"))
+SUMMARY_COMMIT_SIZE = 50
+
+
+def page_hash(naslov, opis):
+    return hashlib.sha256(f"{naslov or ''}\0{opis or ''}".encode("utf-8")).hexdigest()
+
+
+def get_stored_summary(db: Session, information):
+    """
+    Stored summary of an information page ({"code", "naslov", "opis", ...}), None when there is
+    none or the page changed since it was made.
+    """
+    stored = db.get(InformationSummaries, int(information["code"]))
+    if stored is None or stored.content_hash != page_hash(information["naslov"], information["opis"]):
+        return None
+    return stored.summary
+
+
+async def precompute_summaries(db: Session, codes=None, force: bool = False):
+    """
+    Summarize the information pages (all, or the given codes) whose stored summary is missing or
+    was made from an older text, and drop summaries of pages that no longer exist.
+    """
+    start = time.perf_counter()
+    if codes is not None and db.query(InformationSummaries.code).first() is None:
+        print("No summaries stored yet, summarizing all information pages.")
+        codes = None
+    query = db.query(Information)
+    if codes is not None:
+        codes = [int(code) for code in codes]
+        if not codes:
+            return {"summarized": 0, "failed": 0, "skipped": 0}
+        query = query.filter(Information.code.in_(codes))
+    pages = query.order_by(Information.code).all()
+    stored = {row.code: row for row in db.query(InformationSummaries).filter(
+        InformationSummaries.code.in_([page.code for page in pages]))}
+
+    pending = []
+    for page in pages:
+        content_hash = page_hash(page.naslov, page.opis)
+        known = stored.get(page.code)
+        if page.opis and (force or known is None or known.content_hash != content_hash):
+            pending.append((page, content_hash))
+    print(f"Summarizing {len(pending)} of {len(pages)} information pages...")
+
+    semaphore = asyncio.Semaphore(SUMMARY_PRECOMPUTE_CONCURRENCY)
+
+    async def summarize(page):
+        async with semaphore:
+            try:
+                return await summerize_page(page.naslov, page.opis)
+            except Exception as e:
+                print(f"Summarizing information {page.code} failed: {e}")
+                return None
+
+    summarized = failed = 0
+    for batch_start in range(0, len(pending), SUMMARY_COMMIT_SIZE):
+        batch = pending[batch_start:batch_start + SUMMARY_COMMIT_SIZE]
+        summaries = await asyncio.gather(*(summarize(page) for page, _ in batch))
+        now = datetime.now(timezone.utc)
+        for (page, content_hash), summary in zip(batch, summaries):
+            if not summary:
+                failed += 1
+                continue
+            db.merge(InformationSummaries(code=page.code, summary=summary, content_hash=content_hash, created_at=now))
+            summarized += 1
+        db.commit()
+
+    # Summaries of deleted pages
+    existing = db.query(Information.code)
+    removed = db.query(InformationSummaries).filter(~InformationSummaries.code.in_(existing.scalar_subquery()))
+    if codes is not None:
+        removed = removed.filter(InformationSummaries.code.in_(codes))
+    removed.delete(synchronize_session=False)
+    db.commit()
+
+    print(f"Summarized {summarized} information pages ({failed} failed) in {time.perf_counter() - start:.1f}s.")
+    return {"summarized": summarized, "failed": failed, "skipped": len(pages) - len(pending)}
+
+
+async def precompute_summaries_task(codes):
+    """
+    precompute_summaries with its own session, for running after the upload request has finished.
+    """
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        await precompute_summaries(db, codes)
+    except Exception as e:
+        print(f"Precomputing summaries failed: {e}")
+    finally:
+        db.close()
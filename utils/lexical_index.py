@@ -0,0 +1,99 @@
+import re
+import math
+import unicodedata
+import numpy as np
+
+# Product fields in the index and how much a token occurrence in each of them counts
+FIELD_WEIGHTS = {"name": 2.0, "brand": 2.0, "options": 1.0, "description": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Constant of reciprocal rank fusion, damps the influence of the top ranks
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Lowercase word tokens without diacritics, so "Ležaj" matches "lezaj".
+    """
+    text = unicodedata.normalize("NFKD", str(text).casefold().replace("đ", "dj"))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_PATTERN.findall(text)
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the product fields. Each term keeps the documents it occurs in
+    together with their precomputed BM25 weight, so a search is a few numpy additions.
+    """
+    def __init__(self):
+        self.codes = []
+        self.positions = {}  # code -> document number
+        self.postings = {}  # term -> (document numbers, BM25 weights)
+
+    def build(self, records):
+        codes = []
+        term_frequencies = []
+        for record in records:
+            frequencies = {}
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(getattr(record, field, None) or ""):
+                    frequencies[token] = frequencies.get(token, 0.0) + weight
+            codes.append(record.code)
+            term_frequencies.append(frequencies)
+
+        lengths = np.array([sum(frequencies.values()) for frequencies in term_frequencies], dtype=np.float32)
+        average_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+
+        documents = {}
+        for number, frequencies in enumerate(term_frequencies):
+            for term, frequency in frequencies.items():
+                documents.setdefault(term, ([], []))
+                documents[term][0].append(number)
+                documents[term][1].append(frequency)
+
+        postings = {}
+        for term, (numbers, frequencies) in documents.items():
+            numbers = np.array(numbers, dtype=np.int32)
+            frequencies = np.array(frequencies, dtype=np.float32)
+            idf = math.log(1 + (len(codes) - len(numbers) + 0.5) / (len(numbers) + 0.5))
+            weights = idf * frequencies * (BM25_K1 + 1) / (frequencies + length_norm[numbers])
+            postings[term] = (numbers, weights.astype(np.float32))
+        self.codes, self.postings = codes, postings
+        self.positions = {code: number for number, code in enumerate(codes)}
+
+    def search(self, query: str, k: int, codes=None):
+        """
+        Up to k (code, score) pairs best matching the query, best first, only among the
+        given codes when codes are passed.
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms:
+            return []
+        scores = np.zeros(len(self.codes), dtype=np.float32)
+        for term in terms:
+            numbers, weights = self.postings[term]
+            scores[numbers] += weights
+        if codes is not None:
+            allowed = np.zeros(len(self.codes), dtype=bool)
+            allowed[[self.positions[code] for code in codes if code in self.positions]] = True
+            scores[~allowed] = 0
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.codes[number], float(scores[number])) for number in best]
+
+
+def reciprocal_rank_fusion(*rankings, k: int = RRF_K):
+    """
+    Merge ranked code lists into one, scoring each code by the sum of 1 / (k + rank).
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, code in enumerate(ranking, start=1):
+            scores[code] = scores.get(code, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
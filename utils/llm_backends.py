@@ -0,0 +1,94 @@
+import os
+from dotenv import load_dotenv
+
+from utils.llm_client import llm_client
+from utils.context_builder import record_prompt_tokens
+from utils.metrics import register_cache
+
+load_dotenv()
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# What the prompts in utils/chat_prompt_openai.py are used for; each can run on its own backend
+LLM_TASKS = ("classify", "keywords", "summarize", "answer")
+LLM_BACKENDS = ("openai", "ollama")
+# Backend of every task, unless LLM_BACKEND_<TASK> (e.g. LLM_BACKEND_CLASSIFY=ollama) says otherwise
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+TASK_BACKENDS = {task: os.getenv(f"LLM_BACKEND_{task.upper()}", LLM_BACKEND).lower() for task in LLM_TASKS}
+
+for task, name in TASK_BACKENDS.items():
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend {name} for {task}, expected one of {', '.join(LLM_BACKENDS)}.")
+
+
+class OpenAIBackend:
+    """
+    Chat completions from the OpenAI API through the pooled client of utils/llm_client.py.
+    """
+    name = "openai"
+
+    def __init__(self, client=llm_client, model: str = OPENAI_MODEL):
+        self.client = client
+        self.model = model
+
+    async def complete(self, messages, json_mode: bool = False):
+        kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+        completion = await self.client.complete(messages, model=self.model, **kwargs)
+        try:
+            return completion.choices[0].message.content
+        except (AttributeError, IndexError):
+            return None
+
+    def stream(self, messages):
+        return self.client.stream(messages, model=self.model)
+
+
+backends = {"openai": OpenAIBackend()}
+
+
+def get_backend(task: str):
+    name = TASK_BACKENDS.get(task, LLM_BACKEND)
+    if name not in backends:
+        # Only imported when some task runs on it
+        from utils.ollama_deepseek import OllamaBackend
+        backends[name] = OllamaBackend()
+        register_cache(name, backends[name])
+        print(f"Using Ollama model {backends[name].model} for {', '.join(t for t, n in TASK_BACKENDS.items() if n == name)}.")
+    return backends[name]
+
+
+async def complete_task(task: str, messages, json_mode: bool = False):
+    """
+    Text of the answer to the messages from the task's backend. When a local backend fails
+    (queue full, server down) the call falls back to OpenAI.
+    """
+    backend = get_backend(task)
+    record_prompt_tokens(task, messages)
+    try:
+        return await backend.complete(messages, json_mode=json_mode)
+    except Exception as e:
+        if backend.name == "openai":
+            raise
+        print(f"{backend.name} failed for {task} ({type(e).__name__}: {e}), falling back to OpenAI.")
+    return await backends["openai"].complete(messages, json_mode=json_mode)
+
+
+async def stream_task(task: str, messages):
+    """
+    The answer from the task's backend as it is generated. Falls back to OpenAI like
+    complete_task, as long as the local backend has not sent anything yet.
+    """
+    backend = get_backend(task)
+    record_prompt_tokens(task, messages)
+    started = False
+    try:
+        async for piece in backend.stream(messages):
+            started = True
+            yield piece
+        return
+    except Exception as e:
+        if backend.name == "openai" or started:
+            raise
+        print(f"{backend.name} failed for {task} ({type(e).__name__}: {e}), falling back to OpenAI.")
+    async for piece in backends["openai"].stream(messages):
+        yield piece
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import random
+import time
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, RateLimitError, InternalServerError
+from dotenv import load_dotenv
+
+from utils.metrics import get_histogram, STAGE_BUCKETS_MS
+
+load_dotenv()
+
+# Completions in flight at once per worker; the rest wait for a slot
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+# Limit of one attempt, including the wait for a concurrency slot
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))
+# Send a second, identical request when the first has not answered after this long (0 disables)
+LLM_HEDGE_AFTER_MS = float(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+
+# Errors worth another attempt: timeouts, dropped connections, rate limits and 5xx answers
+RETRYABLE_ERRORS = (asyncio.TimeoutError, APIConnectionError, RateLimitError, InternalServerError)
+
+
+class LLMClient:
+    """
+    Async OpenAI chat completions over a pooled HTTP client, with a bound on concurrent calls,
+    a timeout per attempt, retries with exponential backoff and optional hedged requests.
+    """
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_connections: int = LLM_MAX_CONNECTIONS,
+                 timeout: float = LLM_TIMEOUT_SECONDS, max_retries: int = LLM_MAX_RETRIES,
+                 backoff: float = LLM_BACKOFF_SECONDS, hedge_after_ms: float = LLM_HEDGE_AFTER_MS):
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after_ms / 1000
+        self.call_times = get_histogram("llm_call_ms", STAGE_BUCKETS_MS)
+        self.first_token_times = get_histogram("llm_first_token_ms", STAGE_BUCKETS_MS)
+        self.retries = 0
+        self.hedges = 0
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+
+    def _ensure_client(self):
+        # The HTTP pool and the semaphore belong to the event loop they were created on
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            self._client = AsyncOpenAI(http_client=httpx.AsyncClient(limits=limits, timeout=self.timeout), max_retries=0)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+
+    async def _request(self, **kwargs):
+        async with self._semaphore:
+            return await self._client.chat.completions.create(**kwargs)
+
+    async def _hedged_request(self, **kwargs):
+        """
+        The request, raced against a copy sent after hedge_after seconds; the first success wins.
+        """
+        first = asyncio.ensure_future(self._request(**kwargs))
+        if not self.hedge_after:
+            return await first
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_after)
+            if not done:
+                self.hedges += 1
+                pending.add(asyncio.ensure_future(self._request(**kwargs)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, messages, model: str, **kwargs):
+        """
+        Chat completion of the messages, retried with backoff on transient errors.
+        """
+        self._ensure_client()
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                return await asyncio.wait_for(self._hedged_request(model=model, messages=messages, **kwargs), self.timeout)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+                print(f"LLM call failed ({type(e).__name__}: {e}), retrying in {delay:.2f}s...")
+                await asyncio.sleep(delay)
+            finally:
+                self.call_times.observe((time.perf_counter() - start) * 1000)
+
+    async def stream(self, messages, model: str, **kwargs):
+        """
+        Content of a streamed chat completion, yielded piece by piece as it arrives. Transient
+        errors are retried until the first piece is out; after that they are raised. The timeout
+        applies to the wait for each piece.
+        """
+        self._ensure_client()
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            started = False
+            try:
+                async with self._semaphore:
+                    stream = await asyncio.wait_for(
+                        self._client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs),
+                        self.timeout)
+                    try:
+                        chunks = stream.__aiter__()
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                            except StopAsyncIteration:
+                                break
+                            content = chunk.choices[0].delta.content if chunk.choices else None
+                            if not content:
+                                continue
+                            if not started:
+                                started = True
+                                self.first_token_times.observe((time.perf_counter() - start) * 1000)
+                            yield content
+                    finally:
+                        await stream.close()
+                self.call_times.observe((time.perf_counter() - start) * 1000)
+                return
+            except RETRYABLE_ERRORS as e:
+                if started or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+                print(f"LLM stream failed ({type(e).__name__}: {e}), retrying in {delay:.2f}s...")
+                await asyncio.sleep(delay)
+
+
+llm_client = LLMClient()
@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import bisect
+import resource
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Metrics recorded while the process starts up (model loads, index loads, ...)
+startup_metrics = {}
+histograms = {}
+caches = {}  # name -> object with a stats() method
+_lock = threading.Lock()
+
+STAGE_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+RECENT_VALUES = 2048  # values kept per histogram for percentiles
+
+
+class Histogram:
+    """
+    Bucketed histogram of observed values (each bucket counts values up to its bound).
+    """
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)  # last slot counts values above the largest bucket
+            self.count = 0
+            self.total = 0.0
+            self.recent = deque(maxlen=RECENT_VALUES)
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            self.recent.append(value)
+
+    def percentile(self, q):
+        """
+        Percentile over the most recent observed values.
+        """
+        with self._lock:
+            values = sorted(self.recent)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {f"le_{bound}": count for bound, count in zip(self.buckets, self.counts)}
+            buckets["le_inf"] = self.counts[-1]
+            snapshot = {
+                "count": self.count,
+                "sum": round(self.total, 3),
+                "mean": round(self.total / self.count, 3) if self.count else 0.0,
+                "buckets": buckets,
+            }
+        for q in (50, 95, 99):
+            snapshot[f"p{q}"] = round(self.percentile(q), 3)
+        return snapshot
+
+
+def get_histogram(name: str, buckets):
+    """
+    Return the histogram registered under the name, creating it on first use.
+    """
+    with _lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = Histogram(buckets)
+            histograms[name] = histogram
+        return histogram
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Record the wall time in ms of a request stage (embedding, FAISS search, DB fetch, LLM call).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_histogram(f"stage.{stage}", STAGE_BUCKETS_MS).observe((time.perf_counter() - start) * 1000)
+
+
+def reset_histograms(prefix: str = ""):
+    """
+    Clear the values of the histograms whose name starts with the prefix.
+    """
+    with _lock:
+        selected = [histogram for name, histogram in histograms.items() if name.startswith(prefix)]
+    for histogram in selected:
+        histogram.reset()
+
+
+def resident_memory_mb():
+    """
+    Current resident memory of this process in MB.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # No /proc (macOS): fall back to peak RSS, reported in bytes on macOS and KB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            return peak / (1024 * 1024)
+        return peak / 1024
+
+
+def record_startup_metric(name: str, **values):
+    """
+    Store a startup metric (e.g. load time and memory of a model) under the given name.
+    """
+    with _lock:
+        startup_metrics[name] = values
+    print(f"Startup metric {name}: {values}")
+
+
+def register_cache(name: str, cache):
+    """
+    Include the cache's stats() (hits, misses, size, ...) in the metrics.
+    """
+    with _lock:
+        caches[name] = cache
+
+
+def get_metrics():
+    """
+    Snapshot of all collected metrics.
+    """
+    with _lock:
+        registered = dict(histograms)
+        startup = dict(startup_metrics)
+        registered_caches = dict(caches)
+    return {
+        "startup": startup,
+        "histograms": {name: histogram.snapshot() for name, histogram in registered.items()},
+        "caches": {name: cache.stats() for name, cache in registered_caches.items()},
+    }
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from utils.metrics import resident_memory_mb, record_startup_metric
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+# One SentenceTransformer per (model name, device) for the whole process
+_models = {}
+_lock = threading.Lock()
+_device = None
+
+
+def resolve_device():
+    """
+    The device every embedding model runs on: mps when available, otherwise cpu.
+    """
+    global _device
+    if _device is None:
+        try:
+            import torch
+            _device = "mps" if torch.backends.mps.is_available() else "cpu"
+        except ImportError:
+            _device = "cpu"
+        print(f"Using device: {_device}")
+    return _device
+
+
+def _normalize_model_name(model_name: str):
+    """
+    "all-mpnet-base-v2" and "sentence-transformers/all-mpnet-base-v2" are the same model.
+    """
+    if "/" not in model_name:
+        return f"sentence-transformers/{model_name}"
+    return model_name
+
+
+def get_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, device=None):
+    """
+    Return the shared embedding model, loading it on first use.
+    """
+    key = (_normalize_model_name(model_name), str(device or resolve_device()))
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Another thread may have loaded it while we were waiting for the lock
+        model = _models.get(key)
+        if model is None:
+            # Imported here, so code running on a registered model does not need the library
+            from sentence_transformers import SentenceTransformer
+
+            print(f"Loading embedding model {key[0]} on {key[1]}...")
+            rss_before = resident_memory_mb()
+            start = time.perf_counter()
+            model = SentenceTransformer(key[0], device=key[1])
+            load_seconds = time.perf_counter() - start
+            rss_after = resident_memory_mb()
+            record_startup_metric(
+                f"embedding_model:{key[0]}@{key[1]}",
+                load_seconds=round(load_seconds, 3),
+                rss_mb=round(rss_after, 1),
+                rss_delta_mb=round(rss_after - rss_before, 1),
+            )
+            _models[key] = model
+    return model
+
+
+def register_embedding_model(model, model_name: str = EMBEDDING_MODEL_NAME, device=None):
+    """
+    Use an already constructed model (e.g. a stand-in for benchmarks) for the given name and device.
+    """
+    with _lock:
+        _models[(_normalize_model_name(model_name), str(device or resolve_device()))] = model
+
+
+def loaded_models():
+    """
+    Keys of the models that are currently loaded.
+    """
+    return list(_models.keys())
@@ -0,0 +1,63 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How the scores of a product's vectors (one per column) are combined into one product score
+AGGREGATIONS = ("none", "max", "sum", "weighted")
+AGGREGATION = os.getenv("SEPARATE_AGGREGATION", "max")
+# Vectors fetched per requested product, so k distinct products survive deduplication
+OVERFETCH = int(os.getenv("SEPARATE_OVERFETCH", "6"))
+
+
+def parse_column_weights(spec: str):
+    """
+    Parse "name=1.0,description=0.5,options=0.8" into {column: weight}.
+    """
+    weights = {}
+    for option in filter(None, (part.strip() for part in spec.split(","))):
+        column, _, weight = option.partition("=")
+        weights[column.strip()] = float(weight)
+    return weights
+
+
+COLUMN_WEIGHTS = parse_column_weights(os.getenv("SEPARATE_COLUMN_WEIGHTS", "name=1.0,description=0.6,options=0.8"))
+
+
+def similarity(distance):
+    """
+    Cosine similarity of two normalized embeddings from their squared L2 distance.
+    """
+    return 1.0 - float(distance) / 2.0
+
+
+def aggregate_by_product(distances, ids, id_to_code, id_to_column, method: str = AGGREGATION, weights=None):
+    """
+    Combine the hits of one query into one score per product code.
+    Returns (code, score, best distance) tuples, best score first.
+    """
+    weights = COLUMN_WEIGHTS if weights is None else weights
+    hits = {}
+    for distance, id_ in zip(distances, ids):
+        code = id_to_code.get(int(id_))
+        if code is None:
+            continue  # -1 padding of filtered searches, or an id removed meanwhile
+        hits.setdefault(code, []).append((float(distance), id_to_column.get(int(id_))))
+
+    total_weight = sum(weights.values()) or 1.0
+    ranked = []
+    for code, product_hits in hits.items():
+        similarities = [(similarity(distance), column) for distance, column in product_hits]
+        if method == "sum":
+            score = sum(value for value, _ in similarities)
+        elif method == "weighted":
+            # Columns that did not match contribute nothing, so products matching on several columns win
+            best = {}
+            for value, column in similarities:
+                best[column] = max(value, best.get(column, value))
+            score = sum(weights.get(column, 1.0) * value for column, value in best.items()) / total_weight
+        else:
+            score = max(value for value, _ in similarities)
+        ranked.append((code, score, min(distance for distance, _ in product_hits)))
+    ranked.sort(key=lambda hit: hit[1], reverse=True)
+    return ranked
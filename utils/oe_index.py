@@ -0,0 +1,121 @@
+import re
+from bisect import bisect_left
+
+# Separators between the OE numbers of one product
+OE_SEPARATORS = re.compile(r"[,;|\n]+")
+# Normalized keys shorter than this are too ambiguous to match on
+MIN_KEY_LENGTH = 4
+# Prefix lookups are only tried for query tokens at least this long
+MIN_PREFIX_LENGTH = 5
+MAX_PREFIX_MATCHES = 20
+# A query answered from the index alone has at most this many words, and words without a digit
+# at most this many letters
+MAX_PART_NUMBER_TOKENS = 3
+MAX_LETTER_PREFIX = 3
+
+
+def normalize_oe_number(value):
+    """
+    "CL 667.251-1", "cl667251/1" and "CL6672511" are the same part number.
+    """
+    return re.sub(r"[^0-9A-Z]", "", str(value).upper())
+
+
+def split_oe_numbers(oe_numbers):
+    """
+    Normalized part numbers of a product's oe_numbers field.
+    """
+    if not oe_numbers:
+        return []
+    keys = (normalize_oe_number(part) for part in OE_SEPARATORS.split(str(oe_numbers)))
+    return [key for key in keys if len(key) >= MIN_KEY_LENGTH]
+
+
+def part_number_key(query: str):
+    """
+    Normalized key of a query that is nothing but a part number ("CL 667.251-1"), None for
+    anything else, e.g. "DUNLOP 3HB2700", where the brand makes it a product query.
+    """
+    tokens = [token for token in re.split(r"[\s,;]+", str(query)) if token]
+    if not tokens or len(tokens) > MAX_PART_NUMBER_TOKENS:
+        return None
+    # Every word is either a fragment with a digit or a short letter prefix ("CL", "LF")
+    if any(not any(char.isdigit() for char in token) and len(token) > MAX_LETTER_PREFIX for token in tokens):
+        return None
+    key = normalize_oe_number("".join(tokens))
+    if len(key) < MIN_KEY_LENGTH or not any(char.isdigit() for char in key):
+        return None
+    return key
+
+
+def query_candidates(query: str):
+    """
+    Normalized keys a query could be asking for: the whole query, each token and each pair of
+    adjacent tokens (customers split part numbers with random spaces). Only keys with a digit count.
+    """
+    tokens = [token for token in re.split(r"[\s,;]+", str(query)) if token]
+    candidates = [" ".join(tokens)] + tokens + [a + b for a, b in zip(tokens, tokens[1:])]
+    keys = []
+    for candidate in candidates:
+        key = normalize_oe_number(candidate)
+        if len(key) >= MIN_KEY_LENGTH and any(char.isdigit() for char in key) and key not in keys:
+            keys.append(key)
+    return keys
+
+
+class OENumberIndex:
+    """
+    Normalized OE number -> product codes, with exact and prefix lookup over the sorted keys.
+    """
+    def __init__(self):
+        self.codes_by_key = {}
+        self.keys = []
+
+    def build(self, records):
+        codes_by_key = {}
+        for record in records:
+            for key in split_oe_numbers(record.oe_numbers):
+                codes = codes_by_key.setdefault(key, [])
+                if record.code not in codes:
+                    codes.append(record.code)
+        self.codes_by_key = codes_by_key
+        self.keys = sorted(codes_by_key)
+
+    def find(self, key):
+        return self.codes_by_key.get(key, [])
+
+    def find_prefix(self, prefix, limit: int = MAX_PREFIX_MATCHES):
+        codes = []
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and self.keys[position].startswith(prefix) and len(codes) < limit:
+            codes.extend(code for code in self.codes_by_key[self.keys[position]] if code not in codes)
+            position += 1
+        return codes[:limit]
+
+    def lookup(self, query: str):
+        """
+        Product codes whose OE number is exactly the query, when the query is a part number
+        and nothing else. These answer the query without any search.
+        """
+        key = part_number_key(query)
+        return list(self.find(key)) if key else []
+
+    def candidates(self, query: str, limit: int = MAX_PREFIX_MATCHES):
+        """
+        Product codes with an OE number among the query's tokens or adjacent token pairs,
+        otherwise starting with its longest part-number-like token. These are only candidates
+        for the product search to rank, as a query can mention a number among other words.
+        """
+        keys = query_candidates(query)
+        codes = []
+        for key in keys:
+            codes.extend(code for code in self.find(key) if code not in codes)
+        if codes:
+            return codes[:limit]
+
+        for key in sorted(keys, key=len, reverse=True):
+            if len(key) >= MIN_PREFIX_LENGTH:
+                codes = self.find_prefix(key, limit)
+                if codes:
+                    return codes
+        return []
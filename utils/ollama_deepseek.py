@@ -1,32 +1,134 @@
+import asyncio
+import os
+import re
+import time
 import ollama
+from dotenv import load_dotenv
 
-MODEL = "deepseek-r1:8b"
-URL = "http://localhost:11434/api/generate"
-
-# def ask_question(query):
-        
-#     response = requests.post(
-#         "http://localhost:11434/api/generate",
-#         json={
-#             "model": "deepseek-r1:8b",
-#             "prompt": query,
-#             "stream": False
-#         }
-#     )
-#     return response.json()["response"]
-
-
-res = ollama.chat(
-    model=MODEL,
-    messages=[
-        {
-            "role": "user",
-            "content": "why is the ocean so salty"
-        }
-    ],
-    stream=True,
-)
-for chunk in res:
-    print(chunk["message"]["content"], end="", flush=True)
+from utils.metrics import get_histogram, STAGE_BUCKETS_MS
+
+load_dotenv()
+
+MODEL = os.getenv("OLLAMA_MODEL", "deepseek-r1:8b")
+URL = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# How long Ollama keeps the model loaded after a request, so calls don't pay for reloading it
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# A local model serves few requests at once; a bounded number more wait, the rest are refused
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+OLLAMA_QUEUE_SIZE = int(os.getenv("OLLAMA_QUEUE_SIZE", "16"))
+OLLAMA_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_TIMEOUT_SECONDS", "60"))
+
+THINKING = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+
+class OllamaBusyError(RuntimeError):
+    pass
+
+
+def strip_thinking(text: str):
+    """
+    The answer of a reasoning model like deepseek-r1 without its <think>...</think> part.
+    """
+    return THINKING.sub("", text or "").strip()
 
 
+class OllamaBackend:
+    """
+    Chat completions from a local Ollama model, streamed or not. Requests beyond
+    max_concurrency wait in a queue of queue_size; when that is full they fail at once
+    with OllamaBusyError instead of piling up.
+    """
+    name = "ollama"
+
+    def __init__(self, model: str = MODEL, host: str = URL, keep_alive: str = OLLAMA_KEEP_ALIVE,
+                 max_concurrency: int = OLLAMA_MAX_CONCURRENCY, queue_size: int = OLLAMA_QUEUE_SIZE,
+                 timeout: float = OLLAMA_TIMEOUT_SECONDS):
+        self.model = model
+        self.host = host
+        self.keep_alive = keep_alive
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.call_times = get_histogram("ollama_call_ms", STAGE_BUCKETS_MS)
+        self.first_token_times = get_histogram("ollama_first_token_ms", STAGE_BUCKETS_MS)
+        self.pending = 0  # requests running or queued
+        self.rejected = 0
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+
+    def _ensure_client(self):
+        # The HTTP client and the semaphore belong to the event loop they were created on
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._client = ollama.AsyncClient(host=self.host, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+
+    def _enqueue(self):
+        if self.pending >= self.max_concurrency + self.queue_size:
+            self.rejected += 1
+            raise OllamaBusyError(f"Ollama queue is full ({self.pending} requests pending).")
+        self.pending += 1
+
+    async def complete(self, messages, json_mode: bool = False):
+        """
+        Text of the model's answer to the messages.
+        """
+        self._ensure_client()
+        self._enqueue()
+        start = time.perf_counter()
+        try:
+            async with self._semaphore:
+                response = await self._client.chat(model=self.model, messages=messages, keep_alive=self.keep_alive,
+                                                   format="json" if json_mode else None)
+            return strip_thinking(response.message.content)
+        finally:
+            self.pending -= 1
+            self.call_times.observe((time.perf_counter() - start) * 1000)
+
+    async def stream(self, messages):
+        """
+        Text of the model's answer, yielded piece by piece as it is generated, without the
+        reasoning part.
+        """
+        self._ensure_client()
+        self._enqueue()
+        start = time.perf_counter()
+        started = False
+        thinking = False
+        try:
+            async with self._semaphore:
+                async for chunk in await self._client.chat(model=self.model, messages=messages,
+                                                           keep_alive=self.keep_alive, stream=True):
+                    content = chunk.message.content
+                    if not started and not thinking and content.lstrip().startswith("<think>"):
+                        thinking = True
+                    if thinking:
+                        if "</think>" not in content:
+                            continue
+                        thinking = False
+                        content = content.split("</think>", 1)[1].lstrip()
+                    if not content:
+                        continue
+                    if not started:
+                        started = True
+                        self.first_token_times.observe((time.perf_counter() - start) * 1000)
+                    yield content
+        finally:
+            self.pending -= 1
+            self.call_times.observe((time.perf_counter() - start) * 1000)
+
+    def stats(self):
+        """
+        Queue depth and refused requests, shown on /metrics.
+        """
+        running = min(self.pending, self.max_concurrency)
+        return {
+            "model": self.model,
+            "running": running,
+            "queued": self.pending - running,
+            "max_concurrency": self.max_concurrency,
+            "queue_size": self.queue_size,
+            "rejected": self.rejected,
+        }
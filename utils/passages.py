@@ -0,0 +1,138 @@
+import os
+import re
+import time
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import Information, InformationPassages
+from utils.context_builder import count_tokens
+
+load_dotenv()
+
+# Passages of an information page: about this many tokens, repeating the last sentences
+# of the previous passage up to the overlap
+PASSAGE_TOKENS = int(os.getenv("PASSAGE_TOKENS", "200"))
+PASSAGE_OVERLAP_TOKENS = int(os.getenv("PASSAGE_OVERLAP_TOKENS", "40"))
+PASSAGE_BATCH_SIZE = 200  # pages split and embedded per commit
+
+SENTENCES = re.compile(r"[^.!?\n]+(?:[.!?]+|\n|$)")
+WORDS = re.compile(r"\w+")
+
+
+def split_sentences(text: str):
+    return [sentence.strip() for sentence in SENTENCES.findall(text or "") if sentence.strip()]
+
+
+def split_long_sentence(sentence: str, max_tokens: int):
+    """
+    A sentence longer than max_tokens (long lists, text without punctuation) as consecutive
+    pieces of whole words, each within max_tokens.
+    """
+    pieces = []
+    words = []
+    tokens = 0
+    for word in sentence.split():
+        word_tokens = count_tokens(f" {word}")
+        if words and tokens + word_tokens > max_tokens:
+            pieces.append(" ".join(words))
+            words, tokens = [], 0
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def split_into_passages(text: str, max_tokens: int = PASSAGE_TOKENS, overlap_tokens: int = PASSAGE_OVERLAP_TOKENS):
+    """
+    Overlapping passages of whole sentences, each with the counts stored in the information_passages table.
+    Sentences longer than a passage are split at word boundaries.
+    """
+    sentences = []
+    for sentence in split_sentences(text):
+        sentence_tokens = count_tokens(sentence)
+        if sentence_tokens <= max_tokens:
+            sentences.append((sentence, sentence_tokens))
+        else:
+            sentences.extend((piece, count_tokens(piece)) for piece in split_long_sentence(sentence, max_tokens))
+    passages = []
+    current = []
+    tokens = 0
+    for sentence, sentence_tokens in sentences:
+        if current and tokens + sentence_tokens > max_tokens:
+            passages.append(current)
+            # Carry the last sentences over, so a passage boundary does not cut an answer in two
+            carried = []
+            carried_tokens = 0
+            for previous, previous_tokens in reversed(current):
+                if carried_tokens + previous_tokens > overlap_tokens:
+                    break
+                carried.insert(0, (previous, previous_tokens))
+                carried_tokens += previous_tokens
+            current, tokens = carried, carried_tokens
+        current.append((sentence, sentence_tokens))
+        tokens += sentence_tokens
+    if current:
+        passages.append(current)
+
+    result = []
+    for passage in passages:
+        text = " ".join(sentence for sentence, _ in passage)
+        result.append({
+            "text": text,
+            "char_count": len(text),
+            "word_count": len(WORDS.findall(text)),
+            "sentence_count": len(passage),
+            "token_count": sum(sentence_tokens for _, sentence_tokens in passage),
+        })
+    return result
+
+
+def update_passages(db: Session, changed_codes, deleted_codes):
+    """
+    Re-split and re-embed the passages of the changed information pages into the
+    information_passages table and drop those of deleted pages. All pages are
+    split when the table has no passages yet. Returns the embedding stats, with the affected
+    codes as changed_codes and deleted_codes.
+    """
+    # The embedding model is only loaded when passages are written
+    from utils.model_registry import get_embedding_model, EMBEDDING_MODEL_NAME
+    from utils.embedding_processor import EmbeddingProcessor
+
+    start = time.perf_counter()
+    if db.query(InformationPassages.id).first() is None:
+        changed_codes = {str(code) for (code,) in db.query(Information.code)}
+        print(f"No passages stored yet, splitting all {len(changed_codes)} information pages.")
+    changed_codes = sorted({int(code) for code in changed_codes})
+    deleted_codes = {int(code) for code in deleted_codes}
+    stats = {"embedded": 0, "changed_codes": set(), "deleted_codes": set()}
+    processor = EmbeddingProcessor(db, get_embedding_model(EMBEDDING_MODEL_NAME))
+
+    try:
+        if deleted_codes:
+            db.query(InformationPassages).filter(InformationPassages.information_code.in_(deleted_codes)).delete(synchronize_session=False)
+            stats["deleted_codes"] = {str(code) for code in deleted_codes}
+        for batch_start in range(0, len(changed_codes), PASSAGE_BATCH_SIZE):
+            batch = changed_codes[batch_start:batch_start + PASSAGE_BATCH_SIZE]
+            db.query(InformationPassages).filter(InformationPassages.information_code.in_(batch)).delete(synchronize_session=False)
+            pending = []
+            for page in db.query(Information).filter(Information.code.in_(batch)).order_by(Information.code):
+                for passage in split_into_passages(page.opis):
+                    # The title goes into the embedding only, the stored text is the passage itself
+                    pending.append((page.code, passage, f"{page.naslov or ''}\n{passage['text']}".strip()))
+            if pending:
+                embeddings = processor.generate_embeddings([text for _, _, text in pending])
+                for (code, passage, _), embedding in zip(pending, embeddings):
+                    db.add(InformationPassages(information_code=code, embedding=embedding.tobytes(), **passage))
+            db.commit()
+            stats["embedded"] += len(pending)
+            stats["changed_codes"] |= {str(code) for code in batch}
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"Error saving passages: {e}")
+        raise
+
+    print(f"Embedded {stats['embedded']} passages of {len(stats['changed_codes'])} information pages "
+          f"in {time.perf_counter() - start:.1f}s.")
+    return stats
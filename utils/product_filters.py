@@ -0,0 +1,107 @@
+import re
+from bisect import bisect_left, bisect_right
+
+FILTER_KEYS = ("brand", "category", "min_price", "max_price")
+CATEGORY_SEPARATORS = re.compile(r"[,;|>/]+")
+
+
+def parse_price(price):
+    """
+    Numeric value of a price string like "3422.22 RSD" or "3.422,22 RSD", None if there is none.
+    """
+    number = re.sub(r"[^0-9.,]", "", str(price or ""))
+    if not number:
+        return None
+    if "," in number and "." in number:
+        # The separator that comes last is the decimal one
+        thousands, decimal = (".", ",") if number.rfind(",") > number.rfind(".") else (",", ".")
+        number = number.replace(thousands, "").replace(decimal, ".")
+    elif "," in number or "." in number:
+        # A lone separator followed by three digits groups thousands ("5.000", "1,500")
+        separator = "," if "," in number else "."
+        whole, _, fraction = number.rpartition(separator)
+        if number.count(separator) > 1 or len(fraction) == 3:
+            number = number.replace(separator, "")
+        else:
+            number = f"{whole}.{fraction}"
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+
+def normalize_value(value):
+    return " ".join(str(value).split()).casefold()
+
+
+def split_categories(categories):
+    """
+    Normalized category names of a product, e.g. "Remenje > Klinasti" gives both levels.
+    """
+    if not categories:
+        return []
+    return [normalize_value(part) for part in CATEGORY_SEPARATORS.split(str(categories)) if part.strip()]
+
+
+def as_list(value):
+    return value if isinstance(value, (list, tuple, set)) else [value]
+
+
+class AttributeIndex:
+    """
+    Product codes per brand and per category, and codes ordered by price, so a filter
+    resolves to its set of codes without touching the database.
+    """
+    def __init__(self):
+        self.by_brand = {}
+        self.by_category = {}
+        self.prices = []  # sorted prices
+        self.price_codes = []  # codes in the order of prices
+
+    def build(self, records):
+        by_brand = {}
+        by_category = {}
+        priced = []
+        for record in records:
+            if record.brand:
+                by_brand.setdefault(normalize_value(record.brand), set()).add(record.code)
+            for category in split_categories(record.categories):
+                by_category.setdefault(category, set()).add(record.code)
+            price = parse_price(record.price)
+            if price is not None:
+                priced.append((price, record.code))
+        priced.sort()
+        self.by_brand, self.by_category = by_brand, by_category
+        self.prices = [price for price, _ in priced]
+        self.price_codes = [code for _, code in priced]
+
+    def select(self, filters):
+        """
+        Codes matching all the filters ({"brand", "category", "min_price", "max_price"}),
+        None when there are no filters. Raises ValueError for malformed filters.
+        """
+        if not filters:
+            return None
+        if not isinstance(filters, dict):
+            raise ValueError("Filters must be an object.")
+        unknown = set(filters) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown filters {', '.join(sorted(unknown))}, expected {', '.join(FILTER_KEYS)}.")
+
+        selected = []
+        if filters.get("brand"):
+            selected.append(set().union(*(self.by_brand.get(normalize_value(brand), set()) for brand in as_list(filters["brand"]))))
+        if filters.get("category"):
+            selected.append(set().union(*(self.by_category.get(normalize_value(category), set()) for category in as_list(filters["category"]))))
+        if filters.get("min_price") is not None or filters.get("max_price") is not None:
+            try:
+                low = float(filters["min_price"]) if filters.get("min_price") is not None else float("-inf")
+                high = float(filters["max_price"]) if filters.get("max_price") is not None else float("inf")
+            except (TypeError, ValueError):
+                raise ValueError("min_price and max_price must be numbers.")
+            selected.append(set(self.price_codes[bisect_left(self.prices, low):bisect_right(self.prices, high)]))
+
+        if not selected:
+            return None
+        selected.sort(key=len)
+        return selected[0].intersection(*selected[1:])
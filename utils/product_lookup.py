@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+from sqlalchemy.orm import Session
+
+from models import Products
+from utils.oe_index import OENumberIndex
+from utils.lexical_index import LexicalIndex
+from utils.product_filters import AttributeIndex
+
+# Touched after every ingestion, so the other workers know to rebuild their lookup
+CATALOG_VERSION_FILE = "catalog.version"
+# Products read per round trip while building the lookup
+FETCH_BATCH_SIZE = 5000
+
+
+def normalize_label(label):
+    """
+    Labels are matched case-insensitively and regardless of repeated whitespace.
+    """
+    return " ".join(str(label).split()).casefold()
+
+
+def product_record(product):
+    """
+    Plain copy of a product row, readable with the same attributes as the ORM object.
+    """
+    return SimpleNamespace(**{column.key: getattr(product, column.key) for column in Products.__table__.columns})
+
+
+class ProductLookup:
+    """
+    In-memory code -> product and normalized label -> products maps of the whole catalog,
+    plus the OE number, BM25 and attribute indexes, so exact keyword and part-number hits in
+    /ragchat, lexical product search and search filters need no database round trip.
+    """
+    def __init__(self, version_file: str = CATALOG_VERSION_FILE):
+        self.version_file = version_file
+        self.by_code = {}
+        self.by_label = {}
+        self.oe_numbers = OENumberIndex()
+        self.lexical = LexicalIndex()
+        self.attributes = AttributeIndex()
+        self.version_mtime = None  # mtime of the version file the maps were built after
+        self.lock = threading.Lock()
+
+    def _version_mtime(self):
+        try:
+            return os.stat(self.version_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def build(self, db: Session):
+        """
+        Read the catalog and swap in the new maps in one assignment each.
+        """
+        start = time.perf_counter()
+        version_mtime = self._version_mtime()
+        by_code = {}
+        by_label = {}
+        for product in db.query(Products).order_by(Products.code).yield_per(FETCH_BATCH_SIZE):
+            record = product_record(product)
+            by_code[str(record.code)] = record
+            if record.label:
+                by_label.setdefault(normalize_label(record.label), []).append(record)
+        oe_numbers = OENumberIndex()
+        oe_numbers.build(by_code.values())
+        lexical = LexicalIndex()
+        lexical.build(by_code.values())
+        attributes = AttributeIndex()
+        attributes.build(by_code.values())
+        self.by_code, self.by_label, self.oe_numbers, self.lexical, self.attributes = (
+            by_code, by_label, oe_numbers, lexical, attributes)
+        self.version_mtime = version_mtime
+        print(f"Built product lookup with {len(by_code)} codes, {len(by_label)} labels, {len(oe_numbers.keys)} OE numbers "
+              f"and {len(lexical.postings)} terms "
+              f"in {time.perf_counter() - start:.2f}s.")
+
+    def refresh(self, db: Session):
+        """
+        Rebuild after an ingestion and tell the other workers to do the same.
+        """
+        with self.lock:
+            with open(self.version_file, "a"):
+                os.utime(self.version_file)
+            self.build(db)
+
+    def refresh_if_stale(self, db: Session):
+        """
+        Rebuild when another worker has ingested products since the maps were built.
+        """
+        mtime = self._version_mtime()
+        if mtime == self.version_mtime:
+            return
+        with self.lock:
+            if mtime == self.version_mtime:
+                return
+            self.build(db)
+
+    def find_code(self, code):
+        product = self.by_code.get(str(code).strip())
+        return [product] if product is not None else []
+
+    def find_label(self, label):
+        return self.by_label.get(normalize_label(label), [])
+
+    def find_oe_numbers(self, query: str):
+        by_code = self.by_code
+        return [by_code[code] for code in self.oe_numbers.lookup(query) if code in by_code]
+
+    def find_oe_candidates(self, query: str, codes=None):
+        """
+        Codes of the products whose OE numbers the query mentions, optionally only among the given codes.
+        """
+        return [code for code in self.oe_numbers.candidates(query)
+                if code in self.by_code and (codes is None or code in codes)]
+
+
+product_lookup = ProductLookup()
+
+
+def load_product_lookup(db: Session):
+    """
+    Build the product lookup during startup.
+    """
+    try:
+        product_lookup.build(db)
+    except Exception as e:
+        print(f"Error building product lookup: {e}")
+        raise RuntimeError("Failed to build product lookup.")
@@ -0,0 +1,41 @@
+import json
+from fastapi.responses import StreamingResponse
+
+
+def sse_event(event: str, data):
+    """
+    One Server-Sent Events message with the data as JSON.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=list)}\n\n"
+
+
+async def stream_text(pieces, event: str = "token"):
+    """
+    SSE messages for the text pieces of a streamed completion, followed by a "done" message
+    with the whole text. A failure midway ends the stream with an "error" message, since the
+    status code has already been sent.
+    """
+    text = []
+    try:
+        async for piece in pieces:
+            text.append(piece)
+            yield sse_event(event, {"text": piece})
+    except Exception as e:
+        print(f"Streaming failed: {e}")
+        yield sse_event("error", {"detail": f"An error occurred: {str(e)}"})
+        return
+    yield sse_event("done", {"text": "".join(text)})
+
+
+async def text_pieces(*pieces):
+    """
+    Text that is already complete, as the iterator stream_text expects.
+    """
+    for piece in pieces:
+        yield piece
+
+
+def sse_response(events):
+    # Proxies must pass the messages through as they come instead of buffering the response
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})